@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database.migrations import apply_pragmas, migrate
+
+# Times the DatabaseManager read queries on a schema-version-1 database
+# (no indexes), then applies only the index migration (version 2) and times
+# them again. Later migrations change the schema the queries run against,
+# so they are left out of the comparison:
+#   python -m benchmarks.bench_indexes --entries 1000000
+
+QUERIES = {
+    "get_entries (first 50)": """
+        SELECT e.question, e.response_a, e.response_b, e.preferred, e.created_at
+        FROM entries e
+        JOIN datasets d ON e.dataset_id = d.id
+        WHERE d.name = ?
+        ORDER BY e.created_at DESC
+        LIMIT 50
+    """,
+    "get_entries (all)": """
+        SELECT e.question, e.response_a, e.response_b, e.preferred, e.created_at
+        FROM entries e
+        JOIN datasets d ON e.dataset_id = d.id
+        WHERE d.name = ?
+        ORDER BY e.created_at DESC
+    """,
+    "get_dataset_stats": """
+        SELECT
+            COUNT(*) as total_entries,
+            COUNT(DISTINCT question) as unique_questions,
+            MIN(e.created_at) as first_entry,
+            MAX(e.created_at) as last_entry
+        FROM entries e
+        JOIN datasets d ON e.dataset_id = d.id
+        WHERE d.name = ?
+    """,
+}
+
+# The migration that adds the read-path indexes
+INDEX_VERSION = 2
+
+WORDS = "the a model data prompt answer question response better worse train set value token".split()
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def build_database(path, entries, datasets, seed=0, batch_size=50000):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    apply_pragmas(conn)
+    migrate(conn, target=1)
+
+    start = datetime(2024, 1, 1)
+    conn.executemany(
+        "INSERT INTO datasets (name, created_at) VALUES (?, ?)",
+        [(f"dataset_{i}", start) for i in range(datasets)]
+    )
+    questions = [random_text(rng, 12) for _ in range(max(1, entries // 4))]
+
+    inserted = 0
+    while inserted < entries:
+        n = min(batch_size, entries - inserted)
+        conn.executemany(
+            """
+            INSERT INTO entries
+            (dataset_id, question, response_a, response_b, preferred, status, created_at)
+            VALUES (?, ?, ?, ?, 'A', 'active', ?)
+            """,
+            [
+                (
+                    rng.randint(1, datasets),
+                    rng.choice(questions),
+                    random_text(rng, 40),
+                    random_text(rng, 25),
+                    start + timedelta(seconds=inserted + i)
+                )
+                for i in range(n)
+            ]
+        )
+        conn.commit()
+        inserted += n
+    return conn
+
+def time_queries(conn, dataset_name, repeat):
+    results = {}
+    for name, sql in QUERIES.items():
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, (dataset_name,)).fetchall()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark read queries before and after the index migration")
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--datasets", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", help="Database path (default: a temp file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    started = time.perf_counter()
+    conn = build_database(path, args.entries, args.datasets)
+    print(f"Built {args.entries} entries in {args.datasets} datasets in {time.perf_counter() - started:.1f}s ({path})")
+
+    before = time_queries(conn, "dataset_0", args.repeat)
+
+    started = time.perf_counter()
+    migrate(conn, target=INDEX_VERSION)
+    print(f"Migrated to schema version {INDEX_VERSION} in {time.perf_counter() - started:.1f}s")
+
+    after = time_queries(conn, "dataset_0", args.repeat)
+
+    print(f"{'query':<26}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in QUERIES:
+        print(
+            f"{name:<26}{before[name] * 1000:>14.1f}{after[name] * 1000:>14.1f}"
+            f"{before[name] / after[name]:>9.1f}x"
+        )
+    conn.close()
+
+if __name__ == "__main__":
+    main()
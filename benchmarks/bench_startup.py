@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import build_database
+from database.db_manager import DatabaseManager
+
+# Cold start and per-rerun cost of the UI and the headless entry points:
+#   python -m benchmarks.bench_startup --output startup.json
+# Import times are measured in fresh interpreters, along with which heavy
+# dependencies each import pulled in. Rerun allocations are traced over
+# warm Streamlit reruns of v2.py against a synthetic database, and the
+# DataFrame reads are compared with their row-based counterparts.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_MODULES = ("v2", "database.db_manager", "services.worker", "services.batch")
+HEAVY_MODULES = ("pandas", "numpy", "openai", "httpx", "pyarrow")
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def cold_import(module, repeat):
+    samples = []
+    loaded = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return {
+        "module": module,
+        "best": round(min(samples), 4),
+        "median": round(statistics.median(samples), 4),
+        "loaded": loaded,
+    }
+
+def traced(fn, repeat=3):
+    # (best seconds, peak traced bytes) of fn()
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def read_allocations(db):
+    # The same reads as DataFrames and as rows
+    dataset = "dataset_0"
+    reads = {
+        "dataset names": (
+            lambda: db.get_datasets()["name"].tolist(),
+            db.get_dataset_names,
+        ),
+        "entries": (
+            lambda: db.get_entries(dataset),
+            lambda: list(db.iter_entries(dataset)),
+        ),
+        "entries page": (
+            lambda: db.get_entries_page(dataset, truncate=200),
+            lambda: db.get_entries_page(dataset, truncate=200, as_rows=True),
+        ),
+        "quick responses": (
+            db.get_quick_responses,
+            lambda: list(db.iter_quick_responses()),
+        ),
+    }
+    results = []
+    for name, (frame_read, row_read) in reads.items():
+        frame_seconds, frame_peak = traced(frame_read)
+        row_seconds, row_peak = traced(row_read)
+        results.append({
+            "read": name,
+            "frame_seconds": round(frame_seconds, 6),
+            "frame_peak_bytes": frame_peak,
+            "rows_seconds": round(row_seconds, 6),
+            "rows_peak_bytes": row_peak,
+        })
+    return results
+
+def rerun_allocations(entries, reruns):
+    # Peak and net traced memory of warm reruns, i.e. what every widget
+    # interaction costs once the process is up
+    from streamlit.testing.v1 import AppTest
+
+    workdir = tempfile.mkdtemp(prefix="dpo_startup_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        build_database("dpo_data.db", entries, datasets=3, quick_responses=500)
+        at = AppTest.from_file(os.path.join(REPO_DIR, "v2.py"), default_timeout=120)
+        at.session_state.current_dataset = "dataset_0"
+        at.run()
+        peaks = []
+        nets = []
+        for _ in range(reruns):
+            tracemalloc.start()
+            at.run()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peaks.append(peak)
+            nets.append(current)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        db = DatabaseManager("dpo_data.db")
+        db.get_datasets()  # pandas is imported once, outside the measurements
+        reads = read_allocations(db)
+    finally:
+        os.chdir(cwd)
+    return {
+        "entries": entries,
+        "peak_bytes": int(statistics.median(peaks)),
+        "retained_bytes": int(statistics.median(nets)),
+    }, reads
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start and per-rerun allocations")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    imports = []
+    for module in ENTRY_MODULES:
+        row = cold_import(module, args.repeat)
+        imports.append(row)
+        print(f"import {module:<24}{row['best'] * 1000:>9.1f} ms   loads: {', '.join(row['loaded']) or '-'}")
+
+    rerun, reads = rerun_allocations(args.entries, args.reruns)
+    print(
+        f"v2 rerun ({rerun['entries']} entries)     peak {rerun['peak_bytes'] / 1e6:.2f} MB, "
+        f"retained {rerun['retained_bytes'] / 1e6:.2f} MB"
+    )
+    for row in reads:
+        print(
+            f"{row['read']:<32}DataFrame {row['frame_seconds'] * 1000:>8.1f} ms {row['frame_peak_bytes'] / 1e6:>7.2f} MB"
+            f"   rows {row['rows_seconds'] * 1000:>8.1f} ms {row['rows_peak_bytes'] / 1e6:>7.2f} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"imports": imports, "rerun": rerun, "reads": reads}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_suite import summary
+from benchmarks.synthetic import SyntheticData, build_database
+
+# Load test for the HTTP API:
+#   python -m benchmarks.load_api --entries 50000 --clients 32 --duration 20
+# Without --url the service is started in-process on a free port against a
+# synthetic database. Concurrent clients mix page, stats, search and insert
+# requests; afterwards one full NDJSON stream of the dataset is timed.
+
+DATASET = "dataset_0"
+SEARCH_TERMS = ("model", "reward", "preference", "token", "summary")
+READ_MIX = (("page", 5), ("stats", 2), ("search", 2))
+
+def start_server(db_name, threads):
+    # Runs uvicorn on a background thread; returns (base url, stop)
+    try:
+        import uvicorn
+    except ImportError:
+        raise ImportError("The load test requires uvicorn (pip install uvicorn)")
+    from services.api import create_app
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(create_app(db_name, threads), log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("API server failed to start")
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", stop
+
+async def client_loop(client, deadline, write_ratio, rng, data, samples, errors):
+    kinds = [kind for kind, weight in READ_MIX for _ in range(weight)]
+    cursor = None
+    while time.perf_counter() < deadline:
+        kind = "insert" if rng.random() < write_ratio else rng.choice(kinds)
+        if kind == "page":
+            # Walk a few pages deep, then start over from the newest
+            params = {"limit": 50, "truncate": 200}
+            if cursor:
+                params["cursor"] = cursor
+            request = client.get(f"/datasets/{DATASET}/entries", params=params)
+        elif kind == "stats":
+            request = client.get(f"/datasets/{DATASET}/stats")
+        elif kind == "search":
+            request = client.get(f"/datasets/{DATASET}/search", params={"q": rng.choice(SEARCH_TERMS), "limit": 20})
+        else:
+            question, chosen, rejected = next(data)
+            request = client.post(
+                f"/datasets/{DATASET}/entries",
+                json={"prompt": question, "chosen": chosen, "rejected": rejected}
+            )
+
+        started = time.perf_counter()
+        try:
+            response = await request
+        except Exception:
+            errors[kind] = errors.get(kind, 0) + 1
+            continue
+        samples.setdefault(kind, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors[kind] = errors.get(kind, 0) + 1
+        elif kind == "page":
+            cursor = response.json()["next_cursor"] if rng.random() < 0.8 else None
+
+async def run_load(url, clients, duration, write_ratio, seed):
+    import httpx
+
+    samples = {}
+    errors = {}
+    data = SyntheticData(seed).pairs(10 ** 9)
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            client_loop(client, deadline, write_ratio, random.Random(seed + i), data, samples, errors)
+            for i in range(clients)
+        ))
+        elapsed = time.perf_counter() - started
+    return samples, errors, elapsed
+
+async def measure_stream(url):
+    # (rows, bytes, seconds) of one full NDJSON read
+    import httpx
+
+    rows = 0
+    size = 0
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        started = time.perf_counter()
+        async with client.stream("GET", f"/datasets/{DATASET}/entries.ndjson") as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                rows += chunk.count(b"\n")
+                size += len(chunk)
+        return rows, size, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the HTTP API")
+    parser.add_argument("--url", help="Test a running service instead of starting one")
+    parser.add_argument("--entries", type=int, default=50000, help="Synthetic entries when starting the service")
+    parser.add_argument("--threads", type=int, default=4, help="Database threads of the started service")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of mixed load")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Fraction of requests that insert an entry")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    stop = None
+    url = args.url
+    if url is None:
+        workdir = tempfile.mkdtemp(prefix="dpo_api_")
+        db_name = os.path.join(workdir, "api.db")
+        build_database(db_name, args.entries, datasets=1, seed=args.seed).close()
+        url, stop = start_server(db_name, args.threads)
+
+    try:
+        samples, errors, elapsed = asyncio.run(
+            run_load(url, args.clients, args.duration, args.write_ratio, args.seed)
+        )
+        rows, size, seconds = asyncio.run(measure_stream(url))
+    finally:
+        if stop is not None:
+            stop()
+
+    total = sum(len(values) for values in samples.values())
+    endpoints = []
+    print(f"{total} requests from {args.clients} clients in {elapsed:.1f} s: {total / elapsed:.0f} req/s")
+    for kind in sorted(samples):
+        stats = summary(samples[kind])
+        endpoints.append({"endpoint": kind, "requests": len(samples[kind]), "errors": errors.get(kind, 0), **stats})
+        print(
+            f"{kind:<8}{len(samples[kind]):>8} requests {errors.get(kind, 0):>5} errors"
+            f"   p50 {stats['p50'] * 1000:>8.1f} ms   p95 {stats['p95'] * 1000:>8.1f} ms"
+        )
+    stream = {"rows": rows, "bytes": size, "seconds": round(seconds, 4)}
+    print(f"ndjson  {rows} rows, {size / 1e6:.1f} MB in {seconds:.2f} s: {rows / seconds:.0f} rows/s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "clients": args.clients,
+                "duration": round(elapsed, 3),
+                "requests_per_second": round(total / elapsed, 1),
+                "endpoints": endpoints,
+                "stream": stream,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
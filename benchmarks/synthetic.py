@@ -0,0 +1,110 @@
+import json
+import math
+import random
+from datetime import datetime, timedelta
+
+from database.db_manager import DatabaseManager
+from database.stats import rebuild_stats
+from database.texts import insert_entry_rows
+
+# Synthetic DPO data with realistic text lengths. Character counts are
+# log-normal (median, sigma) per field, roughly matching chat datasets: short
+# questions, long chosen answers and shorter, refusal-like rejected answers.
+FIELD_LENGTHS = {
+    "question": (120, 0.7),
+    "chosen": (900, 0.6),
+    "rejected": (350, 0.7),
+}
+MAX_LENGTH = 8000
+
+# Generating text is the slow part of building millions of rows, so each
+# field draws from a pool of pre-built texts; questions get a serial number
+# so that roughly DUPLICATE_RATE of them repeat
+POOL_SIZE = 5000
+DUPLICATE_RATE = 0.1
+
+WORDS = (
+    "the a of to and in is for that with on as it be by this are from or "
+    "model data prompt answer question response training preference reward "
+    "policy language example explain describe compare summary detail reason "
+    "because however therefore system user assistant value token sample"
+).split()
+
+def random_text(rng, field):
+    median, sigma = FIELD_LENGTHS[field]
+    target = min(MAX_LENGTH, max(1, int(rng.lognormvariate(math.log(median), sigma))))
+    words = []
+    length = 0
+    while length < target:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:target]
+
+class SyntheticData:
+    def __init__(self, seed=0, pool_size=POOL_SIZE):
+        self.rng = random.Random(seed)
+        self.pools = {
+            field: [random_text(self.rng, field) for _ in range(pool_size)]
+            for field in FIELD_LENGTHS
+        }
+
+    def text(self, field):
+        return self.rng.choice(self.pools[field])
+
+    def pairs(self, count, start=0):
+        # Yields (question, chosen, rejected)
+        unique = max(1, int(count * (1 - DUPLICATE_RATE)))
+        for i in range(start, start + count):
+            serial = i if i - start < unique else self.rng.randrange(start, start + unique)
+            yield f"{self.text('question')} ({serial})", self.text("chosen"), self.text("rejected")
+
+def build_database(path, entries, datasets=1, seed=0, quick_responses=2000, batch_size=50000):
+    # Creates a fully migrated database holding `entries` rows split evenly
+    # over `datasets` datasets. Rows are inserted in bulk rather than through
+    # save_entry, then the materialized stats are rebuilt; the near-duplicate
+    # index is left empty. Returns the DatabaseManager.
+    db = DatabaseManager(path)
+    conn = db.conn
+    data = SyntheticData(seed)
+    start = datetime(2024, 1, 1)
+
+    for i in range(datasets):
+        db.create_dataset(f"dataset_{i}")
+
+    inserted = 0
+    pairs = data.pairs(entries)
+    while inserted < entries:
+        n = min(batch_size, entries - inserted)
+        insert_entry_rows(
+            conn,
+            [
+                ((inserted + i) % datasets + 1, *next(pairs), "A", "active", start + timedelta(seconds=inserted + i))
+                for i in range(n)
+            ]
+        )
+        conn.commit()
+        inserted += n
+
+    conn.executemany(
+        "INSERT INTO quick_responses (text, created_at) VALUES (?, ?)",
+        [(data.text("rejected"), start + timedelta(seconds=i)) for i in range(quick_responses)]
+    )
+    rebuild_stats(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    return db
+
+def write_jsonl(path, rows, seed=0, prompt_fraction=0.0):
+    # An import file in the chosen/rejected layout; prompt_fraction of the
+    # rows carry only a question and import as pending prompts
+    data = SyntheticData(seed)
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for question, chosen, rejected in data.pairs(rows):
+            if rng.random() < prompt_fraction:
+                record = {"prompt": question}
+            else:
+                record = {"prompt": question, "chosen": chosen, "rejected": rejected}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return path
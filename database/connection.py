@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+
+from database.migrations import apply_pragmas, migrate
+from database.writer import WriteQueue
+
+# sqlite3 keeps an LRU of prepared statements per connection; reusing
+# connections across reruns is what lets those statements be reused
+STATEMENT_CACHE_SIZE = 256
+MAX_IDLE_CONNECTIONS = 8
+BUSY_TIMEOUT = 30
+
+class ConnectionManager:
+    # Hands each thread its own connection. Streamlit runs every rerun on a
+    # fresh script thread, so connections owned by finished threads are
+    # reclaimed into an idle pool instead of being reopened.
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._owners = {}
+        self._idle = []
+        self._migrated = False
+        self._writer = None
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        with self._lock:
+            self._reclaim_finished()
+            conn = self._idle.pop() if self._idle else self._connect()
+            self._owners[conn] = threading.current_thread()
+        self._local.conn = conn
+        return conn
+
+    def release(self):
+        # Returns the calling thread's connection to the idle pool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._owners.pop(conn, None)
+            self._park(conn)
+
+    def writer(self):
+        # The process-wide writer thread for this database, started lazily;
+        # it takes a pooled connection like any other thread and keeps it
+        with self._lock:
+            if self._writer is None:
+                self._writer = WriteQueue(self.connection, self.release)
+            return self._writer
+
+    def close_all(self):
+        # Queued writes are committed before the connections are closed
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+        with self._lock:
+            for conn in list(self._owners) + self._idle:
+                conn.close()
+            self._owners.clear()
+            self._idle.clear()
+        self._local = threading.local()
+
+    def _connect(self):
+        # Connections move between threads, but only ever to a thread that
+        # owns them exclusively, so the same-thread check is not needed
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=BUSY_TIMEOUT,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        apply_pragmas(conn)
+        if not self._migrated:
+            migrate(conn)
+            self._migrated = True
+        return conn
+
+    def _reclaim_finished(self):
+        for conn, thread in list(self._owners.items()):
+            if not thread.is_alive():
+                del self._owners[conn]
+                self._park(conn)
+
+    def _park(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if len(self._idle) < MAX_IDLE_CONNECTIONS:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_name='dpo_data.db'):
+    # One manager per database file per process, so the schema is migrated once.
+    # Every thread opens its own connection, and each connection to
+    # ":memory:" or "" would be a separate, empty database.
+    if db_name in (":memory:", ""):
+        raise ValueError("In-memory and temporary databases are not supported; use a database file")
+    key = os.path.abspath(db_name)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(db_name)
+        return manager
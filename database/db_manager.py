@@ -1,162 +1,587 @@
+import os
 import sqlite3
+from concurrent.futures import Future
 from datetime import datetime
-import pandas as pd
+from database.connection import get_connection_manager
+from database.dedup import DEFAULT_THRESHOLD, duplicate_clusters, find_similar, index_entries, unindexed_entries
+from database.export_history import confirm_export, current_watermark, export_history, last_watermark, record_export
+from database.exporter import DEFAULT_BATCH_SIZE, TRAINING_EXPORT_COLUMNS, export_to_tempfile, iter_delta_batches, iter_entry_batches, write_to_tempfile
+from database.importer import DEFAULT_CHUNK_SIZE, detect_format, iter_chunks, normalize_record
+from database import jobs, metrics
+from database.quick_responses import DEFAULT_PAGE_SIZE as QUICK_RESPONSE_PAGE_SIZE, QuickResponseStore
+from database.rows import Dataset, Entry, QuickResponse, SearchHit, iter_rows, to_frame
+from database.shards import export_shards
+from database.stats import read_histograms, read_stats, rebuild_stats, record_entries
+from database.texts import delete_unused_texts, insert_entry_rows
+
+DEFAULT_PAGE_SIZE = 50
+PAGE_COLUMNS = ("question", "response_a", "response_b", "preferred", "status", "created_at")
+# Columns get_entries_page can select besides the defaults
+EXTRA_PAGE_COLUMNS = ("id", "dataset_id")
+
+SEARCH_COLUMNS = list(SearchHit.__slots__)
+ENTRY_FRAME_COLUMNS = ["question", "response_a", "response_b", "preferred", "created_at"]
+LATENCY_COLUMNS = ["model", "calls", "errors", "p50", "p95", "p99", "mean_ttft"]
+
+def fts_query(text):
+    # Quotes every word so user input can't produce an FTS5 syntax error
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
 
 class DatabaseManager:
-    def __init__(self, db_name='dpo_data.db'):
+    # Safe to share between threads (e.g. through st.cache_resource): every
+    # thread transparently gets its own pooled connection.
+    # Reads come in two shapes: iter_*/get_dataset_names return compact rows
+    # from database.rows, while the get_* methods that return DataFrames
+    # import pandas on first use.
+    # Every write goes through submit_write. With single_writer=True it runs
+    # on the database's shared writer thread and is group-committed, instead
+    # of each caller taking the write lock itself.
+    def __init__(self, db_name='dpo_data.db', single_writer=False):
         self.db_name = db_name
-        self.conn = None
+        self.connections = get_connection_manager(db_name)
+        self.writer = self.connections.writer() if single_writer else None
+        self.quick_responses = QuickResponseStore(self)
         self.init_db()
 
+    @property
+    def conn(self):
+        return self.connections.connection()
+
     def init_db(self):
-        self.conn = sqlite3.connect(self.db_name)
-        c = self.conn.cursor()
-        
-        c.executescript('''
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY,
-                key TEXT UNIQUE,
-                value TEXT,
-                updated_at TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS datasets (
-                id INTEGER PRIMARY KEY,
-                name TEXT UNIQUE,
-                created_at TIMESTAMP
-            );
-            
-            CREATE TABLE IF NOT EXISTS entries (
-                id INTEGER PRIMARY KEY,
-                dataset_id INTEGER,
-                question TEXT,
-                response_a TEXT,
-                response_b TEXT,
-                preferred TEXT,
-                status TEXT,
-                created_at TIMESTAMP,
-                FOREIGN KEY (dataset_id) REFERENCES datasets(id)
-            );
-            
-            CREATE TABLE IF NOT EXISTS quick_responses (
-                id INTEGER PRIMARY KEY,
-                text TEXT,
-                created_at TIMESTAMP
-            );
-        ''')
-        self.conn.commit()
+        # Opening the first connection in the process runs the migrations
+        self.connections.connection()
 
     def save_api_key(self, api_key):
-        c = self.conn.cursor()
-        c.execute(
+        self.save_setting('openai_api_key', api_key)
+
+    def get_api_key(self):
+        return self.get_setting('openai_api_key')
+
+    def submit_write(self, op):
+        # Runs op, a callable that writes through self.conn without
+        # committing, in a transaction of its own; returns a Future. With a
+        # writer thread the op is queued and may share a commit with others.
+        # Either way the write lock is taken before op reads anything.
+        if self.writer is not None:
+            return self.writer.submit(op)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        conn = self.conn
+        try:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            result = op()
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        return future
+
+    def write(self, op):
+        # submit_write, waiting for the commit; re-raises op's exception
+        return self.submit_write(op).result()
+
+    def save_setting(self, key, value):
+        self.write(lambda: self.conn.execute(
             """
             INSERT OR REPLACE INTO settings (key, value, updated_at)
-            VALUES ('openai_api_key', ?, ?)
+            VALUES (?, ?, ?)
             """,
-            (api_key, datetime.now())
-        )
-        self.conn.commit()
+            (key, value, datetime.now())
+        ))
 
-    def get_api_key(self):
+    def get_setting(self, key, default=None):
         c = self.conn.cursor()
-        c.execute("SELECT value FROM settings WHERE key = 'openai_api_key'")
+        c.execute("SELECT value FROM settings WHERE key = ?", (key,))
         result = c.fetchone()
-        return result[0] if result else None
+        return result[0] if result else default
 
     def create_dataset(self, name):
         try:
-            c = self.conn.cursor()
-            c.execute(
+            self.write(lambda: self.conn.execute(
                 "INSERT INTO datasets (name, created_at) VALUES (?, ?)",
                 (name, datetime.now())
-            )
-            self.conn.commit()
+            ))
             return True
         except sqlite3.IntegrityError:
             return False
 
+    def iter_datasets(self):
+        return iter_rows(self.conn.execute("SELECT id, name, created_at FROM datasets ORDER BY id"), Dataset)
+
+    def get_dataset_names(self):
+        return [name for (name,) in self.conn.execute("SELECT name FROM datasets ORDER BY id")]
+
     def get_datasets(self):
-        return pd.read_sql("SELECT * FROM datasets", self.conn)
+        return to_frame(self.iter_datasets(), Dataset.__slots__)
+
+    def iter_entries(self, dataset_name, batch_size=DEFAULT_BATCH_SIZE):
+        # Entry rows of a dataset, newest first, fetched batch_size at a time
+        c = self.conn.execute(
+            """
+            SELECT id, question, response_a, response_b, preferred, created_at
+            FROM entries
+            WHERE dataset_id = ?
+            ORDER BY created_at DESC, id DESC
+            """,
+            (self.get_dataset_id(dataset_name),)
+        )
+        return iter_rows(c, Entry, batch_size)
 
     def get_entries(self, dataset_name):
-        return pd.read_sql(
+        c = self.conn.execute(
             """
-            SELECT question, response_a, response_b, preferred, created_at
+            SELECT e.question, e.response_a, e.response_b, e.preferred, e.created_at
             FROM entries e
             JOIN datasets d ON e.dataset_id = d.id
             WHERE d.name = ?
             ORDER BY e.created_at DESC
             """,
-            self.conn,
-            params=(dataset_name,)
+            (dataset_name,)
+        )
+        return to_frame(iter_rows(c), ENTRY_FRAME_COLUMNS)
+
+    def get_dataset_id(self, dataset_name):
+        c = self.conn.cursor()
+        c.execute("SELECT id FROM datasets WHERE name = ?", (dataset_name,))
+        result = c.fetchone()
+        return result[0] if result else None
+
+    def get_entries_page(self, dataset_name, page_size=DEFAULT_PAGE_SIZE, after=None, columns=PAGE_COLUMNS, truncate=None, as_rows=False):
+        # Keyset pagination, newest first. `after` is the cursor returned with
+        # the previous page; returns (page DataFrame, cursor for the next page
+        # or None), or a list of tuples in `columns` order with as_rows=True.
+        # Text columns are cut to `truncate` characters in SQL so long
+        # responses never leave the database.
+        unknown = set(columns) - set(PAGE_COLUMNS) - set(EXTRA_PAGE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown entry columns: {', '.join(sorted(unknown))}")
+
+        select = []
+        for column in columns:
+            if truncate and column in ("question", "response_a", "response_b"):
+                select.append(f"substr(e.{column}, 1, {int(truncate)}) AS {column}")
+            else:
+                select.append(f"e.{column}")
+
+        params = [self.get_dataset_id(dataset_name)]
+        where = "e.dataset_id = ?"
+        if after is not None:
+            where += " AND (e.created_at, e.id) < (?, ?)"
+            params.extend(after)
+        params.append(page_size + 1)
+
+        c = self.conn.cursor()
+        c.execute(
+            f"""
+            SELECT {', '.join(select)}, e.created_at, e.id
+            FROM entries e
+            WHERE {where}
+            ORDER BY e.created_at DESC, e.id DESC
+            LIMIT ?
+            """,
+            params
         )
+        rows = c.fetchall()
+
+        # One extra row is fetched to tell whether another page exists
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = rows[-1][-2:]
+        page = [row[:-2] for row in rows]
+        return (page if as_rows else to_frame(page, columns)), next_cursor
+
+    def get_entry_count(self, dataset_name):
+        return self.get_dataset_stats(dataset_name)[0]
+
+    def export_entries(self, dataset_name, fmt, columns, batch_size=DEFAULT_BATCH_SIZE):
+        # Streams the dataset to a temp file; returns (path, row_count)
+        return export_to_tempfile(self.conn, dataset_name, fmt, columns, batch_size)
+
+    def export_to_target(self, dataset_name, target, fmt, columns, delta=False, batch_size=DEFAULT_BATCH_SIZE):
+        # Like export_entries, for a named target; returns (path, row_count,
+        # export_id). delta=True writes only the entries added or changed
+        # since the target's last confirmed export (all of them if it has
+        # none). The export is recorded as pending: call confirm_export with
+        # its id once the consumer has the file.
+        dataset_id = self.get_dataset_id(dataset_name)
+        conn = self.conn
+        # One read transaction, so the rows written are exactly the ones the
+        # recorded watermark covers
+        conn.execute("BEGIN")
+        try:
+            since = last_watermark(conn, dataset_id, target) if delta else None
+            until = current_watermark(conn, dataset_id)
+            if since is None:
+                batches = iter_entry_batches(conn, dataset_name, columns, batch_size)
+            else:
+                batches = iter_delta_batches(conn, dataset_id, since, until, columns, batch_size)
+            path, count = write_to_tempfile(batches, columns, fmt)
+        finally:
+            conn.commit()
+
+        mode = "full" if since is None else "delta"
+        try:
+            export_id = self.write(lambda: record_export(self.conn, dataset_id, target, fmt, mode, count, until))
+        except Exception:
+            os.remove(path)
+            raise
+        return path, count, export_id
+
+    def confirm_export(self, dataset_name, export_id):
+        # Advances the target's watermark to a pending export; False if the
+        # export is unknown or already confirmed
+        dataset_id = self.get_dataset_id(dataset_name)
+        return self.write(lambda: confirm_export(self.conn, dataset_id, export_id))
+
+    def get_export_history(self, dataset_name, limit=20):
+        # [(target, format, mode, rows, last_entry_id, last_created_at, exported_at), ...], newest first
+        return export_history(self.conn, self.get_dataset_id(dataset_name), limit)
+
+    def export_shards(self, dataset_name, output_dir, fmt="JSONL", columns=TRAINING_EXPORT_COLUMNS, **options):
+        # Writes id-range shards and a manifest in parallel; returns the manifest
+        return export_shards(self, dataset_name, output_dir, fmt, columns, **options)
 
     def save_entry(self, dataset_name, question, response_a, response_b):
+        self.submit_entries(self.get_dataset_id(dataset_name), [(question, response_a, response_b)]).result()
+
+    def submit_entries(self, dataset_id, pairs):
+        # Inserts (question, response_a, response_b) pairs in one write;
+        # returns a Future of the first new entry id
+        return self.submit_write(lambda: self._insert_entries(dataset_id, pairs))
+
+    def _insert_entries(self, dataset_id, pairs):
+        # pairs is a list of (question, response_a, response_b); returns the
+        # id of the first inserted entry. The caller commits.
+        now = datetime.now()
+        conn = self.conn
+        first_id = insert_entry_rows(
+            conn,
+            [
+                (dataset_id, question, response_a, response_b, "A", "active", now)
+                for question, response_a, response_b in pairs
+            ]
+        )
+        index_entries(
+            conn,
+            dataset_id,
+            [(first_id + i, pair[0]) for i, pair in enumerate(pairs)]
+        )
+        record_entries(conn, dataset_id, [(*pair, now) for pair in pairs])
+        return first_id
+
+    def _insert_prompts(self, dataset_id, questions):
+        now = datetime.now()
+        self.conn.executemany(
+            "INSERT INTO prompts (dataset_id, question, status, created_at) VALUES (?, ?, ?, ?)",
+            [(dataset_id, question, "pending", now) for question in questions]
+        )
+
+    def import_file(self, dataset_name, source, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None):
+        # Streams a JSONL/JSON/CSV/Parquet file into the dataset. Rows with question,
+        # chosen and rejected become entries; rows with only a question become
+        # pending prompts. Each chunk is inserted in a single transaction.
+        dataset_id = self.get_dataset_id(dataset_name)
+        if dataset_id is None:
+            raise ValueError(f"Dataset not found: {dataset_name}")
+        if fmt is None:
+            fmt = detect_format(source if isinstance(source, str) else source.name)
+
+        counts = {"entries": 0, "prompts": 0, "skipped": 0}
+        for chunk in iter_chunks(source, fmt, chunk_size):
+            pairs = []
+            questions = []
+            for record in chunk:
+                row = normalize_record(record)
+                if row is None:
+                    counts["skipped"] += 1
+                elif row[1] is None:
+                    questions.append(row[0])
+                else:
+                    pairs.append(row)
+
+            self.write(lambda: self._insert_chunk(dataset_id, pairs, questions))
+
+            counts["entries"] += len(pairs)
+            counts["prompts"] += len(questions)
+            if progress_callback:
+                progress_callback(counts)
+        return counts
+
+    def _insert_chunk(self, dataset_id, pairs, questions):
+        if pairs:
+            self._insert_entries(dataset_id, pairs)
+        if questions:
+            self._insert_prompts(dataset_id, questions)
+
+    def find_near_duplicates(self, dataset_name, question, threshold=DEFAULT_THRESHOLD, limit=5):
+        # Returns [(entry_id, question, similarity)] for indexed entries of
+        # the dataset whose question is close to the given one
+        dataset_id = self.get_dataset_id(dataset_name)
+        if dataset_id is None or not question:
+            return []
+        return find_similar(self.conn, dataset_id, question, threshold, limit)
+
+    def get_near_duplicate_report(self, dataset_name, threshold=DEFAULT_THRESHOLD):
+        # Clusters of entry ids whose questions are near duplicates, largest first
+        dataset_id = self.get_dataset_id(dataset_name)
+        if dataset_id is None:
+            return []
+        return duplicate_clusters(self.conn, dataset_id, threshold)
+
+    def index_unindexed_entries(self):
+        # Indexes entries written without going through DatabaseManager;
+        # migration 14 indexed the ones saved before the index existed
+        count = 0
+        for dataset_id, entries in unindexed_entries(self.conn):
+            self.write(lambda: index_entries(self.conn, dataset_id, entries))
+            count += len(entries)
+        return count
+
+    def get_questions(self, entry_ids):
+        if not entry_ids:
+            return {}
+        c = self.conn.cursor()
+        c.execute(
+            f"SELECT id, question FROM entries WHERE id IN ({', '.join('?' * len(entry_ids))})",
+            list(entry_ids)
+        )
+        return dict(c.fetchall())
+
+    def search_entries(self, query, dataset_name=None, limit=DEFAULT_PAGE_SIZE, offset=0, raw=False, as_rows=False):
+        # Full-text search ranked by bm25, with question matches weighted
+        # double. Plain queries match entries containing every word; pass
+        # raw=True to use FTS5 query syntax (phrases, OR, prefix*) directly.
+        # Returns a DataFrame, or a list of SearchHit rows with as_rows=True.
+        match = query if raw else fts_query(query)
+        if not match:
+            return [] if as_rows else to_frame([], SEARCH_COLUMNS)
+
+        where = "entries_fts MATCH ?"
+        params = [match]
+        if dataset_name is not None:
+            where += " AND e.dataset_id = ?"
+            params.append(self.get_dataset_id(dataset_name))
+        params.extend([limit, offset])
+
+        c = self.conn.cursor()
+        c.execute(
+            f"""
+            SELECT
+                e.id,
+                d.name,
+                snippet(entries_fts, 0, '**', '**', '…', 16),
+                snippet(entries_fts, 1, '**', '**', '…', 16),
+                snippet(entries_fts, 2, '**', '**', '…', 16),
+                bm25(entries_fts, 2.0, 1.0, 1.0) AS score
+            FROM entries_fts
+            JOIN entries e ON e.id = entries_fts.rowid
+            JOIN datasets d ON e.dataset_id = d.id
+            WHERE {where}
+            ORDER BY score
+            LIMIT ? OFFSET ?
+            """,
+            params
+        )
+        if as_rows:
+            return list(iter_rows(c, SearchHit))
+        return to_frame(c.fetchall(), SEARCH_COLUMNS)
+
+    def get_pending_prompts(self, dataset_name, limit=None):
         c = self.conn.cursor()
         c.execute(
             """
-            INSERT INTO entries 
-            (dataset_id, question, response_a, response_b, preferred, status, created_at)
-            VALUES (
-                (SELECT id FROM datasets WHERE name = ?),
-                ?, ?, ?, ?, ?, ?
-            )
+            SELECT p.id, p.question
+            FROM prompts p
+            JOIN datasets d ON p.dataset_id = d.id
+            WHERE d.name = ? AND p.status = 'pending'
+            ORDER BY p.id
+            LIMIT ?
+            """,
+            (dataset_name, -1 if limit is None else limit)
+        )
+        return c.fetchall()
+
+    def mark_prompts_done(self, prompt_ids):
+        self.write(lambda: self.conn.executemany(
+            "UPDATE prompts SET status = 'done' WHERE id = ?",
+            [(prompt_id,) for prompt_id in prompt_ids]
+        ))
+
+    def mark_prompts_batched(self, prompt_ids):
+        # Written to a Batch API request file; excluded from pending prompts
+        # until the output is ingested or the batch is abandoned
+        self.write(lambda: self.conn.executemany(
+            "UPDATE prompts SET status = 'batched' WHERE id = ? AND status = 'pending'",
+            [(prompt_id,) for prompt_id in prompt_ids]
+        ))
+
+    def reset_batched_prompts(self, dataset_name):
+        dataset_id = self.get_dataset_id(dataset_name)
+        return self.write(lambda: self.conn.execute(
+            "UPDATE prompts SET status = 'pending' WHERE dataset_id = ? AND status = 'batched'",
+            (dataset_id,)
+        ).rowcount)
+
+    def save_prompt_pairs(self, dataset_id, pairs):
+        # pairs is a list of (prompt_id, response_a, response_b). Saves an
+        # entry per prompt not already done and marks it done, in one
+        # transaction, so ingesting the same output twice adds nothing.
+        # Returns the number of entries saved.
+        if not pairs:
+            return 0
+        return self.write(lambda: self._save_prompt_pairs(dataset_id, pairs))
+
+    def _save_prompt_pairs(self, dataset_id, pairs):
+        conn = self.conn
+        placeholders = ", ".join("?" * len(pairs))
+        questions = dict(conn.execute(
+            f"""
+            SELECT id, question FROM prompts
+            WHERE dataset_id = ? AND status != 'done' AND id IN ({placeholders})
             """,
-            (
-                dataset_name,
-                question,
-                response_a,
-                response_b,
-                "A",
-                "active",
-                datetime.now()
-            )
+            [dataset_id, *(prompt_id for prompt_id, _, _ in pairs)]
+        ).fetchall())
+        rows = [
+            (prompt_id, questions[prompt_id], response_a, response_b)
+            for prompt_id, response_a, response_b in pairs
+            if prompt_id in questions
+        ]
+        if not rows:
+            return 0
+        self._insert_entries(dataset_id, [row[1:] for row in rows])
+        conn.executemany(
+            "UPDATE prompts SET status = 'done' WHERE id = ?",
+            [(row[0],) for row in rows]
+        )
+        return len(rows)
+
+    def enqueue_jobs(self, dataset_name, questions):
+        # Queues prompts for the headless workers (python -m services.worker)
+        dataset_id = self.get_dataset_id(dataset_name)
+        return self.write(lambda: jobs.enqueue(self.conn, dataset_id, questions))
+
+    def enqueue_pending_prompts(self, dataset_name, limit=None):
+        # Moves imported prompts into the job queue; they are marked done
+        # once their job completes
+        dataset_id = self.get_dataset_id(dataset_name)
+        return self.write(lambda: self._enqueue_pending_prompts(dataset_id, dataset_name, limit))
+
+    def _enqueue_pending_prompts(self, dataset_id, dataset_name, limit):
+        # Reads the pending prompts under the write lock, so two callers
+        # can't queue the same prompts
+        pending = self.get_pending_prompts(dataset_name, limit)
+        count = jobs.enqueue(
+            self.conn,
+            dataset_id,
+            [question for _, question in pending],
+            [prompt_id for prompt_id, _ in pending]
+        )
+        self.conn.executemany(
+            "UPDATE prompts SET status = 'queued' WHERE id = ?",
+            [(prompt_id,) for prompt_id, _ in pending]
+        )
+        return count
+
+    def claim_jobs(self, worker_id, limit=1, lease=jobs.DEFAULT_LEASE, dataset_name=None, max_attempts=jobs.DEFAULT_MAX_ATTEMPTS):
+        # [(job_id, dataset_id, question), ...] now leased to worker_id
+        dataset_id = None
+        if dataset_name:
+            dataset_id = self.get_dataset_id(dataset_name)
+            if dataset_id is None:
+                raise ValueError(f"Dataset not found: {dataset_name}")
+        return self.write(lambda: jobs.claim(self.conn, worker_id, limit, lease, dataset_id, max_attempts))
+
+    def complete_job(self, job_id, worker_id, dataset_id, question, response_a, response_b):
+        # Saves the pair and marks the job done in one transaction, so a
+        # crash either loses the pair and the job is retried, or keeps both.
+        # Returns False, saving nothing, if the job was reclaimed meanwhile.
+        return self.write(lambda: self._complete_job(job_id, worker_id, dataset_id, question, response_a, response_b))
+
+    def _complete_job(self, job_id, worker_id, dataset_id, question, response_a, response_b):
+        conn = self.conn
+        if not jobs.take_ownership(conn, job_id, worker_id):
+            return False
+        entry_id = self._insert_entries(dataset_id, [(question, response_a, response_b)])
+        conn.execute("UPDATE jobs SET entry_id = ? WHERE id = ?", (entry_id, job_id))
+        conn.execute(
+            "UPDATE prompts SET status = 'done' WHERE id = (SELECT prompt_id FROM jobs WHERE id = ?)",
+            (job_id,)
+        )
+        return True
+
+    def fail_job(self, job_id, worker_id, error, max_attempts=jobs.DEFAULT_MAX_ATTEMPTS):
+        self.write(lambda: jobs.fail(self.conn, job_id, worker_id, error, max_attempts))
+
+    def retry_failed_jobs(self, dataset_name):
+        dataset_id = self.get_dataset_id(dataset_name)
+        return self.write(lambda: jobs.retry_failed(self.conn, dataset_id))
+
+    def get_job_counts(self, dataset_name=None):
+        dataset_id = self.get_dataset_id(dataset_name) if dataset_name else None
+        return jobs.counts(self.conn, dataset_id)
+
+    def get_latency_percentiles(self, days=metrics.DEFAULT_WINDOW_DAYS, as_rows=False):
+        rows = metrics.latency_percentiles(self.conn, metrics.window_start(days))
+        return rows if as_rows else to_frame(rows, LATENCY_COLUMNS)
+
+    def get_llm_usage(self, group_by="dataset", days=metrics.DEFAULT_WINDOW_DAYS):
+        # Tokens and estimated cost per dataset or per day, split by model
+        return to_frame(
+            metrics.usage(self.conn, metrics.window_start(days), group_by),
+            [group_by, "model", "calls", "prompt_tokens", "completion_tokens", "cost"]
         )
-        self.conn.commit()
 
     def close(self):
-        if self.conn:
-            self.conn.close()
-    
-    # Add these methods to db_manager.py
+        # Hands this thread's connection back to the pool for reuse
+        self.connections.release()
+
+    def iter_quick_responses(self):
+        return (QuickResponse(*row) for row in self.quick_responses.index().rows)
 
     def get_quick_responses(self):
-        return pd.read_sql(
-            "SELECT * FROM quick_responses ORDER BY created_at DESC",
-            self.conn
-        )
+        return to_frame(self.quick_responses.index().rows, QuickResponse.__slots__)
+
+    def search_quick_responses(self, query="", limit=QUICK_RESPONSE_PAGE_SIZE, offset=0):
+        # ([(id, text, created_at), ...], total_matches) from the cached index
+        return self.quick_responses.search(query, limit, offset)
 
     def add_quick_response(self, text):
         try:
-            c = self.conn.cursor()
-            c.execute(
+            self.write(lambda: self.conn.execute(
                 "INSERT INTO quick_responses (text, created_at) VALUES (?, ?)",
                 (text, datetime.now())
-            )
-            self.conn.commit()
+            ))
+            self.quick_responses.invalidate()
             return True
         except Exception:
             return False
 
     def delete_quick_response(self, response_id):
         try:
-            c = self.conn.cursor()
-            c.execute("DELETE FROM quick_responses WHERE id = ?", (response_id,))
-            self.conn.commit()
+            self.write(lambda: self.conn.execute("DELETE FROM quick_responses WHERE id = ?", (response_id,)))
+            self.quick_responses.invalidate()
             return True
         except Exception:
             return False
 
+    def prune_texts(self):
+        # Deletes stored texts no entry references any more; returns how many
+        return self.write(lambda: delete_unused_texts(self.conn))
+
     def get_dataset_stats(self, dataset_name):
-        c = self.conn.cursor()
-        c.execute("""
-            SELECT 
-                COUNT(*) as total_entries,
-                COUNT(DISTINCT question) as unique_questions,
-                MIN(created_at) as first_entry,
-                MAX(created_at) as last_entry
-            FROM entries e
-            JOIN datasets d ON e.dataset_id = d.id
-            WHERE d.name = ?
-        """, (dataset_name,))
-        return c.fetchone()
\ No newline at end of file
+        # (total_entries, unique_questions, first_entry, last_entry), read
+        # from the stats the write path maintains rather than from entries
+        return read_stats(self.conn, self.get_dataset_id(dataset_name))
+
+    def get_length_histograms(self, dataset_name):
+        return read_histograms(self.conn, self.get_dataset_id(dataset_name))
+
+    def rebuild_dataset_stats(self):
+        # Repairs the materialized stats after entries were moved between
+        # datasets outside DatabaseManager; deletes update them by trigger
+        self.write(lambda: rebuild_stats(self.conn))
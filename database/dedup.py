@@ -0,0 +1,205 @@
+import functools
+import hashlib
+import re
+import unicodedata
+import zlib
+
+# numpy is imported on first use, so starting the UI, a worker or the API
+# doesn't pay for it until a signature is computed or compared
+
+# 64 permutations split into 16 bands of 4 rows: pairs with Jaccard
+# similarity 0.7 share at least one band ~99% of the time, pairs below 0.3
+# rarely do. Candidates are then checked against the signature estimate.
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+DEFAULT_THRESHOLD = 0.7
+MAX_CANDIDATES = 500
+
+# Fixed seed: signatures are persisted, so the permutations must never change
+PERMUTATION_SEED = 1
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Near-duplicate detection requires numpy (pip install numpy)")
+    return numpy
+
+@functools.lru_cache(maxsize=None)
+def _permutations():
+    np = _numpy()
+    rng = np.random.RandomState(PERMUTATION_SEED)
+    return (
+        rng.randint(1, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64),
+        rng.randint(0, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64),
+    )
+
+def normalize(text):
+    # Case, punctuation and whitespace differences should not matter
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+def signature(text):
+    np = _numpy()
+    perm_a, perm_b = _permutations()
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    permuted = (np.outer(hashes, perm_a) + perm_b) % np.uint64(MERSENNE_PRIME) & np.uint64(MAX_HASH)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def band_buckets(sig):
+    # One signed 64-bit bucket id per band; the band number is mixed into
+    # the hash so a single column can hold every band
+    buckets = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+def similarity(sig_a, sig_b):
+    # Estimated Jaccard similarity of the two shingle sets
+    return float(_numpy().mean(sig_a == sig_b))
+
+def _from_blob(blob):
+    np = _numpy()
+    return np.frombuffer(blob, dtype=np.uint32)
+
+def index_entries(conn, dataset_id, entries):
+    # entries is a list of (entry_id, question); the caller commits
+    signatures = []
+    buckets = []
+    for entry_id, question in entries:
+        sig = signature(question)
+        signatures.append((entry_id, dataset_id, sig.tobytes()))
+        buckets.extend((dataset_id, bucket, entry_id) for bucket in band_buckets(sig))
+    conn.executemany(
+        "INSERT OR REPLACE INTO minhash_signatures (entry_id, dataset_id, signature) VALUES (?, ?, ?)",
+        signatures
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh_buckets (dataset_id, bucket, entry_id) VALUES (?, ?, ?)",
+        buckets
+    )
+
+def find_similar(conn, dataset_id, question, threshold=DEFAULT_THRESHOLD, limit=5):
+    # Only entries sharing a band bucket with the question are compared, so
+    # the cost depends on the number of near matches, not the dataset size
+    sig = signature(question)
+    buckets = band_buckets(sig)
+    placeholders = ", ".join("?" * len(buckets))
+    rows = conn.execute(
+        f"""
+        SELECT m.entry_id, m.signature, e.question
+        FROM minhash_signatures m
+        JOIN entries e ON e.id = m.entry_id
+        WHERE m.entry_id IN (
+            SELECT DISTINCT entry_id FROM lsh_buckets
+            WHERE dataset_id = ? AND bucket IN ({placeholders})
+            LIMIT ?
+        )
+        """,
+        [dataset_id, *buckets, MAX_CANDIDATES]
+    ).fetchall()
+
+    matches = []
+    for entry_id, blob, other in rows:
+        score = similarity(sig, _from_blob(blob))
+        if score >= threshold:
+            matches.append((entry_id, other, score))
+    matches.sort(key=lambda match: -match[2])
+    return matches[:limit]
+
+def duplicate_clusters(conn, dataset_id, threshold=DEFAULT_THRESHOLD):
+    # Groups entries that share a bucket, verifies each member against the
+    # first one in its bucket, and merges the verified pairs with union-find.
+    # Work is proportional to bucket sizes rather than all pairs of entries.
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    signatures = {}
+
+    def sig_of(entry_id):
+        if entry_id not in signatures:
+            row = conn.execute(
+                "SELECT signature FROM minhash_signatures WHERE entry_id = ?",
+                (entry_id,)
+            ).fetchone()
+            signatures[entry_id] = _from_blob(row[0]) if row else None
+        return signatures[entry_id]
+
+    groups = conn.execute(
+        """
+        SELECT group_concat(entry_id)
+        FROM lsh_buckets
+        WHERE dataset_id = ?
+        GROUP BY bucket
+        HAVING COUNT(*) > 1
+        """,
+        (dataset_id,)
+    )
+    for (members,) in groups:
+        ids = [int(entry_id) for entry_id in members.split(",")]
+        anchor = sig_of(ids[0])
+        if anchor is None:
+            continue
+        for other in ids[1:]:
+            if find(other) == find(ids[0]):
+                continue
+            other_sig = sig_of(other)
+            if other_sig is not None and similarity(anchor, other_sig) >= threshold:
+                parent[find(other)] = find(ids[0])
+
+    clusters = {}
+    for entry_id in parent:
+        clusters.setdefault(find(entry_id), []).append(entry_id)
+    return sorted(
+        (sorted(members) for members in clusters.values() if len(members) > 1),
+        key=len,
+        reverse=True
+    )
+
+def unindexed_entries(conn, batch_size=1000):
+    # Entries without a signature, yielded in batches of
+    # (dataset_id, [(entry_id, question), ...])
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT e.id, e.dataset_id, e.question
+            FROM entries e
+            LEFT JOIN minhash_signatures m ON m.entry_id = e.id
+            WHERE e.id > ? AND m.entry_id IS NULL
+            ORDER BY e.id
+            LIMIT ?
+            """,
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        by_dataset = {}
+        for entry_id, dataset_id, question in rows:
+            by_dataset.setdefault(dataset_id, []).append((entry_id, question))
+        yield from by_dataset.items()
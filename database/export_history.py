@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from database.rows import Row
+
+# Every export to a named target (a training pipeline, a bucket) records a
+# watermark: the highest entry id and change-log id it covered, plus the
+# newest created_at for people reading the history. A delta export then
+# reads only entries with a higher id, which is a rowid range scan, and the
+# entry_changes rows logged since, so its cost follows the number of new
+# and changed entries rather than the dataset size. Deleted entries are not
+# reported; a full export resets a target.
+# An export is recorded as pending (exported_at is NULL) when its file is
+# written, and becomes the target's watermark only once the consumer
+# confirms it received the file. A download that never happens, or a
+# Streamlit rerun that drops it, leaves the watermark where it was.
+
+EXPORT_MODES = ("full", "delta")
+
+class Watermark(Row):
+    __slots__ = ("last_entry_id", "last_change_id", "last_created_at")
+
+def current_watermark(conn, dataset_id):
+    # What an export starting now covers; each MAX() reads a single index
+    # entry. New entries get higher ids than any before them, except when
+    # the newest entry was deleted and its id is handed out again: the
+    # entry_changes triggers log those like updates.
+    last_entry_id, = conn.execute("SELECT COALESCE(MAX(id), 0) FROM entry_rows").fetchone()
+    last_change_id, = conn.execute("SELECT COALESCE(MAX(id), 0) FROM entry_changes").fetchone()
+    last_created_at, = conn.execute(
+        "SELECT MAX(created_at) FROM entry_rows WHERE dataset_id = ?",
+        (dataset_id,)
+    ).fetchone()
+    return Watermark(last_entry_id, last_change_id, last_created_at)
+
+def last_watermark(conn, dataset_id, target):
+    # The watermark of the target's latest export, or None
+    row = conn.execute(
+        """
+        SELECT last_entry_id, last_change_id, last_created_at
+        FROM export_history
+        WHERE dataset_id = ? AND target = ? AND exported_at IS NOT NULL
+        ORDER BY id DESC
+        LIMIT 1
+        """,
+        (dataset_id, target)
+    ).fetchone()
+    return Watermark(*row) if row else None
+
+def record_export(conn, dataset_id, target, fmt, mode, rows, watermark):
+    # Records a pending export; returns its id. The caller commits.
+    c = conn.execute(
+        """
+        INSERT INTO export_history
+        (dataset_id, target, format, mode, rows, last_entry_id, last_change_id, last_created_at, exported_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            dataset_id, target, fmt, mode, rows,
+            watermark.last_entry_id, watermark.last_change_id, watermark.last_created_at,
+            None
+        )
+    )
+    return c.lastrowid
+
+def confirm_export(conn, dataset_id, export_id):
+    # Marks a pending export as received, making it the target's watermark,
+    # and drops the target's older pending exports. Returns False if there
+    # is no such pending export. The caller commits.
+    c = conn.execute(
+        "UPDATE export_history SET exported_at = ? WHERE id = ? AND dataset_id = ? AND exported_at IS NULL",
+        (datetime.now(), export_id, dataset_id)
+    )
+    if c.rowcount != 1:
+        return False
+    conn.execute(
+        """
+        DELETE FROM export_history
+        WHERE dataset_id = ? AND exported_at IS NULL AND id < ?
+          AND target = (SELECT target FROM export_history WHERE id = ?)
+        """,
+        (dataset_id, export_id, export_id)
+    )
+    return True
+
+def export_history(conn, dataset_id, limit=20):
+    # [(target, format, mode, rows, last_entry_id, last_created_at, exported_at), ...]
+    # of confirmed exports, newest first
+    return conn.execute(
+        """
+        SELECT target, format, mode, rows, last_entry_id, last_created_at, exported_at
+        FROM export_history
+        WHERE dataset_id = ? AND exported_at IS NOT NULL
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (dataset_id, limit)
+    ).fetchall()
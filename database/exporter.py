@@ -0,0 +1,242 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from itertools import chain
+
+DEFAULT_BATCH_SIZE = 1000
+
+# name -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "JSON": ("json", "application/json"),
+    "JSONL": ("jsonl", "application/jsonl"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Exportable column names and the entries expression each one reads
+ENTRY_COLUMNS = {
+    "question": "e.question",
+    "response_a": "e.response_a",
+    "response_b": "e.response_b",
+    "chosen": "e.response_a",
+    "rejected": "e.response_b",
+    "preferred": "e.preferred",
+    "created_at": "e.created_at",
+}
+
+# Parquet files follow the prompt/chosen/rejected layout DPO trainers load
+# directly; other columns keep their names
+PARQUET_COLUMN_NAMES = {"question": "prompt"}
+PARQUET_TIMESTAMP_COLUMNS = ("created_at",)
+PARQUET_COMPRESSION = "zstd"
+# Rows per row group: a reader holds one row group of text at a time
+PARQUET_ROW_GROUP_SIZE = 50000
+
+# Id ranges must be read as a rowid range scan, so their cost follows the
+# range rather than the dataset. Without sqlite_stat1 statistics the planner
+# prefers a dataset_id index, which reads the whole dataset and sorts it;
+# the unary + keeps dataset_id from being used as an index key.
+ENTRY_RANGE_QUERY = """
+    SELECT {select}
+    FROM entries e
+    WHERE +e.dataset_id = ? AND e.id BETWEEN ? AND ?
+    ORDER BY e.id
+"""
+
+# Entries logged in entry_changes within a change-id range: rowid lookups
+# driven by the change log's index, for the same reason as above
+CHANGED_ENTRIES_QUERY = """
+    SELECT {select}
+    FROM entries e
+    WHERE e.id IN (
+        SELECT entry_id FROM entry_changes
+        WHERE dataset_id = ? AND id > ? AND id <= ? AND entry_id <= ?
+    )
+    AND +e.dataset_id = ?
+    ORDER BY e.id
+"""
+
+ENTRY_EXPORT_COLUMNS = ["question", "response_a", "response_b", "preferred"]
+TRAINING_EXPORT_COLUMNS = ["question", "chosen", "rejected"]
+
+def iter_entry_batches(conn, dataset_name, columns, batch_size=DEFAULT_BATCH_SIZE):
+    # Rows are pulled from the cursor batch_size at a time, so only one batch
+    # is ever materialized in Python
+    select = ", ".join(f"{ENTRY_COLUMNS[column]} AS {column}" for column in columns)
+    c = conn.cursor()
+    c.execute(
+        f"""
+        SELECT {select}
+        FROM entries e
+        JOIN datasets d ON e.dataset_id = d.id
+        WHERE d.name = ?
+        ORDER BY e.created_at DESC, e.id DESC
+        """,
+        (dataset_name,)
+    )
+    yield from _fetch_batches(c, batch_size)
+
+def iter_entry_range_batches(conn, dataset_id, first_id, last_id, columns, batch_size=DEFAULT_BATCH_SIZE):
+    # Entries of a dataset with first_id <= id <= last_id in id order
+    select = ", ".join(f"{ENTRY_COLUMNS[column]} AS {column}" for column in columns)
+    c = conn.cursor()
+    c.execute(ENTRY_RANGE_QUERY.format(select=select), (dataset_id, first_id, last_id))
+    yield from _fetch_batches(c, batch_size)
+
+def iter_delta_batches(conn, dataset_id, since, until, columns, batch_size=DEFAULT_BATCH_SIZE):
+    # Entries changed after `since` that it had already covered, then the
+    # entries added after it, each in id order; nothing beyond `until`
+    select = ", ".join(f"{ENTRY_COLUMNS[column]} AS {column}" for column in columns)
+    c = conn.cursor()
+    c.execute(
+        CHANGED_ENTRIES_QUERY.format(select=select),
+        (dataset_id, since.last_change_id, until.last_change_id, since.last_entry_id, dataset_id)
+    )
+    return chain(
+        _fetch_batches(c, batch_size),
+        iter_entry_range_batches(conn, dataset_id, since.last_entry_id + 1, until.last_entry_id, columns, batch_size)
+    )
+
+def _fetch_batches(c, batch_size):
+    try:
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        c.close()
+
+def write_export(batches, columns, fmt, fileobj):
+    # Writes batches of row tuples to a binary file object; returns the row count
+    if fmt == "Parquet":
+        return _write_parquet(batches, columns, fileobj)
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    count = 0
+    if fmt == "CSV":
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    elif fmt in ("JSON", "JSONL"):
+        separator = "\n" if fmt == "JSONL" else ","
+        if fmt == "JSON":
+            text.write("[")
+        for rows in batches:
+            for row in rows:
+                if count:
+                    text.write(separator)
+                text.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str))
+                count += 1
+        text.write("]" if fmt == "JSON" else ("\n" if count else ""))
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    text.flush()
+    text.detach()
+    return count
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+def parquet_schema(columns):
+    pa, _ = _import_pyarrow()
+    return pa.schema([
+        (
+            PARQUET_COLUMN_NAMES.get(column, column),
+            pa.timestamp("us") if column in PARQUET_TIMESTAMP_COLUMNS else pa.string()
+        )
+        for column in columns
+    ])
+
+def _write_parquet(batches, columns, fileobj, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    # Each cursor batch becomes an Arrow record batch column by column, with
+    # no per-row dicts; batches are buffered until they fill a row group
+    pa, pq = _import_pyarrow()
+    schema = parquet_schema(columns)
+    count = 0
+    pending = []
+    pending_rows = 0
+
+    def flush():
+        writer.write_table(pa.Table.from_batches(pending, schema), row_group_size=row_group_size)
+        pending.clear()
+
+    with pq.ParquetWriter(fileobj, schema, compression=PARQUET_COMPRESSION) as writer:
+        for rows in batches:
+            arrays = [
+                # Timestamps come out of SQLite as ISO strings
+                pa.array(values, pa.string()).cast(field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            pending.append(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            pending_rows += len(rows)
+            count += len(rows)
+            if pending_rows >= row_group_size:
+                flush()
+                pending_rows = 0
+        if pending:
+            flush()
+    return count
+
+def open_parquet_export(path):
+    # A ParquetFile over a memory map of `path`: row groups are read
+    # straight from the page cache as they are iterated, so a file of any
+    # size can be checked without loading it
+    pa, pq = _import_pyarrow()
+    return pq.ParquetFile(pa.memory_map(path, "r"))
+
+def iter_parquet_export(path, columns=None, batch_size=DEFAULT_BATCH_SIZE):
+    # Yields lists of row dicts from an exported Parquet file
+    for batch in open_parquet_export(path).iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pylist()
+
+def validate_parquet_export(path, columns=TRAINING_EXPORT_COLUMNS):
+    # Reads the file one row group at a time and checks it against the
+    # export schema; returns a summary dict, raising ValueError on mismatch
+    parquet_file = open_parquet_export(path)
+    expected = parquet_schema(columns)
+    schema = parquet_file.schema_arrow
+    if not schema.equals(expected):
+        raise ValueError(f"Unexpected Parquet schema: {schema}, expected {expected}")
+
+    metadata = parquet_file.metadata
+    rows = 0
+    null_counts = dict.fromkeys(schema.names, 0)
+    for index in range(metadata.num_row_groups):
+        table = parquet_file.read_row_group(index)
+        rows += table.num_rows
+        for name in schema.names:
+            null_counts[name] += table.column(name).null_count
+    if rows != metadata.num_rows:
+        raise ValueError(f"Parquet file holds {rows} rows, metadata says {metadata.num_rows}")
+    return {
+        "rows": rows,
+        "row_groups": metadata.num_row_groups,
+        "columns": schema.names,
+        "null_counts": null_counts,
+        "bytes": os.path.getsize(path),
+    }
+
+def export_to_tempfile(conn, dataset_name, fmt, columns, batch_size=DEFAULT_BATCH_SIZE):
+    # Returns (path, row_count); the caller owns the file and must remove it
+    return write_to_tempfile(iter_entry_batches(conn, dataset_name, columns, batch_size), columns, fmt)
+
+def write_to_tempfile(batches, columns, fmt):
+    # write_export to a new temp file; returns (path, row_count)
+    extension = EXPORT_FORMATS[fmt][0]
+    fileobj = tempfile.NamedTemporaryFile(suffix=f".{extension}", delete=False)
+    try:
+        with fileobj:
+            count = write_export(batches, columns, fmt, fileobj)
+    except Exception:
+        os.remove(fileobj.name)
+        raise
+    return fileobj.name, count
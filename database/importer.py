@@ -0,0 +1,180 @@
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+
+DEFAULT_CHUNK_SIZE = 10000
+
+SUPPORTED_FORMATS = ("jsonl", "json", "csv", "parquet")
+# Characters read at a time when streaming a top-level JSON array, and the
+# most one element may take before it is reported as malformed
+JSON_READ_SIZE = 1 << 20
+MAX_JSON_RECORD_SIZE = 64 << 20
+
+# Imports by server path read only from this directory; without it only
+# uploads are accepted
+IMPORT_DIR_ENV = "DPO_IMPORT_DIR"
+
+# Field names used by common DPO / preference datasets, in lookup order
+QUESTION_FIELDS = ("question", "prompt", "instruction", "input", "query", "text")
+CHOSEN_FIELDS = ("chosen", "response_a", "chosen_response", "better", "positive")
+REJECTED_FIELDS = ("rejected", "response_b", "rejected_response", "worse", "negative")
+
+# Rows longer than the csv module default (128KB) are common for long responses
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+def detect_format(name):
+    ext = os.path.splitext(name)[1].lower().lstrip(".")
+    if ext in ("jsonl", "ndjson"):
+        return "jsonl"
+    if ext in ("json", "csv", "parquet"):
+        return ext
+    raise ValueError(f"Unsupported file type: {name}")
+
+def import_dir():
+    # The real path of the server-side import directory, or None
+    path = os.environ.get(IMPORT_DIR_ENV)
+    return os.path.realpath(path) if path else None
+
+def resolve_import_path(path, base_dir):
+    # The real path of `path`, relative ones taken from base_dir. Raises
+    # ValueError when it leads outside base_dir, through ".." or symlinks.
+    resolved = os.path.realpath(os.path.join(base_dir, path))
+    if os.path.commonpath([resolved, base_dir]) != base_dir:
+        raise ValueError(f"Only files under {base_dir} can be imported")
+    return resolved
+
+def iter_chunks(source, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    # source is a filesystem path or a binary file object (e.g. a Streamlit upload).
+    # Only one chunk of records is held in memory at a time.
+    if fmt == "parquet":
+        yield from _iter_parquet_chunks(source, chunk_size)
+        return
+
+    owns_file = isinstance(source, (str, os.PathLike))
+    binary = open(source, "rb") if owns_file else source
+    try:
+        # utf-8-sig drops the byte order mark Excel writes at the start of
+        # CSV files, which would otherwise end up in the first header
+        text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+        if fmt == "jsonl":
+            records = (json.loads(line) for line in text if line.strip())
+        elif fmt == "json":
+            records = _iter_json_records(text)
+        elif fmt == "csv":
+            records = csv.DictReader(text)
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        # Don't let the wrapper close a file object we were handed
+        text.detach()
+    finally:
+        if owns_file:
+            binary.close()
+
+def _iter_json_records(text):
+    # A .json file is either one top-level array of records, as the JSON
+    # export writes, or JSON Lines under a .json name, as many published
+    # datasets are. Arrays are decoded element by element, so the file is
+    # never held in memory as a whole.
+    first = text.read(1)
+    while first.isspace():
+        first = text.read(1)
+    if not first:
+        return
+    if first != "[":
+        lines = itertools.chain([first + text.readline()], text)
+        yield from (json.loads(line) for line in lines if line.strip())
+        return
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    while True:
+        # Skip separators, reading more once the buffer is used up
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = text.read(JSON_READ_SIZE), 0
+            if not buffer:
+                raise ValueError("JSON array is not terminated")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # The element continues past the buffer, or is malformed. The
+            # buffer at least doubles, so a long element is decoded only
+            # a few times.
+            if len(buffer) - pos >= MAX_JSON_RECORD_SIZE:
+                raise ValueError(
+                    f"Malformed JSON array element, or one larger than {MAX_JSON_RECORD_SIZE >> 20} MB: {e}"
+                ) from e
+            more = text.read(max(JSON_READ_SIZE, len(buffer) - pos))
+            if not more:
+                raise ValueError(f"Malformed JSON array element: {e}") from e
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        # Elements that are not objects are skipped like other unusable rows
+        yield record
+        pos = end
+
+def _iter_parquet_chunks(source, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet import requires pyarrow (pip install pyarrow)")
+
+    parquet_file = pq.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield batch.to_pylist()
+
+def normalize_record(record):
+    # Returns (question, chosen, rejected); chosen/rejected are None for
+    # prompt-only rows. None for rows that can't be used, including JSON
+    # values that aren't objects.
+    if not isinstance(record, dict):
+        return None
+    raw_chosen = _first(record, CHOSEN_FIELDS)
+    question = _message_text(_first(record, QUESTION_FIELDS), "user")
+    if question is None and isinstance(raw_chosen, list):
+        # Conversation layouts keep the prompt inside the chosen transcript
+        question = _message_text(raw_chosen, "user")
+    chosen = _message_text(raw_chosen, "assistant")
+    rejected = _message_text(_first(record, REJECTED_FIELDS), "assistant")
+
+    if not question:
+        return None
+    if chosen and rejected:
+        return question, chosen, rejected
+    return question, None, None
+
+def _first(record, fields):
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+def _message_text(value, role):
+    # Chat-style layouts store a list of {"role", "content"} messages;
+    # take the last message of the wanted role
+    if isinstance(value, list):
+        for message in reversed(value):
+            if isinstance(message, dict) and message.get("role") == role:
+                return message.get("content")
+        return None
+    if value is None:
+        return None
+    return str(value)
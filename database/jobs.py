@@ -0,0 +1,156 @@
+import time
+from datetime import datetime
+
+# A claimed job belongs to its worker until the lease runs out; after that
+# any worker may claim it again, which is how work held by a crashed
+# process is resumed
+DEFAULT_LEASE = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+JOB_STATUSES = ("pending", "running", "done", "failed")
+
+def enqueue(conn, dataset_id, questions, prompt_ids=None):
+    # Returns the number of jobs created or requeued; a prompt whose job
+    # failed for good gets that job back, any other prompt that already has
+    # a job is skipped. The caller commits.
+    now = datetime.now()
+    if prompt_ids is None:
+        prompt_ids = [None] * len(questions)
+    c = conn.executemany(
+        """
+        INSERT INTO jobs (dataset_id, prompt_id, question, status, created_at, updated_at)
+        VALUES (?, ?, ?, 'pending', ?, ?)
+        ON CONFLICT (prompt_id) WHERE prompt_id IS NOT NULL DO UPDATE
+        SET status = 'pending', attempts = 0, worker_id = NULL, lease_expires = NULL,
+            updated_at = excluded.updated_at
+        WHERE jobs.status = 'failed'
+        """,
+        [
+            (dataset_id, prompt_id, question, now, now)
+            for prompt_id, question in zip(prompt_ids, questions)
+        ]
+    )
+    return c.rowcount
+
+def claim(conn, worker_id, limit=1, lease=DEFAULT_LEASE, dataset_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    # Moves up to `limit` claimable jobs to running and returns them as
+    # (job_id, dataset_id, question). The caller runs this in a transaction
+    # that took the write lock before reading (DatabaseManager.write does),
+    # so concurrent workers never claim the same job, and commits.
+    now = time.time()
+    rows = conn.execute(
+        """
+        SELECT id, dataset_id, question
+        FROM jobs
+        WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?))
+          AND attempts < ?
+          AND (? IS NULL OR dataset_id = ?)
+        ORDER BY id
+        LIMIT ?
+        """,
+        (now, max_attempts, dataset_id, dataset_id, limit)
+    ).fetchall()
+    conn.executemany(
+        """
+        UPDATE jobs
+        SET status = 'running', worker_id = ?, lease_expires = ?,
+            attempts = attempts + 1, updated_at = ?
+        WHERE id = ?
+        """,
+        [(worker_id, now + lease, datetime.now(), row[0]) for row in rows]
+    )
+    # Jobs whose lease expired on their last attempt will never be claimed
+    # again; their prompts go back to pending
+    conn.execute(
+        """
+        UPDATE prompts SET status = 'pending'
+        WHERE status = 'queued' AND id IN (
+            SELECT prompt_id FROM jobs
+            WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+        )
+        """,
+        (now, max_attempts)
+    )
+    conn.execute(
+        """
+        UPDATE jobs
+        SET status = 'failed', error = coalesce(error, 'Lease expired'), updated_at = ?
+        WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+        """,
+        (datetime.now(), now, max_attempts)
+    )
+    return rows
+
+def take_ownership(conn, job_id, worker_id):
+    # Marks a running job done if `worker_id` still holds it. Returns False
+    # when the lease expired and another worker claimed the job, in which
+    # case the caller must discard its result. The caller commits.
+    c = conn.execute(
+        """
+        UPDATE jobs
+        SET status = 'done', lease_expires = NULL, error = NULL, updated_at = ?
+        WHERE id = ? AND worker_id = ? AND status = 'running'
+        """,
+        (datetime.now(), job_id, worker_id)
+    )
+    return c.rowcount == 1
+
+def fail(conn, job_id, worker_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    # Puts the job back in the queue, or fails it for good after
+    # max_attempts and puts its prompt back to pending, so it can be queued
+    # again. The caller commits.
+    conn.execute(
+        """
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            worker_id = NULL, lease_expires = NULL, error = ?, updated_at = ?
+        WHERE id = ? AND worker_id = ? AND status = 'running'
+        """,
+        (max_attempts, error, datetime.now(), job_id, worker_id)
+    )
+    conn.execute(
+        """
+        UPDATE prompts SET status = 'pending'
+        WHERE status = 'queued'
+          AND id = (SELECT prompt_id FROM jobs WHERE id = ? AND status = 'failed')
+        """,
+        (job_id,)
+    )
+
+def retry_failed(conn, dataset_id):
+    # Requeues the dataset's failed jobs, and marks their prompts queued
+    # again. The caller commits.
+    conn.execute(
+        """
+        UPDATE prompts SET status = 'queued'
+        WHERE status = 'pending' AND id IN (
+            SELECT prompt_id FROM jobs WHERE dataset_id = ? AND status = 'failed'
+        )
+        """,
+        (dataset_id,)
+    )
+    c = conn.execute(
+        """
+        UPDATE jobs
+        SET status = 'pending', attempts = 0, worker_id = NULL, updated_at = ?
+        WHERE dataset_id = ? AND status = 'failed'
+        """,
+        (datetime.now(), dataset_id)
+    )
+    return c.rowcount
+
+def counts(conn, dataset_id=None):
+    # {status: number of jobs}, every status present
+    result = dict.fromkeys(JOB_STATUSES, 0)
+    rows = conn.execute(
+        """
+        SELECT status, COUNT(*)
+        FROM jobs
+        WHERE ? IS NULL OR dataset_id = ?
+        GROUP BY status
+        """,
+        (dataset_id, dataset_id)
+    )
+    for status, count in rows:
+        result[status] = count
+    return result
@@ -0,0 +1,186 @@
+import time
+
+# USD per million (prompt, completion) tokens; costs are computed when
+# reporting, so updating a price also corrects past estimates
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+DEFAULT_WINDOW_DAYS = 7
+
+# Upper bounds of the Prometheus latency histogram, in seconds
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+PERCENTILES = (50, 95, 99)
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return ((prompt_tokens or 0) * prompt_price + (completion_tokens or 0) * completion_price) / 1e6
+
+class MetricsRecorder:
+    # Writes one llm_calls row per API call (cache hits are not calls).
+    # A failure to record never fails the call being measured: errors stay
+    # in the write's future, which nobody waits on.
+    def __init__(self, db):
+        self.db = db
+
+    def record(self, model, dataset_id=None, usage=None, latency=None, ttft=None, retries=0, streamed=False, error=None):
+        # Queued without waiting when the database has a writer thread
+        row = (
+            time.time(),
+            model,
+            dataset_id,
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+            latency,
+            ttft,
+            retries,
+            int(streamed),
+            None if error is None else str(error)[:500]
+        )
+        self.db.submit_write(lambda: self.db.conn.execute(
+            """
+            INSERT INTO llm_calls
+            (created_at, model, dataset_id, prompt_tokens, completion_tokens, latency, ttft, retries, streamed, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            row
+        ))
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an ascending list
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+def latency_percentiles(conn, since):
+    # [(model, calls, errors, p50, p95, p99, mean ttft)] for calls after `since`
+    rows = conn.execute(
+        """
+        SELECT model, latency, ttft, error
+        FROM llm_calls
+        WHERE created_at >= ?
+        ORDER BY model, latency
+        """,
+        (since,)
+    )
+    by_model = {}
+    for model, latency, ttft, error in rows:
+        stats = by_model.setdefault(model, {"calls": 0, "errors": 0, "latencies": [], "ttfts": []})
+        stats["calls"] += 1
+        if error is not None:
+            stats["errors"] += 1
+            continue
+        if latency is not None:
+            stats["latencies"].append(latency)
+        if ttft is not None:
+            stats["ttfts"].append(ttft)
+
+    result = []
+    for model, stats in by_model.items():
+        ttfts = stats["ttfts"]
+        result.append((
+            model,
+            stats["calls"],
+            stats["errors"],
+            *(percentile(stats["latencies"], pct) for pct in PERCENTILES),
+            sum(ttfts) / len(ttfts) if ttfts else None
+        ))
+    return result
+
+def usage(conn, since, group_by):
+    # [(group, model, calls, prompt_tokens, completion_tokens, cost)] where
+    # group is the dataset name or the local calendar day
+    group = {
+        "dataset": "coalesce(d.name, '(none)')",
+        "day": "date(c.created_at, 'unixepoch', 'localtime')",
+    }[group_by]
+    rows = conn.execute(
+        f"""
+        SELECT {group} AS grp, c.model, COUNT(*),
+               coalesce(SUM(c.prompt_tokens), 0), coalesce(SUM(c.completion_tokens), 0)
+        FROM llm_calls c
+        LEFT JOIN datasets d ON d.id = c.dataset_id
+        WHERE c.created_at >= ?
+        GROUP BY grp, c.model
+        ORDER BY grp, c.model
+        """,
+        (since,)
+    )
+    return [
+        (grp, model, calls, prompt, completion, estimate_cost(model, prompt, completion))
+        for grp, model, calls, prompt, completion in rows
+    ]
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+def render_prometheus(conn):
+    # Totals over the whole table in the Prometheus text exposition format
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_labels(**labels)} {value}")
+
+    totals = conn.execute(
+        """
+        SELECT model,
+               SUM(error IS NULL), SUM(error IS NOT NULL),
+               coalesce(SUM(prompt_tokens), 0), coalesce(SUM(completion_tokens), 0),
+               SUM(retries)
+        FROM llm_calls
+        GROUP BY model
+        ORDER BY model
+        """
+    ).fetchall()
+    metric("dpo_llm_calls_total", "counter", "LLM API calls by outcome", [
+        ("", {"model": model, "status": status}, count)
+        for model, ok, failed, *_ in totals
+        for status, count in (("ok", ok), ("error", failed))
+    ])
+    metric("dpo_llm_tokens_total", "counter", "Tokens used by LLM calls", [
+        ("", {"model": model, "type": kind}, count)
+        for model, _, _, prompt, completion, _ in totals
+        for kind, count in (("prompt", prompt), ("completion", completion))
+    ])
+    metric("dpo_llm_retries_total", "counter", "Retried LLM API attempts", [
+        ("", {"model": model}, retries) for model, *_, retries in totals
+    ])
+    metric("dpo_llm_cost_usd_total", "counter", "Estimated LLM spend in US dollars", [
+        ("", {"model": model}, round(estimate_cost(model, prompt, completion), 6))
+        for model, _, _, prompt, completion, _ in totals
+    ])
+
+    bucket_columns = ", ".join(f"SUM(latency <= {bound})" for bound in LATENCY_BUCKETS)
+    histogram = conn.execute(
+        f"""
+        SELECT model, {bucket_columns}, COUNT(*), SUM(latency)
+        FROM llm_calls
+        WHERE error IS NULL AND latency IS NOT NULL
+        GROUP BY model
+        ORDER BY model
+        """
+    ).fetchall()
+    samples = []
+    for model, *counts in histogram:
+        *buckets, count, total = counts
+        samples.extend(
+            ("_bucket", {"model": model, "le": bound}, n)
+            for bound, n in zip(LATENCY_BUCKETS, buckets)
+        )
+        samples.append(("_bucket", {"model": model, "le": "+Inf"}, count))
+        samples.append(("_sum", {"model": model}, round(total, 6)))
+        samples.append(("_count", {"model": model}, count))
+    metric("dpo_llm_latency_seconds", "histogram", "Latency of successful LLM calls", samples)
+
+    return "\n".join(lines) + "\n"
+
+def window_start(days=DEFAULT_WINDOW_DAYS):
+    return time.time() - days * 24 * 3600
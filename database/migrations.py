@@ -0,0 +1,750 @@
+import sqlite3
+
+from database.dedup import index_entries, unindexed_entries
+from database.stats import rebuild_stats
+from database.texts import CODEC_PLAIN, intern_texts, text_hash, unpack
+
+# Connection settings applied every time a connection is opened. WAL lets
+# readers run alongside a writer, and synchronous=NORMAL is durable in WAL
+# mode apart from the last transactions before a power loss.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+
+def _materialize_dataset_stats(conn):
+    # Per-dataset stats maintained by the write path, replacing the
+    # trigger-maintained datasets.entry_count from migration 3
+    for statement in (
+        """
+        CREATE TABLE IF NOT EXISTS dataset_stats (
+            dataset_id INTEGER PRIMARY KEY,
+            total_entries INTEGER NOT NULL DEFAULT 0,
+            unique_questions INTEGER NOT NULL DEFAULT 0,
+            first_entry TIMESTAMP,
+            last_entry TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS dataset_question_hashes (
+            dataset_id INTEGER,
+            question_hash BLOB,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (dataset_id, question_hash)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS dataset_length_histograms (
+            dataset_id INTEGER,
+            field TEXT,
+            bucket INTEGER,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (dataset_id, field, bucket)
+        ) WITHOUT ROWID
+        """,
+        "DROP TRIGGER IF EXISTS trg_entries_count_insert",
+        "DROP TRIGGER IF EXISTS trg_entries_count_delete",
+        "DROP TRIGGER IF EXISTS trg_entries_count_move",
+        "ALTER TABLE datasets DROP COLUMN entry_count",
+    ):
+        conn.execute(statement)
+    rebuild_stats(conn)
+
+# Reads a text id back as text inside triggers. Migration 10 used SQL
+# functions defined in Python; migration 13 replaced them with plain SQL.
+_TEXT_OF = "(SELECT CASE codec WHEN 0 THEN data ELSE dpo_text(codec, data) END FROM texts WHERE id = {})"
+_TEXT_ID_OF = "(SELECT id FROM texts WHERE hash = dpo_text_hash({}))"
+
+def _intern_new_texts():
+    return """
+        INSERT OR IGNORE INTO texts (hash, codec, data)
+        SELECT dpo_text_hash(value), dpo_text_codec(value), dpo_text_data(value)
+        FROM (SELECT NEW.question AS value UNION ALL SELECT NEW.response_a UNION ALL SELECT NEW.response_b)
+        WHERE value IS NOT NULL;
+    """
+
+def _content_addressed_texts(conn, batch_size=5000):
+    # Moves entry texts into the deduplicated, compressed texts table.
+    # entry_rows keeps the entry ids, so the FTS index, signatures and stats
+    # stay valid, and a view named entries with INSTEAD OF triggers keeps
+    # every existing query and writer working.
+    for statement in (
+        """
+        CREATE TABLE texts (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            codec INTEGER NOT NULL,
+            data NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE entry_rows (
+            id INTEGER PRIMARY KEY,
+            dataset_id INTEGER,
+            question_id INTEGER REFERENCES texts(id),
+            response_a_id INTEGER REFERENCES texts(id),
+            response_b_id INTEGER REFERENCES texts(id),
+            preferred TEXT,
+            status TEXT,
+            created_at TIMESTAMP,
+            FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+        )
+        """,
+    ):
+        conn.execute(statement)
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT id, dataset_id, question, response_a, response_b, preferred, status, created_at
+            FROM entries
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        text_ids = intern_texts(conn, [text for row in rows for text in row[2:5]])
+        conn.executemany(
+            """
+            INSERT INTO entry_rows
+            (id, dataset_id, question_id, response_a_id, response_b_id, preferred, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (row[0], row[1], *text_ids[3 * i:3 * i + 3], *row[5:])
+                for i, row in enumerate(rows)
+            ]
+        )
+
+    # Dropping the table also drops its indexes and triggers
+    for statement in (
+        "DROP TABLE entries",
+        "CREATE INDEX idx_entry_rows_dataset_created ON entry_rows (dataset_id, created_at)",
+        "CREATE INDEX idx_entry_rows_dataset_question ON entry_rows (dataset_id, question_id)",
+        f"""
+        CREATE VIEW entries AS
+        SELECT
+            r.id AS id,
+            r.dataset_id AS dataset_id,
+            {_TEXT_OF.format("r.question_id")} AS question,
+            {_TEXT_OF.format("r.response_a_id")} AS response_a,
+            {_TEXT_OF.format("r.response_b_id")} AS response_b,
+            r.preferred AS preferred,
+            r.status AS status,
+            r.created_at AS created_at
+        FROM entry_rows r
+        """,
+        f"""
+        CREATE TRIGGER trg_entries_insert INSTEAD OF INSERT ON entries
+        BEGIN
+            {_intern_new_texts()}
+            INSERT INTO entry_rows
+            (id, dataset_id, question_id, response_a_id, response_b_id, preferred, status, created_at)
+            VALUES (
+                NEW.id,
+                NEW.dataset_id,
+                {_TEXT_ID_OF.format("NEW.question")},
+                {_TEXT_ID_OF.format("NEW.response_a")},
+                {_TEXT_ID_OF.format("NEW.response_b")},
+                NEW.preferred,
+                NEW.status,
+                NEW.created_at
+            );
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_entries_update INSTEAD OF UPDATE ON entries
+        BEGIN
+            {_intern_new_texts()}
+            UPDATE entry_rows SET
+                dataset_id = NEW.dataset_id,
+                question_id = {_TEXT_ID_OF.format("NEW.question")},
+                response_a_id = {_TEXT_ID_OF.format("NEW.response_a")},
+                response_b_id = {_TEXT_ID_OF.format("NEW.response_b")},
+                preferred = NEW.preferred,
+                status = NEW.status,
+                created_at = NEW.created_at
+            WHERE id = OLD.id;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_entries_delete INSTEAD OF DELETE ON entries
+        BEGIN
+            DELETE FROM entry_rows WHERE id = OLD.id;
+        END
+        """,
+        # The full-text index and near-duplicate signatures now follow entry_rows
+        f"""
+        CREATE TRIGGER trg_entry_rows_fts_insert AFTER INSERT ON entry_rows
+        BEGIN
+            INSERT INTO entries_fts (rowid, question, response_a, response_b)
+            VALUES (
+                NEW.id,
+                {_TEXT_OF.format("NEW.question_id")},
+                {_TEXT_OF.format("NEW.response_a_id")},
+                {_TEXT_OF.format("NEW.response_b_id")}
+            );
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_entry_rows_fts_delete AFTER DELETE ON entry_rows
+        BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, question, response_a, response_b)
+            VALUES (
+                'delete',
+                OLD.id,
+                {_TEXT_OF.format("OLD.question_id")},
+                {_TEXT_OF.format("OLD.response_a_id")},
+                {_TEXT_OF.format("OLD.response_b_id")}
+            );
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_entry_rows_fts_update AFTER UPDATE OF question_id, response_a_id, response_b_id ON entry_rows
+        BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, question, response_a, response_b)
+            VALUES (
+                'delete',
+                OLD.id,
+                {_TEXT_OF.format("OLD.question_id")},
+                {_TEXT_OF.format("OLD.response_a_id")},
+                {_TEXT_OF.format("OLD.response_b_id")}
+            );
+            INSERT INTO entries_fts (rowid, question, response_a, response_b)
+            VALUES (
+                NEW.id,
+                {_TEXT_OF.format("NEW.question_id")},
+                {_TEXT_OF.format("NEW.response_a_id")},
+                {_TEXT_OF.format("NEW.response_b_id")}
+            );
+        END
+        """,
+        """
+        CREATE TRIGGER trg_entry_rows_minhash_delete AFTER DELETE ON entry_rows
+        BEGIN
+            DELETE FROM minhash_signatures WHERE entry_id = OLD.id;
+        END
+        """,
+    ):
+        conn.execute(statement)
+
+_PLAIN_TEXT_OF = "(SELECT data FROM texts WHERE id = {})"
+
+def _fts_triggers():
+    # The full-text index follows entry_rows, reading texts without Python
+    return (
+        f"""
+        CREATE TRIGGER trg_entry_rows_fts_insert AFTER INSERT ON entry_rows
+        BEGIN
+            INSERT INTO entries_fts (rowid, question, response_a, response_b)
+            VALUES (
+                NEW.id,
+                {_PLAIN_TEXT_OF.format("NEW.question_id")},
+                {_PLAIN_TEXT_OF.format("NEW.response_a_id")},
+                {_PLAIN_TEXT_OF.format("NEW.response_b_id")}
+            );
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_entry_rows_fts_delete AFTER DELETE ON entry_rows
+        BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, question, response_a, response_b)
+            VALUES (
+                'delete',
+                OLD.id,
+                {_PLAIN_TEXT_OF.format("OLD.question_id")},
+                {_PLAIN_TEXT_OF.format("OLD.response_a_id")},
+                {_PLAIN_TEXT_OF.format("OLD.response_b_id")}
+            );
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_entry_rows_fts_update AFTER UPDATE OF question_id, response_a_id, response_b_id ON entry_rows
+        BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, question, response_a, response_b)
+            VALUES (
+                'delete',
+                OLD.id,
+                {_PLAIN_TEXT_OF.format("OLD.question_id")},
+                {_PLAIN_TEXT_OF.format("OLD.response_a_id")},
+                {_PLAIN_TEXT_OF.format("OLD.response_b_id")}
+            );
+            INSERT INTO entries_fts (rowid, question, response_a, response_b)
+            VALUES (
+                NEW.id,
+                {_PLAIN_TEXT_OF.format("NEW.question_id")},
+                {_PLAIN_TEXT_OF.format("NEW.response_a_id")},
+                {_PLAIN_TEXT_OF.format("NEW.response_b_id")}
+            );
+        END
+        """,
+    )
+
+def _plain_sql_entries(conn, batch_size=1000):
+    # Makes the database readable without the app's SQL functions: texts
+    # are stored uncompressed, and the entries view and the full-text
+    # triggers read texts.data directly. Texts are hashed in Python, so the
+    # view no longer accepts inserts or text updates; insert_entry_rows
+    # writes entries. The full-text index already holds the decoded texts.
+    # Dropping the view also drops its triggers
+    for statement in (
+        "DROP TRIGGER trg_entry_rows_fts_insert",
+        "DROP TRIGGER trg_entry_rows_fts_delete",
+        "DROP TRIGGER trg_entry_rows_fts_update",
+        "DROP VIEW entries",
+    ):
+        conn.execute(statement)
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, codec, data FROM texts WHERE id > ? AND codec != ? ORDER BY id LIMIT ?",
+            (last_id, CODEC_PLAIN, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        conn.executemany(
+            "UPDATE texts SET codec = ?, data = ? WHERE id = ?",
+            [(CODEC_PLAIN, unpack(codec, data), text_id) for text_id, codec, data in rows]
+        )
+
+    for statement in (
+        f"""
+        CREATE VIEW entries AS
+        SELECT
+            r.id AS id,
+            r.dataset_id AS dataset_id,
+            {_PLAIN_TEXT_OF.format("r.question_id")} AS question,
+            {_PLAIN_TEXT_OF.format("r.response_a_id")} AS response_a,
+            {_PLAIN_TEXT_OF.format("r.response_b_id")} AS response_b,
+            r.preferred AS preferred,
+            r.status AS status,
+            r.created_at AS created_at
+        FROM entry_rows r
+        """,
+        """
+        CREATE TRIGGER trg_entries_insert INSTEAD OF INSERT ON entries
+        BEGIN
+            SELECT RAISE(ABORT, 'entries is a view; add entries through DatabaseManager');
+        END
+        """,
+        """
+        CREATE TRIGGER trg_entries_update INSTEAD OF UPDATE ON entries
+        BEGIN
+            SELECT RAISE(ABORT, 'entry texts cannot be updated through the entries view')
+            WHERE NEW.question IS NOT OLD.question
+                OR NEW.response_a IS NOT OLD.response_a
+                OR NEW.response_b IS NOT OLD.response_b;
+            UPDATE entry_rows SET
+                dataset_id = NEW.dataset_id,
+                preferred = NEW.preferred,
+                status = NEW.status,
+                created_at = NEW.created_at
+            WHERE id = OLD.id;
+        END
+        """,
+        """
+        CREATE TRIGGER trg_entries_delete INSTEAD OF DELETE ON entries
+        BEGIN
+            DELETE FROM entry_rows WHERE id = OLD.id;
+        END
+        """,
+    ) + _fts_triggers():
+        conn.execute(statement)
+
+def _backfill_minhash(conn):
+    # Indexes the entries saved before migration 5 created the near-duplicate
+    # index, so entry-time warnings also match older prompts. Entries saved
+    # since are indexed by the write path.
+    for dataset_id, entries in unindexed_entries(conn):
+        index_entries(conn, dataset_id, entries)
+
+def _length_bucket_of(text_id):
+    # stats.length_bucket in SQL: the number of powers of two up to the
+    # length, which is the length's bit_length
+    steps = " + ".join(f"(length(data) >= {2 ** k})" for k in range(32))
+    return f"coalesce((SELECT {steps} FROM texts WHERE id = {text_id}), 0)"
+
+def _stats_delete_trigger(conn):
+    # Takes deleted entries out of the materialized stats, however they
+    # were deleted. Questions are now counted by their texts.hash, which
+    # SQL can look up, so the stats are rebuilt under the new keys.
+    question_hash = (
+        f"coalesce((SELECT hash FROM texts WHERE id = OLD.question_id), X'{text_hash('').hex()}')"
+    )
+    histograms = "".join(
+        f"""
+            UPDATE dataset_length_histograms SET entries = entries - 1
+            WHERE dataset_id = OLD.dataset_id AND field = '{field}' AND bucket = {_length_bucket_of(column)};"""
+        for field, column in (
+            ("question", "OLD.question_id"),
+            ("chosen", "OLD.response_a_id"),
+            ("rejected", "OLD.response_b_id"),
+        )
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER trg_entry_rows_stats_delete AFTER DELETE ON entry_rows
+        BEGIN
+            UPDATE dataset_question_hashes SET entries = entries - 1
+            WHERE dataset_id = OLD.dataset_id AND question_hash = {question_hash};
+            UPDATE dataset_stats SET unique_questions = unique_questions - 1
+            WHERE dataset_id = OLD.dataset_id AND EXISTS (
+                SELECT 1 FROM dataset_question_hashes
+                WHERE dataset_id = OLD.dataset_id AND question_hash = {question_hash} AND entries <= 0
+            );
+            DELETE FROM dataset_question_hashes
+            WHERE dataset_id = OLD.dataset_id AND question_hash = {question_hash} AND entries <= 0;{histograms}
+            UPDATE dataset_stats SET
+                total_entries = total_entries - 1,
+                first_entry = CASE WHEN OLD.created_at <= first_entry
+                    THEN (SELECT min(created_at) FROM entry_rows WHERE dataset_id = OLD.dataset_id)
+                    ELSE first_entry END,
+                last_entry = CASE WHEN OLD.created_at >= last_entry
+                    THEN (SELECT max(created_at) FROM entry_rows WHERE dataset_id = OLD.dataset_id)
+                    ELSE last_entry END
+            WHERE dataset_id = OLD.dataset_id;
+        END
+        """
+    )
+    rebuild_stats(conn)
+
+# Migration N upgrades a database from user_version N-1 to N. Append new
+# steps to the end; never edit one that has shipped. Steps are SQL scripts,
+# or functions taking the connection for data migrations that need Python.
+# Version 1 uses IF NOT EXISTS so databases created before versioning
+# upgrade in place.
+MIGRATIONS = [
+    # 1: base schema
+    """
+    CREATE TABLE IF NOT EXISTS settings (
+        id INTEGER PRIMARY KEY,
+        key TEXT UNIQUE,
+        value TEXT,
+        updated_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS datasets (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE,
+        created_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        dataset_id INTEGER,
+        question TEXT,
+        response_a TEXT,
+        response_b TEXT,
+        preferred TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS quick_responses (
+        id INTEGER PRIMARY KEY,
+        text TEXT,
+        created_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS prompts (
+        id INTEGER PRIMARY KEY,
+        dataset_id INTEGER,
+        question TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+    );
+    """,
+    # 2: indexes for the per-dataset read paths
+    """
+    CREATE INDEX IF NOT EXISTS idx_entries_dataset_created ON entries (dataset_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_entries_dataset_question ON entries (dataset_id, question);
+    CREATE INDEX IF NOT EXISTS idx_prompts_dataset_status ON prompts (dataset_id, status);
+    CREATE INDEX IF NOT EXISTS idx_quick_responses_created ON quick_responses (created_at);
+    ANALYZE;
+    """,
+    # 3: per-dataset entry counts kept current by triggers, so paging UIs
+    # can show a total without counting rows
+    """
+    ALTER TABLE datasets ADD COLUMN entry_count INTEGER NOT NULL DEFAULT 0;
+
+    UPDATE datasets SET entry_count = (
+        SELECT COUNT(*) FROM entries WHERE entries.dataset_id = datasets.id
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_count_insert AFTER INSERT ON entries
+    BEGIN
+        UPDATE datasets SET entry_count = entry_count + 1 WHERE id = NEW.dataset_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_count_delete AFTER DELETE ON entries
+    BEGIN
+        UPDATE datasets SET entry_count = entry_count - 1 WHERE id = OLD.dataset_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_count_move AFTER UPDATE OF dataset_id ON entries
+    WHEN NEW.dataset_id IS NOT OLD.dataset_id
+    BEGIN
+        UPDATE datasets SET entry_count = entry_count - 1 WHERE id = OLD.dataset_id;
+        UPDATE datasets SET entry_count = entry_count + 1 WHERE id = NEW.dataset_id;
+    END;
+    """,
+    # 4: content-addressed cache of LLM completions (times are epoch seconds)
+    """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        model TEXT,
+        response TEXT,
+        created_at REAL,
+        last_used_at REAL,
+        hits INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at);
+    """,
+    # 5: MinHash signatures and LSH band buckets for near-duplicate prompts.
+    # Buckets of deleted entries are left behind and filtered out by joining
+    # on the signature, which the trigger removes.
+    """
+    CREATE TABLE IF NOT EXISTS minhash_signatures (
+        entry_id INTEGER PRIMARY KEY,
+        dataset_id INTEGER,
+        signature BLOB
+    );
+
+    CREATE TABLE IF NOT EXISTS lsh_buckets (
+        dataset_id INTEGER,
+        bucket INTEGER,
+        entry_id INTEGER,
+        PRIMARY KEY (dataset_id, bucket, entry_id)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_minhash_delete AFTER DELETE ON entries
+    BEGIN
+        DELETE FROM minhash_signatures WHERE entry_id = OLD.id;
+    END;
+    """,
+    # 6: full-text index over entries (external content, so the text is not
+    # stored twice), kept in sync by triggers and backfilled by 'rebuild'
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        question,
+        response_a,
+        response_b,
+        content='entries',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_fts_insert AFTER INSERT ON entries
+    BEGIN
+        INSERT INTO entries_fts (rowid, question, response_a, response_b)
+        VALUES (NEW.id, NEW.question, NEW.response_a, NEW.response_b);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_fts_delete AFTER DELETE ON entries
+    BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, question, response_a, response_b)
+        VALUES ('delete', OLD.id, OLD.question, OLD.response_a, OLD.response_b);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_entries_fts_update AFTER UPDATE OF question, response_a, response_b ON entries
+    BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, question, response_a, response_b)
+        VALUES ('delete', OLD.id, OLD.question, OLD.response_a, OLD.response_b);
+        INSERT INTO entries_fts (rowid, question, response_a, response_b)
+        VALUES (NEW.id, NEW.question, NEW.response_a, NEW.response_b);
+    END;
+
+    INSERT INTO entries_fts (entries_fts) VALUES ('rebuild');
+    """,
+    # 7: materialized per-dataset stats, backfilled from entries
+    _materialize_dataset_stats,
+    # 8: persistent generation jobs claimed by headless workers. A job
+    # created from an imported prompt is unique per prompt.
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        dataset_id INTEGER NOT NULL,
+        prompt_id INTEGER,
+        question TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        lease_expires REAL,
+        entry_id INTEGER,
+        error TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+    CREATE INDEX IF NOT EXISTS idx_jobs_dataset_status ON jobs (dataset_id, status);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_prompt ON jobs (prompt_id) WHERE prompt_id IS NOT NULL;
+    """,
+    # 9: one row per LLM call for latency, token and cost reporting.
+    # created_at is a unix timestamp, like llm_cache.
+    """
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id INTEGER PRIMARY KEY,
+        created_at REAL NOT NULL,
+        model TEXT NOT NULL,
+        dataset_id INTEGER,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        latency REAL,
+        ttft REAL,
+        retries INTEGER NOT NULL DEFAULT 0,
+        streamed INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at);
+    CREATE INDEX IF NOT EXISTS idx_llm_calls_model_created ON llm_calls (model, created_at);
+    """,
+    # 10: entry texts deduplicated and compressed in a texts table; entries
+    # becomes a view over entry_rows with the same columns
+    _content_addressed_texts,
+    # 11: export watermarks per dataset and target, and a log of entries
+    # that delta exports must resend: updated entries, and new entries
+    # whose id is not above a watermark because a deleted id was reused.
+    # Nothing is logged for datasets that were never exported.
+    """
+    CREATE TABLE IF NOT EXISTS export_history (
+        id INTEGER PRIMARY KEY,
+        dataset_id INTEGER NOT NULL,
+        target TEXT NOT NULL,
+        format TEXT,
+        mode TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        last_entry_id INTEGER NOT NULL,
+        last_change_id INTEGER NOT NULL,
+        last_created_at TIMESTAMP,
+        exported_at TIMESTAMP,
+        FOREIGN KEY (dataset_id) REFERENCES datasets(id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_export_history_target ON export_history (dataset_id, target, id);
+    CREATE INDEX IF NOT EXISTS idx_export_history_watermark ON export_history (dataset_id, last_entry_id);
+
+    CREATE TABLE IF NOT EXISTS entry_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dataset_id INTEGER NOT NULL,
+        entry_id INTEGER NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_entry_changes_dataset ON entry_changes (dataset_id, id);
+
+    CREATE TRIGGER IF NOT EXISTS trg_entry_rows_changes_update AFTER UPDATE ON entry_rows
+    WHEN EXISTS (SELECT 1 FROM export_history WHERE dataset_id = NEW.dataset_id)
+    BEGIN
+        INSERT INTO entry_changes (dataset_id, entry_id) VALUES (NEW.dataset_id, NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_entry_rows_changes_reused AFTER INSERT ON entry_rows
+    WHEN NEW.id <= (SELECT MAX(last_entry_id) FROM export_history WHERE dataset_id = NEW.dataset_id)
+    BEGIN
+        INSERT INTO entry_changes (dataset_id, entry_id) VALUES (NEW.dataset_id, NEW.id);
+    END;
+    """,
+    # 12: a version per table, bumped by triggers on every change, so
+    # in-process caches notice writes made by other processes
+    """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+
+    INSERT OR IGNORE INTO table_versions (name) VALUES ('quick_responses');
+
+    CREATE TRIGGER IF NOT EXISTS trg_quick_responses_version_insert AFTER INSERT ON quick_responses
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'quick_responses';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_quick_responses_version_update AFTER UPDATE ON quick_responses
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'quick_responses';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_quick_responses_version_delete AFTER DELETE ON quick_responses
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'quick_responses';
+    END;
+    """,
+    # 13: entries readable with plain SQL; texts stored uncompressed
+    _plain_sql_entries,
+    # 14: near-duplicate signatures for entries older than the index
+    _backfill_minhash,
+    # 15: deleting entries updates the dataset stats
+    _stats_delete_trigger,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+def apply_pragmas(conn):
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _statements(script):
+    # Splits a migration script into statements; complete_statement knows
+    # that the semicolons inside a trigger body do not end the statement
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+    if statement.strip():
+        yield statement
+
+def _check_version(version):
+    if version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code supports ({LATEST_VERSION})"
+        )
+
+def migrate(conn, target=LATEST_VERSION):
+    # Applies each pending migration in its own transaction, bumping
+    # user_version in the same transaction so a failed step can be retried.
+    # Several processes may open the same database at once (the UI, workers,
+    # the API), so every step takes the write lock first and re-reads the
+    # version under it: a step another process applied meanwhile is skipped.
+    _check_version(get_schema_version(conn))
+
+    conn.commit()
+    for number in range(get_schema_version(conn) + 1, target + 1):
+        step = MIGRATIONS[number - 1]
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            version = get_schema_version(conn)
+            _check_version(version)
+            if version >= number:
+                conn.commit()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for statement in _statements(step):
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    return get_schema_version(conn)
@@ -0,0 +1,113 @@
+import bisect
+import threading
+import unicodedata
+from collections import Counter
+
+DEFAULT_PAGE_SIZE = 20
+MIN_SIMILARITY = 0.3
+TRIGRAM_SIZE = 3
+
+def normalize(text):
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+def trigrams(text):
+    # Padded so short queries and word starts still produce trigrams
+    padded = f"  {text} "
+    return {padded[i:i + TRIGRAM_SIZE] for i in range(len(padded) - TRIGRAM_SIZE + 1)}
+
+class QuickResponseIndex:
+    # In-memory snapshot of the quick_responses table. Rows keep the
+    # table's newest-first order; a sorted list of normalized texts answers
+    # prefix queries by bisection and an inverted trigram index finds fuzzy
+    # matches without scanning every response.
+    def __init__(self, rows):
+        # rows is a list of (id, text, created_at), newest first
+        self.rows = rows
+        self._normalized = [normalize(row[1]) for row in rows]
+        self._sorted = sorted((text, position) for position, text in enumerate(self._normalized))
+        self._sorted_texts = [text for text, _ in self._sorted]
+        self._trigrams = {}
+        self._trigram_counts = []
+        for position, text in enumerate(self._normalized):
+            grams = trigrams(text)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._trigrams.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query="", limit=DEFAULT_PAGE_SIZE, offset=0, min_similarity=MIN_SIMILARITY):
+        # Returns (rows, total_matches). Prefix matches come first, in
+        # alphabetical order, followed by substring and trigram matches
+        # ranked by similarity; an empty query pages through everything.
+        query = normalize(query)
+        if not query:
+            positions = range(len(self.rows))
+        else:
+            positions = self._match(query, min_similarity)
+        total = len(positions)
+        page = positions[offset:offset + limit] if limit is not None else positions[offset:]
+        return [self.rows[position] for position in page], total
+
+    def _match(self, query, min_similarity):
+        start = bisect.bisect_left(self._sorted_texts, query)
+        prefix = []
+        for text, position in self._sorted[start:]:
+            if not text.startswith(query):
+                break
+            prefix.append(position)
+        seen = set(prefix)
+
+        # Dice coefficient between the trigram sets, from posting list counts
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._trigrams.get(gram, ()))
+        scored = []
+        for position, count in shared.items():
+            if position in seen:
+                continue
+            score = 2 * count / (len(query_grams) + self._trigram_counts[position])
+            if query in self._normalized[position]:
+                # Substring matches rank above every purely fuzzy match
+                score += 1
+            if score >= min_similarity:
+                scored.append((-score, position))
+        scored.sort()
+        return prefix + [position for _, position in scored]
+
+class QuickResponseStore:
+    # Caches the quick_responses table for a DatabaseManager, so reruns and
+    # multiple selectboxes share one snapshot. Every read first checks the
+    # table's version, which triggers bump on any change, so writes from
+    # other processes (the API service, main.py, another Streamlit server)
+    # are picked up as well; the check is a single primary key lookup.
+    def __init__(self, db):
+        self.db = db
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def index(self):
+        with self._lock:
+            conn = self.db.conn
+            version = conn.execute(
+                "SELECT version FROM table_versions WHERE name = 'quick_responses'"
+            ).fetchone()
+            if self._index is None or version != self._version:
+                # Read after the version, so a concurrent write can only
+                # make the snapshot newer than the version it is stored with
+                rows = conn.execute(
+                    "SELECT id, text, created_at FROM quick_responses ORDER BY created_at DESC, id DESC"
+                ).fetchall()
+                self._index = QuickResponseIndex(rows)
+                self._version = version
+            return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def search(self, query="", limit=DEFAULT_PAGE_SIZE, offset=0):
+        return self.index().search(query, limit, offset)
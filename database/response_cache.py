@@ -0,0 +1,124 @@
+import hashlib
+import json
+import threading
+import time
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+# Hit counts and last-used times are written in batches, once this many
+# keys were hit or this many seconds passed
+HIT_FLUSH_SIZE = 100
+HIT_FLUSH_INTERVAL = 30.0
+
+class ResponseCache:
+    # LLM completions stored in the llm_cache table, keyed by a hash of
+    # everything that determines the output. Entries expire after `ttl`
+    # seconds (None disables expiry) and the least recently used rows are
+    # evicted once the table holds more than `max_entries`.
+    def __init__(self, db, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (last hit time, hits) not written yet
+        self._hits = {}
+        self._flushed_at = time.time()
+
+    @staticmethod
+    def make_key(model, system_prompt, question, params=None):
+        payload = json.dumps(
+            [model, system_prompt, question, params or {}],
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        # Reads only. Hits are counted in memory and written with the next
+        # flush, so a cache hit never waits for the write lock.
+        now = time.time()
+        row = self.db.conn.execute(
+            "SELECT response, created_at FROM llm_cache WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+        if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+            self.db.submit_write(lambda: self.db.conn.execute(
+                "DELETE FROM llm_cache WHERE key = ? AND created_at = ?",
+                (key, row[1])
+            ))
+            row = None
+
+        if row is None:
+            self._count(hit=False)
+            return None
+
+        self._count(hit=True, key=key, now=now)
+        if len(self._hits) >= HIT_FLUSH_SIZE or now - self._flushed_at >= HIT_FLUSH_INTERVAL:
+            self.flush_hits()
+        return row[0]
+
+    def put(self, key, model, response):
+        # Queued without waiting when the database has a writer thread.
+        # Pending hits go first, so eviction sees recent use.
+        self.flush_hits()
+        now = time.time()
+
+        def write():
+            conn = self.db.conn
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+                """,
+                (key, model, response, now, now)
+            )
+            self._evict(conn, now)
+
+        self.db.submit_write(write)
+
+    def flush_hits(self):
+        # Writes the hits counted since the last flush in one write
+        with self._lock:
+            hits, self._hits = self._hits, {}
+            self._flushed_at = time.time()
+        if hits:
+            self.db.submit_write(lambda: self.db.conn.executemany(
+                "UPDATE llm_cache SET last_used_at = max(last_used_at, ?), hits = hits + ? WHERE key = ?",
+                [(used_at, count, key) for key, (used_at, count) in hits.items()]
+            ))
+
+    def _evict(self, conn, now):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            excess = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    """
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_used_at LIMIT ?
+                    )
+                    """,
+                    (excess,)
+                )
+
+    def _count(self, hit, key=None, now=None):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                _, count = self._hits.get(key, (now, 0))
+                self._hits[key] = (now, count + 1)
+            else:
+                self.misses += 1
+
+    def stats(self):
+        entries = self.db.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def clear(self):
+        with self._lock:
+            self._hits = {}
+        self.db.write(lambda: self.db.conn.execute("DELETE FROM llm_cache"))
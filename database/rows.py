@@ -0,0 +1,64 @@
+from itertools import starmap
+
+# Compact read results. Row classes use __slots__, so a row costs one small
+# object instead of a dict or a DataFrame slice, and pandas is only imported
+# when a caller explicitly asks for a DataFrame.
+
+class Row:
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        # Each row type gets an __init__ with one plain assignment per field,
+        # as dataclasses generates; a setattr loop makes reading large
+        # result sets noticeably slower than building a DataFrame
+        super().__init_subclass__(**kwargs)
+        fields = cls.__slots__
+        source = f"def __init__(self, {', '.join(fields)}):\n" + "".join(
+            f"    self.{field} = {field}\n" for field in fields
+        )
+        namespace = {}
+        exec(source, namespace)
+        cls.__init__ = namespace["__init__"]
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class Dataset(Row):
+    __slots__ = ("id", "name", "created_at")
+
+class Entry(Row):
+    __slots__ = ("id", "question", "response_a", "response_b", "preferred", "created_at")
+
+class QuickResponse(Row):
+    __slots__ = ("id", "text", "created_at")
+
+class SearchHit(Row):
+    __slots__ = ("id", "dataset", "question", "response_a", "response_b", "score")
+
+def iter_rows(c, row_type=None, batch_size=1000):
+    # Yields the cursor's rows as row_type objects, or as the plain tuples
+    # sqlite3 returns if row_type is None, fetching batch_size at a time
+    try:
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from (rows if row_type is None else starmap(row_type, rows))
+    finally:
+        c.close()
+
+def to_frame(rows, columns):
+    # rows may be tuples or Row objects
+    import pandas as pd
+
+    return pd.DataFrame.from_records([tuple(row) for row in rows], columns=list(columns))
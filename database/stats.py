@@ -0,0 +1,138 @@
+from collections import Counter
+
+from database.texts import text_hash
+
+# Length histograms use power-of-two buckets: bucket k counts texts with
+# 2**(k-1) <= len < 2**k characters (bucket 0 is the empty string).
+# Questions are counted by the hash the texts table stores them under, so
+# the delete trigger from migration 15 can take entries out of the stats in
+# plain SQL.
+HISTOGRAM_FIELDS = ("question", "chosen", "rejected")
+
+def question_hash(question):
+    return text_hash(question or "")
+
+def length_bucket(text):
+    return len(text or "").bit_length()
+
+def bucket_label(bucket):
+    if bucket == 0:
+        return "0"
+    return f"{2 ** (bucket - 1)}-{2 ** bucket - 1}"
+
+def record_entries(conn, dataset_id, rows):
+    # Folds newly inserted entries into the dataset's materialized stats.
+    # rows is a list of (question, chosen, rejected, created_at); runs in
+    # the caller's transaction so stats and entries commit together.
+    if not rows:
+        return
+
+    hashes = Counter(question_hash(row[0]) for row in rows)
+    c = conn.executemany(
+        """
+        INSERT OR IGNORE INTO dataset_question_hashes (dataset_id, question_hash, entries)
+        VALUES (?, ?, 0)
+        """,
+        [(dataset_id, digest) for digest in hashes]
+    )
+    new_questions = c.rowcount
+    conn.executemany(
+        """
+        UPDATE dataset_question_hashes SET entries = entries + ?
+        WHERE dataset_id = ? AND question_hash = ?
+        """,
+        [(count, dataset_id, digest) for digest, count in hashes.items()]
+    )
+
+    histogram = Counter()
+    for row in rows:
+        for field, text in zip(HISTOGRAM_FIELDS, row[:3]):
+            histogram[field, length_bucket(text)] += 1
+    conn.executemany(
+        """
+        INSERT INTO dataset_length_histograms (dataset_id, field, bucket, entries)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (dataset_id, field, bucket) DO UPDATE SET entries = entries + excluded.entries
+        """,
+        [(dataset_id, field, bucket, count) for (field, bucket), count in histogram.items()]
+    )
+
+    timestamps = [row[3] for row in rows if row[3] is not None]
+    conn.execute(
+        """
+        INSERT INTO dataset_stats (dataset_id, total_entries, unique_questions, first_entry, last_entry)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (dataset_id) DO UPDATE SET
+            total_entries = total_entries + excluded.total_entries,
+            unique_questions = unique_questions + excluded.unique_questions,
+            first_entry = min(
+                coalesce(first_entry, excluded.first_entry),
+                coalesce(excluded.first_entry, first_entry)
+            ),
+            last_entry = max(
+                coalesce(last_entry, excluded.last_entry),
+                coalesce(excluded.last_entry, last_entry)
+            )
+        """,
+        (
+            dataset_id,
+            len(rows),
+            new_questions,
+            min(timestamps) if timestamps else None,
+            max(timestamps) if timestamps else None
+        )
+    )
+
+def rebuild_stats(conn, batch_size=5000):
+    # Recomputes every dataset's stats from entries; the caller commits
+    conn.execute("DELETE FROM dataset_stats")
+    conn.execute("DELETE FROM dataset_question_hashes")
+    conn.execute("DELETE FROM dataset_length_histograms")
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT id, dataset_id, question, response_a, response_b, created_at
+            FROM entries
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        by_dataset = {}
+        for _, dataset_id, question, chosen, rejected, created_at in rows:
+            by_dataset.setdefault(dataset_id, []).append((question, chosen, rejected, created_at))
+        for dataset_id, dataset_rows in by_dataset.items():
+            record_entries(conn, dataset_id, dataset_rows)
+
+def read_stats(conn, dataset_id):
+    row = conn.execute(
+        """
+        SELECT total_entries, unique_questions, first_entry, last_entry
+        FROM dataset_stats
+        WHERE dataset_id = ?
+        """,
+        (dataset_id,)
+    ).fetchone()
+    return row if row else (0, 0, None, None)
+
+def read_histograms(conn, dataset_id):
+    # {field: [(bucket label, entries), ...]} in ascending length order
+    histograms = {field: [] for field in HISTOGRAM_FIELDS}
+    rows = conn.execute(
+        """
+        SELECT field, bucket, entries
+        FROM dataset_length_histograms
+        WHERE dataset_id = ? AND entries > 0
+        ORDER BY field, bucket
+        """,
+        (dataset_id,)
+    )
+    for field, bucket, entries in rows:
+        histograms[field].append((bucket_label(bucket), entries))
+    return histograms
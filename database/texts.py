@@ -0,0 +1,93 @@
+import hashlib
+import zlib
+
+# Entry texts are stored once per distinct content in the texts table, keyed
+# by a hash of the text, and entry_rows references them by id. The entries
+# view reassembles the original rows in plain SQL, so readers see the same
+# columns as before and the database stays readable from the sqlite3 CLI and
+# other tools. Hashing needs Python, so the view accepts no inserts: new
+# entries go through insert_entry_rows.
+# Databases from before migration 13 may hold zlib-compressed texts
+# (CODEC_ZLIB); that migration stores them as plain text again.
+CODEC_PLAIN = 0
+CODEC_ZLIB = 1
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def unpack(codec, data):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    return data
+
+def intern_texts(conn, texts):
+    # Returns the text id of every item in `texts` (None stays None),
+    # inserting only contents not stored yet. The caller commits.
+    digests = {}
+    for text in texts:
+        if text is not None and text not in digests:
+            digests[text] = text_hash(text)
+
+    ids = {}
+    by_digest = {digest: text for text, digest in digests.items()}
+
+    def lookup(digest_list):
+        for start in range(0, len(digest_list), LOOKUP_BATCH_SIZE):
+            chunk = digest_list[start:start + LOOKUP_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT hash, id FROM texts WHERE hash IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for digest, text_id in rows:
+                ids[by_digest[digest]] = text_id
+
+    lookup(list(by_digest))
+    missing = [text for text in digests if text not in ids]
+    if missing:
+        # OR IGNORE: another connection may have stored the same text since the lookup
+        conn.executemany(
+            "INSERT OR IGNORE INTO texts (hash, codec, data) VALUES (?, ?, ?)",
+            [(digests[text], CODEC_PLAIN, text) for text in missing]
+        )
+        lookup([digests[text] for text in missing])
+
+    return [None if text is None else ids[text] for text in texts]
+
+def insert_entry_rows(conn, rows):
+    # rows is a list of (dataset_id, question, response_a, response_b,
+    # preferred, status, created_at). Returns the id of the first inserted
+    # entry. The caller commits.
+    flat = [text for row in rows for text in row[1:4]]
+    text_ids = intern_texts(conn, flat)
+    c = conn.executemany(
+        """
+        INSERT INTO entry_rows
+        (dataset_id, question_id, response_a_id, response_b_id, preferred, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (row[0], *text_ids[3 * i:3 * i + 3], *row[4:])
+            for i, row in enumerate(rows)
+        ]
+    )
+    # The write lock is held for the whole statement and new rowids are
+    # max(id) + 1, so the inserted ids are the last rowcount ids
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return last_id - c.rowcount + 1
+
+def delete_unused_texts(conn):
+    # Texts are shared, so deleting entries leaves them behind; this removes
+    # the ones no entry references. The caller commits.
+    c = conn.execute(
+        """
+        DELETE FROM texts WHERE id NOT IN (
+            SELECT question_id FROM entry_rows WHERE question_id IS NOT NULL
+            UNION SELECT response_a_id FROM entry_rows WHERE response_a_id IS NOT NULL
+            UNION SELECT response_b_id FROM entry_rows WHERE response_b_id IS NOT NULL
+        )
+        """
+    )
+    return c.rowcount
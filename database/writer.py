@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Writes from many threads (one Streamlit script thread per annotator) each
+# opened their own write transaction, so they queued on SQLite's file lock,
+# hit "database is locked" after the busy timeout and committed one by one.
+# A WriteQueue funnels them through one thread that owns the only write
+# connection: everything queued, plus what arrives within an optional
+# window when writers are concurrent, runs in a single transaction. Each operation
+# gets its own savepoint so a failing one doesn't take the rest of the group
+# with it, and callers get results or exceptions back through futures once
+# the group has committed.
+
+# Writes queued while a group commits form the next group, so groups grow
+# with load by themselves. A window above zero also waits for stragglers;
+# with WAL and synchronous=NORMAL a commit is cheaper than that wait, so it
+# only pays off where commits are slow.
+GROUP_COMMIT_WINDOW = 0.0
+MAX_GROUP_SIZE = 256
+
+_STOP = object()
+
+class WriteQueue:
+    # `connect` is called on the writer thread and returns its connection;
+    # `release` (optional) is called there when the queue is closed.
+    # Operations are callables that write through that connection and must
+    # not commit or roll back themselves.
+    def __init__(self, connect, release=None, window=GROUP_COMMIT_WINDOW, max_group=MAX_GROUP_SIZE):
+        self._connect = connect
+        self._release = release
+        self.window = window
+        self.max_group = max_group
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.writes = 0
+        self.commits = 0
+
+    def submit(self, op):
+        # Returns a Future for op's result
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # An operation submitting another would wait on itself; it is
+            # already inside the group's transaction, so just run it
+            self._run_inline(op, future)
+            return future
+        self._start()
+        self._queue.put((op, future))
+        return future
+
+    def call(self, op):
+        return self.submit(op).result()
+
+    def close(self, timeout=None):
+        # Commits everything queued so far, then stops the thread
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+        with self._lock:
+            self._thread = None
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "commits": self.commits,
+            "pending": self._queue.qsize(),
+        }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                group, stop = self._collect(item)
+                self._commit_group(conn, group)
+                if stop:
+                    break
+        finally:
+            if self._release is not None:
+                self._release()
+
+    def _collect(self, first):
+        # The first operation plus whatever is already queued. Only when
+        # others were queued too, i.e. writers are actually concurrent, does
+        # the group wait out the window for more: a lone writer would
+        # otherwise pay the window on every write.
+        group = [first]
+        deadline = None
+        while len(group) < self.max_group:
+            try:
+                if deadline is None:
+                    item = self._queue.get_nowait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                if deadline is not None or len(group) == 1 or not self.window:
+                    break
+                deadline = time.monotonic() + self.window
+                continue
+            if item is _STOP:
+                return group, True
+            group.append(item)
+        return group, False
+
+    def _commit_group(self, conn, group):
+        outcomes = []
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = op()
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((future, result, None))
+            conn.commit()
+        except Exception as e:
+            # Nothing in the group was committed
+            if conn.in_transaction:
+                conn.rollback()
+            for op, future in group:
+                if not future.done():
+                    if not future.running():
+                        future.set_running_or_notify_cancel()
+                    future.set_exception(e)
+            return
+
+        self.writes += len(outcomes)
+        self.commits += 1
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _run_inline(self, op, future):
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(op())
+        except Exception as e:
+            future.set_exception(e)
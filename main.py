@@ -1,51 +1,31 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
-import json
-from datetime import datetime
 import os
-from openai import OpenAI
+from database.exporter import EXPORT_FORMATS, TRAINING_EXPORT_COLUMNS, export_to_tempfile
+from database.connection import get_connection_manager
+from database.db_manager import DatabaseManager
+from database.rows import to_frame
+from services.clients import get_client
+from services.rate_limit import call_with_retries
 
 # Initialize OpenAI client
 def init_openai():
     api_key = st.secrets["openai"]["api_key"] if "openai" in st.secrets else st.session_state.get('openai_api_key')
     if api_key:
-        return OpenAI(api_key=api_key, base_url="https://api.openai-hk.com/v1")
+        # Reuses the process-wide client and its keep-alive connections
+        return get_client(api_key, base_url="https://api.openai-hk.com/v1")
     return None
 
 # Initialize SQLite database
 def init_db():
-    conn = sqlite3.connect('dpo_data.db')
-    c = conn.cursor()
-    
-    # Create necessary tables if they don't exist
-    c.executescript('''
-        CREATE TABLE IF NOT EXISTS datasets (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE,
-            created_at TIMESTAMP
-        );
-        
-        CREATE TABLE IF NOT EXISTS entries (
-            id INTEGER PRIMARY KEY,
-            dataset_id INTEGER,
-            question TEXT,
-            response_a TEXT,
-            response_b TEXT,
-            preferred TEXT,
-            status TEXT,
-            created_at TIMESTAMP,
-            FOREIGN KEY (dataset_id) REFERENCES datasets(id)
-        );
-        
-        CREATE TABLE IF NOT EXISTS quick_responses (
-            id INTEGER PRIMARY KEY,
-            text TEXT,
-            created_at TIMESTAMP
-        );
-    ''')
-    conn.commit()
-    return conn
+    # The manager is process-wide, so the schema is migrated once and the
+    # connection is reused by later reruns on this thread
+    return get_connection_manager('dpo_data.db').connection()
+
+@st.cache_resource
+def get_database():
+    # Writes go through DatabaseManager, so entries update the dataset stats
+    # and the near-duplicate index, and every write shares one writer thread
+    return DatabaseManager('dpo_data.db', single_writer=True)
 
 # Page configurations
 st.set_page_config(page_title="DPO Data Generation", layout="wide")
@@ -79,11 +59,11 @@ with st.sidebar:
     
     if dataset_action == "Select Dataset":
         # Load existing datasets
-        datasets = pd.read_sql("SELECT * FROM datasets", conn)
-        if not datasets.empty:
+        dataset_names = [name for (name,) in conn.execute("SELECT name FROM datasets ORDER BY id")]
+        if dataset_names:
             selected_dataset = st.selectbox(
                 "Choose Dataset",
-                datasets['name'].tolist()
+                dataset_names
             )
             if st.button("Load Dataset"):
                 st.session_state.current_dataset = selected_dataset
@@ -96,34 +76,27 @@ with st.sidebar:
         new_dataset_name = st.text_input("Dataset Name")
         if st.button("Create Dataset"):
             if new_dataset_name:
-                try:
-                    c = conn.cursor()
-                    c.execute(
-                        "INSERT INTO datasets (name, created_at) VALUES (?, ?)",
-                        (new_dataset_name, datetime.now())
-                    )
-                    conn.commit()
+                if get_database().create_dataset(new_dataset_name):
                     st.success("Dataset created successfully!")
-                except sqlite3.IntegrityError:
+                else:
                     st.error("Dataset name already exists!")
             else:
                 st.error("Please enter a dataset name!")
     
     else:  # View Entries
         if st.session_state.current_dataset:
-            entries = pd.read_sql(
+            entries = conn.execute(
                 """
-                SELECT question, response_a, response_b, preferred, created_at
+                SELECT e.question, e.response_a, e.response_b, e.preferred, e.created_at
                 FROM entries e
                 JOIN datasets d ON e.dataset_id = d.id
                 WHERE d.name = ?
                 ORDER BY e.created_at DESC
                 """,
-                conn,
-                params=(st.session_state.current_dataset,)
-            )
-            if not entries.empty:
-                st.dataframe(entries)
+                (st.session_state.current_dataset,)
+            ).fetchall()
+            if entries:
+                st.dataframe(to_frame(entries, ["question", "response_a", "response_b", "preferred", "created_at"]))
             else:
                 st.info("No entries in this dataset yet!")
         else:
@@ -155,11 +128,11 @@ if st.session_state.current_dataset:
                 response_a = st.text_area("Enter Response A", height=200)
             elif generation_method_a == "Quick Response":
                 # Load quick responses
-                quick_responses = pd.read_sql("SELECT * FROM quick_responses", conn)
-                if not quick_responses.empty:
+                quick_responses = [text for (text,) in conn.execute("SELECT text FROM quick_responses")]
+                if quick_responses:
                     response_a = st.selectbox(
                         "Select Quick Response",
-                        quick_responses['text'].tolist(),
+                        quick_responses,
                         key="quick_a"
                     )
                 else:
@@ -171,13 +144,14 @@ if st.session_state.current_dataset:
                         client = init_openai()
                         if client:
                             try:
-                                response = client.chat.completions.create(
+                                # Registry clients don't retry on their own
+                                response = call_with_retries(lambda: client.chat.completions.create(
                                     model="gpt-4-turbo-preview",
                                     messages=[
                                         {"role": "system", "content": "You are a helpful AI assistant. Generate a high-quality response to the user's question."},
                                         {"role": "user", "content": question}
                                     ]
-                                )
+                                ))
                                 response_a = response.choices[0].message.content
                                 st.text_area("Generated Response A", response_a, height=200)
                             except Exception as e:
@@ -197,10 +171,10 @@ if st.session_state.current_dataset:
             if generation_method_b == "Human Input":
                 response_b = st.text_area("Enter Response B", height=200)
             elif generation_method_b == "Quick Response":
-                if not quick_responses.empty:
+                if quick_responses:
                     response_b = st.selectbox(
                         "Select Quick Response",
-                        quick_responses['text'].tolist(),
+                        quick_responses,
                         key="quick_b"
                     )
                 else:
@@ -212,13 +186,13 @@ if st.session_state.current_dataset:
                         client = init_openai()
                         if client:
                             try:
-                                response = client.chat.completions.create(
+                                response = call_with_retries(lambda: client.chat.completions.create(
                                     model="gpt-3.5-turbo",  # Using 3.5 for worse responses
                                     messages=[
                                         {"role": "system", "content": "Generate a less detailed or lower quality response to the user's question."},
                                         {"role": "user", "content": question}
                                     ]
-                                )
+                                ))
                                 response_b = response.choices[0].message.content
                                 st.text_area("Generated Response B", response_b, height=200)
                             except Exception as e:
@@ -230,27 +204,7 @@ if st.session_state.current_dataset:
         # Save entry
         if st.button("Save DPO Entry"):
             if question and response_a and response_b:
-                c = conn.cursor()
-                c.execute(
-                    """
-                    INSERT INTO entries 
-                    (dataset_id, question, response_a, response_b, preferred, status, created_at)
-                    VALUES (
-                        (SELECT id FROM datasets WHERE name = ?),
-                        ?, ?, ?, ?, ?, ?
-                    )
-                    """,
-                    (
-                        st.session_state.current_dataset,
-                        question,
-                        response_a,
-                        response_b,
-                        "A",  # Always prefer A as it's the better response
-                        "active",
-                        datetime.now()
-                    )
-                )
-                conn.commit()
+                get_database().save_entry(st.session_state.current_dataset, question, response_a, response_b)
                 st.success("DPO entry saved successfully!")
             else:
                 st.error("Please fill in all fields (question and both responses)!")
@@ -265,32 +219,27 @@ if st.session_state.current_dataset:
         
         if st.button("Add Quick Response"):
             if qr_text:
-                c = conn.cursor()
-                c.execute(
-                    "INSERT INTO quick_responses (text, created_at) VALUES (?, ?)",
-                    (qr_text, datetime.now())
-                )
-                conn.commit()
+                get_database().add_quick_response(qr_text)
                 st.success("Quick response added!")
             else:
                 st.error("Please enter response text!")
         
         # View existing quick responses
         st.subheader("Existing Quick Responses")
-        quick_responses = pd.read_sql("SELECT * FROM quick_responses", conn)
-        if not quick_responses.empty:
-            st.dataframe(quick_responses[['text', 'created_at']])
+        quick_responses = conn.execute("SELECT id, text, created_at FROM quick_responses").fetchall()
+        if quick_responses:
+            st.dataframe(to_frame([row[1:] for row in quick_responses], ["text", "created_at"]))
             
             # Delete quick response
             if st.button("Delete Selected Quick Response"):
                 selected_response = st.selectbox(
                     "Select response to delete",
-                    quick_responses['text'].tolist()
+                    [text for _, text, _ in quick_responses]
                 )
                 if selected_response:
-                    c = conn.cursor()
-                    c.execute("DELETE FROM quick_responses WHERE text = ?", (selected_response,))
-                    conn.commit()
+                    for response_id, text, _ in quick_responses:
+                        if text == selected_response:
+                            get_database().delete_quick_response(response_id)
                     st.success("Quick response deleted!")
     
     # Export Tab
@@ -299,41 +248,34 @@ if st.session_state.current_dataset:
         
         export_format = st.selectbox(
             "Export Format",
-            ["JSON", "CSV"]
+            list(EXPORT_FORMATS)
         )
         
         if st.button("Export"):
-            entries = pd.read_sql(
-                """
-                SELECT question, response_a as chosen, response_b as rejected
-                FROM entries e
-                JOIN datasets d ON e.dataset_id = d.id
-                WHERE d.name = ?
-                """,
+            # Stream rows to a temp file instead of materializing the dataset
+            path, count = export_to_tempfile(
                 conn,
-                params=(st.session_state.current_dataset,)
+                st.session_state.current_dataset,
+                export_format,
+                TRAINING_EXPORT_COLUMNS
             )
-            
-            if not entries.empty:
-                if export_format == "JSON":
-                    st.download_button(
-                        "Download JSON",
-                        entries.to_json(orient='records'),
-                        f"{st.session_state.current_dataset}.json",
-                        "application/json"
-                    )
-                else:  # CSV
-                    st.download_button(
-                        "Download CSV",
-                        entries.to_csv(index=False),
-                        f"{st.session_state.current_dataset}.csv",
-                        "text/csv"
-                    )
-            else:
-                st.warning("No entries to export!")
+            try:
+                if count:
+                    extension, mime = EXPORT_FORMATS[export_format]
+                    with open(path, "rb") as f:
+                        st.download_button(
+                            f"Download {export_format}",
+                            f,
+                            f"{st.session_state.current_dataset}.{extension}",
+                            mime
+                        )
+                else:
+                    st.warning("No entries to export!")
+            finally:
+                os.remove(path)
 
 else:
     st.info("Please select or create a dataset from the sidebar!")
 
-# Cleanup
-conn.close()
\ No newline at end of file
+# Return the connection to the pool for the next rerun
+get_connection_manager('dpo_data.db').release()
\ No newline at end of file
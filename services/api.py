@@ -0,0 +1,393 @@
+import argparse
+import asyncio
+import base64
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse as BaseJSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from database.db_manager import DEFAULT_PAGE_SIZE, PAGE_COLUMNS, DatabaseManager
+from database.exporter import ENTRY_COLUMNS, EXPORT_FORMATS, TRAINING_EXPORT_COLUMNS, iter_entry_batches
+from database.importer import normalize_record
+from database.quick_responses import DEFAULT_PAGE_SIZE as QUICK_RESPONSE_PAGE_SIZE
+
+# HTTP access to the data for labeling bots, training pipelines and other
+# tools, without going through the Streamlit UI:
+#   python -m services.api --db dpo_data.db --port 8000
+#
+#   GET  /datasets                              list datasets
+#   POST /datasets                              {"name": ...}
+#   GET  /datasets/{name}/entries               one page; ?limit=&cursor=&truncate=
+#   POST /datasets/{name}/entries               one pair or a list of pairs
+#   GET  /datasets/{name}/entries.ndjson        every entry, streamed; ?columns=
+#   GET  /datasets/{name}/stats                 counts and length histograms
+#   GET  /datasets/{name}/search                full-text search; ?q=&limit=&offset=
+#   GET  /datasets/{name}/export                download; ?format=&columns=&target=&delta=
+#   POST /datasets/{name}/exports/{id}          confirm receipt of a target export
+#   GET  /datasets/{name}/exports               export history
+#   GET  /quick-responses                       ?q=&limit=&offset=
+#   POST /quick-responses                       {"text": ...}
+#
+# An export to a target returns its id in the X-Export-Id header. The
+# target's watermark, which delta exports start from, moves only once that
+# id is posted back, so an interrupted download is simply exported again.
+#
+# Reads run on a few single-thread executors, so the event loop never
+# blocks on SQLite. NDJSON streams and file exports hold a thread for as
+# long as they run, so they get a separate, smaller pool: slow bulk
+# clients queue behind each other instead of blocking every other
+# endpoint. Writes are group-committed by the database's writer thread and
+# awaited as futures.
+
+DB_THREADS = 4
+BULK_THREADS = 2
+MAX_PAGE_SIZE = 500
+MAX_POST_ENTRIES = 1000
+STREAM_BATCH_SIZE = 1000
+NDJSON = "application/x-ndjson"
+ENTRY_PAGE_COLUMNS = ("id",) + PAGE_COLUMNS
+
+class AsyncDatabase:
+    # Runs DatabaseManager calls off the event loop. Every executor has a
+    # single thread, which keeps its own pooled connection, so a streaming
+    # cursor can be advanced across several calls on the same session.
+    def __init__(self, db, threads=DB_THREADS, name="api-db"):
+        self.db = db
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-{i}")
+            for i in range(threads)
+        ]
+        self._free = None
+
+    @asynccontextmanager
+    async def session(self):
+        # Yields run(fn, *args, **kwargs), bound to one executor until exit
+        if self._free is None:
+            # Created here so the queue belongs to the server's event loop
+            self._free = asyncio.Queue()
+            for executor in self._executors:
+                self._free.put_nowait(executor)
+        executor = await self._free.get()
+        loop = asyncio.get_running_loop()
+
+        def run(fn, *args, **kwargs):
+            return loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+        try:
+            yield run
+        finally:
+            self._free.put_nowait(executor)
+
+    async def run(self, fn, *args, **kwargs):
+        async with self.session() as run:
+            return await run(fn, *args, **kwargs)
+
+    def close(self):
+        for executor in self._executors:
+            executor.submit(self.db.close)
+            executor.shutdown(wait=True)
+
+class JSONResponse(BaseJSONResponse):
+    # Timestamps come back from SQLite as datetimes
+    def render(self, content):
+        return json.dumps(content, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+class ApiError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor), default=str).encode("utf-8")).decode("ascii")
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        created_at, entry_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return created_at, int(entry_id)
+    except (ValueError, TypeError):
+        raise ApiError(400, "Invalid cursor")
+
+def int_param(request, name, default, minimum=0, maximum=None):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if number < minimum:
+        raise ApiError(400, f"{name} must be at least {minimum}")
+    return number if maximum is None else min(number, maximum)
+
+def columns_param(request, default):
+    value = request.query_params.get("columns")
+    if not value:
+        return list(default)
+    columns = [column.strip() for column in value.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in ENTRY_COLUMNS]
+    if unknown:
+        raise ApiError(400, f"Unknown columns: {', '.join(unknown)}")
+    return columns
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON")
+
+async def dataset_id_or_404(adb, name):
+    dataset_id = await adb.run(adb.db.get_dataset_id, name)
+    if dataset_id is None:
+        raise ApiError(404, f"Dataset not found: {name}")
+    return dataset_id
+
+def endpoint(handler):
+    # Maps ApiError to a JSON error response
+    @functools.wraps(handler)
+    async def wrapper(request):
+        try:
+            return await handler(request, request.app.state.adb)
+        except ApiError as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    return wrapper
+
+@endpoint
+async def list_datasets(request, adb):
+    datasets = await adb.run(lambda: [row.to_dict() for row in adb.db.iter_datasets()])
+    return JSONResponse({"datasets": datasets})
+
+@endpoint
+async def create_dataset(request, adb):
+    body = await json_body(request)
+    name = (body.get("name") or "").strip() if isinstance(body, dict) else ""
+    if not name:
+        raise ApiError(400, "name is required")
+    if not await adb.run(adb.db.create_dataset, name):
+        raise ApiError(409, f"Dataset already exists: {name}")
+    return JSONResponse({"name": name}, status_code=201)
+
+@endpoint
+async def list_entries(request, adb):
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    limit = int_param(request, "limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    truncate = int_param(request, "truncate", None, minimum=1)
+    rows, next_cursor = await adb.run(
+        adb.db.get_entries_page,
+        name,
+        page_size=limit,
+        after=decode_cursor(request.query_params.get("cursor")),
+        columns=ENTRY_PAGE_COLUMNS,
+        truncate=truncate,
+        as_rows=True
+    )
+    return JSONResponse({
+        "entries": [dict(zip(ENTRY_PAGE_COLUMNS, row)) for row in rows],
+        "next_cursor": encode_cursor(next_cursor),
+    })
+
+@endpoint
+async def add_entries(request, adb):
+    name = request.path_params["name"]
+    dataset_id = await dataset_id_or_404(adb, name)
+    body = await json_body(request)
+    records = body if isinstance(body, list) else [body]
+    if len(records) > MAX_POST_ENTRIES:
+        raise ApiError(413, f"At most {MAX_POST_ENTRIES} entries per request")
+
+    pairs = []
+    for index, record in enumerate(records):
+        pair = normalize_record(record)
+        if pair is None or pair[1] is None:
+            raise ApiError(422, f"Entry {index} needs a question/prompt, chosen and rejected")
+        pairs.append(pair)
+
+    first_id = await asyncio.wrap_future(adb.db.submit_entries(dataset_id, pairs))
+    return JSONResponse(
+        {"created": len(pairs), "ids": list(range(first_id, first_id + len(pairs)))},
+        status_code=201
+    )
+
+@endpoint
+async def stream_entries(request, adb):
+    # NDJSON, newest first; one batch of rows is in memory at a time
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    columns = columns_param(request, TRAINING_EXPORT_COLUMNS)
+    bulk = request.app.state.bulk
+
+    async def lines():
+        async with bulk.session() as run:
+            batches = await run(lambda: iter_entry_batches(bulk.db.conn, name, columns, STREAM_BATCH_SIZE))
+            try:
+                while True:
+                    rows = await run(next, batches, None)
+                    if rows is None:
+                        break
+                    yield "".join(
+                        json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n"
+                        for row in rows
+                    ).encode("utf-8")
+            finally:
+                await run(batches.close)
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+@endpoint
+async def dataset_stats(request, adb):
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    (total, unique, first, last), histograms = await adb.run(
+        lambda: (adb.db.get_dataset_stats(name), adb.db.get_length_histograms(name))
+    )
+    return JSONResponse({
+        "entries": total,
+        "unique_questions": unique,
+        "first_entry": first,
+        "last_entry": last,
+        "length_histograms": {field: [list(bucket) for bucket in buckets] for field, buckets in histograms.items()},
+    })
+
+@endpoint
+async def search(request, adb):
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    query = request.query_params.get("q", "")
+    limit = int_param(request, "limit", DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    offset = int_param(request, "offset", 0)
+    try:
+        hits = await adb.run(adb.db.search_entries, query, name, limit, offset, as_rows=True)
+    except Exception as e:
+        raise ApiError(400, f"Invalid search: {e}")
+    return JSONResponse({"results": [hit.to_dict() for hit in hits]})
+
+@endpoint
+async def export(request, adb):
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    fmt = request.query_params.get("format", "JSONL")
+    formats = {key.lower(): key for key in EXPORT_FORMATS}
+    if fmt.lower() not in formats:
+        raise ApiError(400, f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    fmt = formats[fmt.lower()]
+    columns = columns_param(request, TRAINING_EXPORT_COLUMNS)
+    target = request.query_params.get("target") or None
+    delta = request.query_params.get("delta", "").lower() in ("1", "true", "yes")
+    if delta and target is None:
+        raise ApiError(400, "delta needs a target")
+    bulk = request.app.state.bulk
+    headers = {}
+    if target is None:
+        path, count = await bulk.run(bulk.db.export_entries, name, fmt, columns)
+    else:
+        path, count, export_id = await bulk.run(bulk.db.export_to_target, name, target, fmt, columns, delta=delta)
+        headers["X-Export-Id"] = str(export_id)
+    headers["X-Row-Count"] = str(count)
+    extension, mime = EXPORT_FORMATS[fmt]
+    return FileResponse(
+        path,
+        media_type=mime,
+        filename=f"{name}.{extension}",
+        headers=headers,
+        background=BackgroundTask(os.remove, path)
+    )
+
+@endpoint
+async def confirm_export(request, adb):
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    export_id = request.path_params["export_id"]
+    if not await adb.run(adb.db.confirm_export, name, export_id):
+        raise ApiError(404, f"No pending export {export_id}")
+    return JSONResponse({"export_id": export_id, "confirmed": True})
+
+@endpoint
+async def list_exports(request, adb):
+    name = request.path_params["name"]
+    await dataset_id_or_404(adb, name)
+    fields = ("target", "format", "mode", "rows", "last_entry_id", "last_created_at", "exported_at")
+    history = await adb.run(adb.db.get_export_history, name, int_param(request, "limit", 20, minimum=1, maximum=MAX_PAGE_SIZE))
+    return JSONResponse({"exports": [dict(zip(fields, row)) for row in history]})
+
+@endpoint
+async def list_quick_responses(request, adb):
+    limit = int_param(request, "limit", QUICK_RESPONSE_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    offset = int_param(request, "offset", 0)
+    rows, total = await adb.run(adb.db.search_quick_responses, request.query_params.get("q", ""), limit, offset)
+    return JSONResponse({
+        "quick_responses": [{"id": row[0], "text": row[1], "created_at": row[2]} for row in rows],
+        "total": total,
+    })
+
+@endpoint
+async def add_quick_response(request, adb):
+    body = await json_body(request)
+    text = body.get("text") if isinstance(body, dict) else None
+    if not text:
+        raise ApiError(400, "text is required")
+    if not await adb.run(adb.db.add_quick_response, text):
+        raise ApiError(500, "Could not save the quick response")
+    return JSONResponse({"text": text}, status_code=201)
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+def create_app(db_name="dpo_data.db", threads=DB_THREADS, bulk_threads=BULK_THREADS):
+    @asynccontextmanager
+    async def lifespan(app):
+        db = DatabaseManager(db_name, single_writer=True)
+        app.state.adb = AsyncDatabase(db, threads)
+        app.state.bulk = AsyncDatabase(db, bulk_threads, name="api-bulk")
+        try:
+            yield
+        finally:
+            app.state.bulk.close()
+            app.state.adb.close()
+
+    return Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/datasets", list_datasets, methods=["GET"]),
+            Route("/datasets", create_dataset, methods=["POST"]),
+            Route("/datasets/{name}/entries", list_entries, methods=["GET"]),
+            Route("/datasets/{name}/entries", add_entries, methods=["POST"]),
+            Route("/datasets/{name}/entries.ndjson", stream_entries),
+            Route("/datasets/{name}/stats", dataset_stats),
+            Route("/datasets/{name}/search", search),
+            Route("/datasets/{name}/export", export),
+            Route("/datasets/{name}/exports", list_exports),
+            Route("/datasets/{name}/exports/{export_id:int}", confirm_export, methods=["POST"]),
+            Route("/quick-responses", list_quick_responses, methods=["GET"]),
+            Route("/quick-responses", add_quick_response, methods=["POST"]),
+        ],
+        lifespan=lifespan
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP API for the DPO database")
+    parser.add_argument("--db", default="dpo_data.db", help="SQLite database file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=DB_THREADS, help="Database threads for reads")
+    parser.add_argument("--bulk-threads", type=int, default=BULK_THREADS, help="Database threads for streams and exports")
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The API service needs an ASGI server: pip install uvicorn")
+    uvicorn.run(create_app(args.db, args.threads, args.bulk_threads), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
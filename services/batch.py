@@ -0,0 +1,289 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from services.openai_service import (
+    BETTER_MODEL,
+    BETTER_SYSTEM_PROMPT,
+    WORSE_MODEL,
+    WORSE_SYSTEM_PROMPT,
+    _messages,
+)
+
+# Offline generation through the OpenAI Batch API, which costs half as much
+# as synchronous calls. A dataset's pending prompts are written as a
+# request JSONL file, one request per prompt and role, submitted, and the
+# output JSONL is streamed back into entries:
+#   python -m services.batch write --dataset my-dataset --output requests.jsonl
+#   python -m services.batch ingest --input output.jsonl
+#   python -m services.batch run --dataset my-dataset --local
+# custom_id is "dpo:<dataset_id>:<prompt_id>:<role>", so output lines can be
+# matched to their prompt however the API orders them.
+
+CUSTOM_ID_PREFIX = "dpo"
+ENDPOINT = "/v1/chat/completions"
+
+# The Batch API accepts at most 50,000 requests per file
+MAX_REQUESTS_PER_FILE = 50000
+INGEST_BATCH_SIZE = 500
+
+ROLE_REQUESTS = {
+    "chosen": (BETTER_MODEL, BETTER_SYSTEM_PROMPT),
+    "rejected": (WORSE_MODEL, WORSE_SYSTEM_PROMPT),
+}
+
+def make_custom_id(dataset_id, prompt_id, role):
+    return f"{CUSTOM_ID_PREFIX}:{dataset_id}:{prompt_id}:{role}"
+
+def parse_custom_id(custom_id):
+    # (dataset_id, prompt_id, role), or None for ids this module did not write
+    parts = (custom_id or "").split(":")
+    if len(parts) != 4 or parts[0] != CUSTOM_ID_PREFIX or parts[3] not in ROLE_REQUESTS:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), parts[3]
+    except ValueError:
+        return None
+
+def request_line(dataset_id, prompt_id, role, question):
+    model, system_prompt = ROLE_REQUESTS[role]
+    return json.dumps({
+        "custom_id": make_custom_id(dataset_id, prompt_id, role),
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {"model": model, "messages": _messages(system_prompt, question)},
+    }, ensure_ascii=False) + "\n"
+
+def write_batch_requests(db, dataset_name, fileobj, limit=None):
+    # Writes two requests per pending prompt to a text file object and marks
+    # the prompts batched. Returns the number of prompts written.
+    dataset_id = db.get_dataset_id(dataset_name)
+    if dataset_id is None:
+        raise ValueError(f"Dataset not found: {dataset_name}")
+    max_prompts = MAX_REQUESTS_PER_FILE // len(ROLE_REQUESTS)
+    limit = max_prompts if limit is None else min(limit, max_prompts)
+
+    prompts = db.get_pending_prompts(dataset_name, limit)
+    for prompt_id, question in prompts:
+        for role in ROLE_REQUESTS:
+            fileobj.write(request_line(dataset_id, prompt_id, role, question))
+    fileobj.flush()
+    db.mark_prompts_batched([prompt_id for prompt_id, _ in prompts])
+    return len(prompts)
+
+def _response_content(record):
+    # The completion text of an output line, or None if the request failed
+    if record.get("error"):
+        return None
+    response = record.get("response") or {}
+    if response.get("status_code") != 200:
+        return None
+    try:
+        return response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+def ingest_batch_output(db, source, batch_size=INGEST_BATCH_SIZE):
+    # Streams a Batch API output (or error) file, given as a path or a
+    # binary/text file object, into entries. A pair is saved once both of
+    # its halves have been read; only unmatched halves are held in memory.
+    # Prompts with a failed half stay batched; reset them to retry.
+    counts = {"saved": 0, "failed": 0, "incomplete": 0, "ignored": 0}
+    halves = {}
+    failed = set()
+    ready = {}
+
+    def flush():
+        for dataset_id, pairs in ready.items():
+            counts["saved"] += db.save_prompt_pairs(dataset_id, list(pairs.values()))
+        ready.clear()
+
+    if isinstance(source, str):
+        fileobj = open(source, "rb")
+    else:
+        fileobj = source
+    try:
+        for line in fileobj:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            parsed = parse_custom_id(record.get("custom_id"))
+            if parsed is None:
+                counts["ignored"] += 1
+                continue
+            dataset_id, prompt_id, role = parsed
+            key = (dataset_id, prompt_id)
+            content = _response_content(record)
+            if content is None:
+                counts["failed"] += 1
+                failed.add(key)
+                halves.pop(key, None)
+                continue
+            if key in failed:
+                continue
+
+            pair = halves.setdefault(key, {})
+            pair[role] = content
+            if len(pair) == len(ROLE_REQUESTS):
+                del halves[key]
+                ready.setdefault(dataset_id, {})[prompt_id] = (prompt_id, pair["chosen"], pair["rejected"])
+                if sum(len(pairs) for pairs in ready.values()) >= batch_size:
+                    flush()
+        flush()
+    finally:
+        if isinstance(source, str):
+            fileobj.close()
+
+    counts["incomplete"] = len(halves)
+    return counts
+
+class LocalBatchSubmitter:
+    # Stand-in for the Batch API that answers every request immediately,
+    # in the output format of the real API. `respond(body)` returns the
+    # completion text; the default echoes the model and question like the
+    # mock server. A fraction of requests can be made to fail.
+    def __init__(self, respond=None, error_rate=0.0):
+        self.respond = respond or (lambda body: f"[{body['model']}] {body['messages'][-1]['content']}")
+        self.error_rate = error_rate
+        self._outputs = {}
+        self._batch_ids = itertools.count(1)
+
+    def submit(self, input_path):
+        output = io.StringIO()
+        with open(input_path, encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                request = json.loads(line)
+                if random.random() < self.error_rate:
+                    record = {
+                        "id": f"batch_req_{number}",
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"code": "server_error", "message": "Injected failure"},
+                    }
+                else:
+                    record = {
+                        "id": f"batch_req_{number}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {
+                                "object": "chat.completion",
+                                "model": request["body"]["model"],
+                                "choices": [{
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": self.respond(request["body"])},
+                                    "finish_reason": "stop",
+                                }],
+                            },
+                        },
+                        "error": None,
+                    }
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        batch_id = f"local_batch_{next(self._batch_ids)}"
+        self._outputs[batch_id] = output.getvalue()
+        return batch_id
+
+    def fetch(self, batch_id, output_path):
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(self._outputs.pop(batch_id))
+        return True
+
+class OpenAIBatchSubmitter:
+    # Uploads the request file and creates a batch; fetch() downloads the
+    # output, and the error file if any, once the batch has finished
+    FINISHED = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, input_path):
+        with open(input_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def fetch(self, batch_id, output_path):
+        # False while the batch is still running
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in self.FINISHED:
+            return False
+        with open(output_path, "wb") as out:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    out.write(self.client.files.content(file_id).read())
+        return True
+
+def run_batch(db, dataset_name, submitter, workdir, limit=None, poll_interval=60.0):
+    # write -> submit -> wait -> ingest; returns the ingest counts
+    input_path = os.path.join(workdir, "batch_requests.jsonl")
+    output_path = os.path.join(workdir, "batch_output.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        written = write_batch_requests(db, dataset_name, f, limit)
+    if not written:
+        return {"saved": 0, "failed": 0, "incomplete": 0, "ignored": 0}
+    batch_id = submitter.submit(input_path)
+    while not submitter.fetch(batch_id, output_path):
+        time.sleep(poll_interval)
+    return ingest_batch_output(db, output_path)
+
+def main(argv=None):
+    from database.db_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Generate DPO pairs through the OpenAI Batch API")
+    parser.add_argument("--db", default="dpo_data.db", help="SQLite database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    write = commands.add_parser("write", help="Write pending prompts as a batch request file")
+    write.add_argument("--dataset", required=True)
+    write.add_argument("--output", required=True)
+    write.add_argument("--limit", type=int)
+
+    ingest = commands.add_parser("ingest", help="Save a batch output file as entries")
+    ingest.add_argument("--input", required=True)
+
+    run = commands.add_parser("run", help="Write, submit, wait for and ingest a batch")
+    run.add_argument("--dataset", required=True)
+    run.add_argument("--limit", type=int)
+    run.add_argument("--local", action="store_true", help="Use the local stand-in instead of the API")
+    run.add_argument("--poll-interval", type=float, default=60.0)
+
+    reset = commands.add_parser("reset", help="Return batched prompts of a dataset to pending")
+    reset.add_argument("--dataset", required=True)
+
+    args = parser.parse_args(argv)
+    db = DatabaseManager(args.db)
+
+    if args.command == "write":
+        with open(args.output, "w", encoding="utf-8") as f:
+            print(f"Wrote {write_batch_requests(db, args.dataset, f, args.limit)} prompts to {args.output}")
+    elif args.command == "ingest":
+        print(ingest_batch_output(db, args.input))
+    elif args.command == "reset":
+        print(f"Reset {db.reset_batched_prompts(args.dataset)} prompts to pending")
+    else:
+        if args.local:
+            submitter = LocalBatchSubmitter()
+        else:
+            from services.clients import get_client
+            from utils.settings import load_api_settings
+
+            api_key = os.environ.get("OPENAI_API_KEY") or db.get_api_key()
+            if not api_key:
+                raise SystemExit("No OpenAI API key: set OPENAI_API_KEY or save one in the app")
+            submitter = OpenAIBatchSubmitter(get_client(api_key, load_api_settings(db)[0]))
+        with tempfile.TemporaryDirectory() as workdir:
+            print(run_batch(db, args.dataset, submitter, workdir, args.limit, args.poll_interval))
+
+if __name__ == "__main__":
+    main()
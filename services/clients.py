@@ -0,0 +1,69 @@
+import threading
+
+# openai and httpx are imported on first use: together they take ~0.5 s to
+# import, which every Streamlit cold start and headless tool would pay even
+# when no request is ever made
+
+# Keep-alive pool shared by every request made through a registered client
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY = 60.0
+REQUEST_TIMEOUT = 120.0
+CONNECT_TIMEOUT = 10.0
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+def get_client(api_key, base_url=None):
+    # One long-lived client per (api_key, base_url) in the process, so TLS
+    # connections are reused across button presses and sessions. Retries are
+    # disabled here because OpenAIService applies its own backoff.
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            client = _clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                timeout=_timeout(),
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout())
+            )
+        return client
+
+def create_async_client(api_key, base_url=None):
+    # Async clients are bound to the event loop they first run on, so they
+    # cannot live in the registry; callers own and close them
+    import httpx
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        timeout=_timeout(),
+        http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    )
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,55 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from database.db_manager import DatabaseManager
+from database.metrics import render_prometheus
+
+# Serves the llm_calls totals for a Prometheus scraper:
+#   python -m services.metrics_exporter --port 9464
+# then scrape http://127.0.0.1:9464/metrics
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    db = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            body = render_prometheus(self.db.conn).encode("utf-8")
+        finally:
+            # Request threads are short-lived; return the connection to the pool
+            self.db.close()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(db, host="127.0.0.1", port=9464):
+    handler = type("ConfiguredMetricsHandler", (MetricsHandler,), {"db": db})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Prometheus exporter for LLM call metrics")
+    parser.add_argument("--db", default="dpo_data.db", help="SQLite database file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9464)
+    args = parser.parse_args()
+
+    server = make_server(DatabaseManager(args.db), args.host, args.port)
+    print(f"Serving metrics on http://{args.host}:{args.port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
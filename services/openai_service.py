@@ -1,31 +1,386 @@
-from openai import OpenAI
+import asyncio
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.clients import create_async_client, get_client
+from services.rate_limit import (
+    DEFAULT_MAX_RETRIES,
+    acall_with_retries,
+    call_with_retries,
+    estimate_tokens,
+    get_rate_limiter,
+)
+
+BETTER_MODEL = "gpt-4o"
+WORSE_MODEL = "gpt-4o-mini"
+
+BETTER_SYSTEM_PROMPT = "You are a helpful AI assistant. Generate a high-quality response to the user's question. Only one paragraph is needed. Use the same language as the user."
+WORSE_SYSTEM_PROMPT = "Generate a less detailed or lower quality response to the user's question. You are not willing to help and are trying to refuse the request. Only one paragraph is needed. Use the same language as the user."
+
+DEFAULT_CONCURRENCY = 8
+
+PAIR_ROLES = ("chosen", "rejected")
+
+# Shared by all sessions; generating a pair only needs two threads
+_pair_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="openai-pair")
 
 class OpenAIService:
-    def __init__(self, api_key):
-        self.client = OpenAI(api_key=api_key)
+    # Cheap to construct: the HTTP client comes from a process-wide registry
+    # and the rate limiter is shared by every service in the process. With a
+    # metrics recorder every API call is logged against dataset_id.
+    def __init__(self, api_key, base_url=None, cache=None, rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES, metrics=None, dataset_id=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.dataset_id = dataset_id
+        self.client = get_client(api_key, base_url)
+
+    def bind(self, dataset_id):
+        # A copy whose calls are attributed to another dataset
+        service = copy.copy(self)
+        service.dataset_id = dataset_id
+        return service
 
-    def generate_better_response(self, question):
+    def generate_better_response(self, question, use_cache=True):
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant. Generate a high-quality response to the user's question. Only one paragraph is needed. Use the same language as the user."},
-                    {"role": "user", "content": question}
-                ]
-            )
-            return response.choices[0].message.content
+            return self._complete(BETTER_MODEL, BETTER_SYSTEM_PROMPT, question, use_cache)
         except Exception as e:
             raise Exception(f"Error generating better response: {str(e)}")
 
-    def generate_worse_response(self, question):
+    def generate_worse_response(self, question, use_cache=True):
+        try:
+            return self._complete(WORSE_MODEL, WORSE_SYSTEM_PROMPT, question, use_cache)
+        except Exception as e:
+            raise Exception(f"Error generating worse response: {str(e)}")
+
+    def iter_pair(self, question, roles=PAIR_ROLES, use_cache=True):
+        # Requests every role at once and yields (role, text, error) in
+        # completion order, so callers can show each half as it arrives
+        generators = {
+            "chosen": self.generate_better_response,
+            "rejected": self.generate_worse_response,
+        }
+        futures = {
+            _pair_executor.submit(generators[role], question, use_cache): role
+            for role in roles
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    def stream_better_response(self, question, use_cache=True):
+        return CompletionStream(self, BETTER_MODEL, BETTER_SYSTEM_PROMPT, question, use_cache)
+
+    def stream_worse_response(self, question, use_cache=True):
+        return CompletionStream(self, WORSE_MODEL, WORSE_SYSTEM_PROMPT, question, use_cache)
+
+    def stream_pair(self, question, roles=PAIR_ROLES, use_cache=True):
+        factories = {
+            "chosen": self.stream_better_response,
+            "rejected": self.stream_worse_response,
+        }
+        return {role: factories[role](question, use_cache) for role in roles}
+
+    def generate_pair(self, question, use_cache=True):
+        results = {}
+        for role, text, error in self.iter_pair(question, use_cache=use_cache):
+            if error is not None:
+                raise error
+            results[role] = text
+        return results["chosen"], results["rejected"]
+
+    def _complete(self, model, system_prompt, question, use_cache=True, **params):
+        # With use_cache=False the API is always called, and the fresh
+        # sample replaces whatever was cached for the same inputs
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(model, system_prompt, question, params)
+            if use_cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+        messages = _messages(system_prompt, question)
+        call = CallMetrics(self, model)
+        try:
+            response = call_with_retries(
+                lambda: self._create(model, messages, params),
+                self.max_retries,
+                on_retry=call.on_retry
+            )
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        call.finish(usage=response.usage)
+        content = response.choices[0].message.content
+
+        if key is not None:
+            self.cache.put(key, model, content)
+        return content
+
+    def _create(self, model, messages, params):
+        # One API attempt, paced by the shared requests/tokens budget
+        reserved = estimate_tokens(messages, params.get("max_tokens"))
+        self.rate_limiter.acquire(reserved)
+        try:
+            response = self.client.chat.completions.create(model=model, messages=messages, **params)
+        except Exception:
+            # Otherwise every retry of a 429 or timeout would spend another estimate
+            self.rate_limiter.release(reserved)
+            raise
+        self.rate_limiter.settle(reserved, _total_tokens(response))
+        return response
+
+    def generate_pairs(self, prompts, db, dataset_name, concurrency=DEFAULT_CONCURRENCY, progress_callback=None, use_cache=True):
+        # Blocking entry point for the UI; runs the async batch on a fresh event loop
+        return asyncio.run(
+            self.agenerate_pairs(prompts, db, dataset_name, concurrency, progress_callback, use_cache)
+        )
+
+    async def agenerate_pairs(self, prompts, db, dataset_name, concurrency=DEFAULT_CONCURRENCY, progress_callback=None, use_cache=True):
+        # Each worker holds one prompt at a time and generates its chosen and
+        # rejected responses concurrently, so at most 2 * concurrency requests
+        # are in flight. Pairs are saved as soon as both halves arrive.
+        prompts = list(prompts)
+        total = len(prompts)
+        queue = asyncio.Queue()
+        for prompt in prompts:
+            queue.put_nowait(prompt)
+
+        result = {"saved": 0, "failed": []}
+        dataset_id = db.get_dataset_id(dataset_name)
+
+        async with create_async_client(self.api_key, self.base_url) as client:
+            async def worker():
+                while True:
+                    try:
+                        question = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    error = None
+                    try:
+                        chosen, rejected = await asyncio.gather(
+                            self._acomplete(client, BETTER_MODEL, BETTER_SYSTEM_PROMPT, question, dataset_id, use_cache),
+                            self._acomplete(client, WORSE_MODEL, WORSE_SYSTEM_PROMPT, question, dataset_id, use_cache),
+                        )
+                        # Awaits the commit without blocking the other requests
+                        await asyncio.wrap_future(db.submit_entries(dataset_id, [(question, chosen, rejected)]))
+                        result["saved"] += 1
+                    except Exception as e:
+                        error = str(e)
+                        result["failed"].append((question, error))
+                    if progress_callback:
+                        done = result["saved"] + len(result["failed"])
+                        progress_callback(done, total, question, error)
+
+            await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total or 1)))))
+
+        return result
+
+    async def _acomplete(self, client, model, system_prompt, question, dataset_id=None, use_cache=True, **params):
+        # use_cache=False works as in _complete
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(model, system_prompt, question, params)
+            if use_cache:
+                # The cache reads and writes SQLite, so it runs off the event loop
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    return cached
+
+        messages = _messages(system_prompt, question)
+        call = CallMetrics(self, model, dataset_id)
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Generate a less detailed or lower quality response to the user's question. You are not willing to help and are trying to refuse the request. Only one paragraph is needed. Use the same language as the user."},
-                    {"role": "user", "content": question}
-                ]
+            response = await acall_with_retries(
+                lambda: self._acreate(client, model, messages, params),
+                self.max_retries,
+                on_retry=call.on_retry
             )
-            return response.choices[0].message.content
         except Exception as e:
-            raise Exception(f"Error generating worse response: {str(e)}")
\ No newline at end of file
+            call.finish(error=e)
+            raise
+        call.finish(usage=response.usage)
+        content = response.choices[0].message.content
+
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, model, content)
+        return content
+
+    async def _acreate(self, client, model, messages, params):
+        reserved = estimate_tokens(messages, params.get("max_tokens"))
+        await self.rate_limiter.aacquire(reserved)
+        try:
+            response = await client.chat.completions.create(model=model, messages=messages, **params)
+        except Exception:
+            self.rate_limiter.release(reserved)
+            raise
+        self.rate_limiter.settle(reserved, _total_tokens(response))
+        return response
+
+class CompletionStream:
+    # Iterating yields text deltas as they arrive (a cache hit yields the
+    # whole text at once). Afterwards `text` holds the full response,
+    # `ttft` the seconds to the first delta and `latency` the total seconds.
+    # cancel() stops reading and closes the HTTP response, which ends the
+    # generation server-side; a cancelled response is never cached.
+    def __init__(self, service, model, system_prompt, question, use_cache=True, **params):
+        self.service = service
+        self.model = model
+        self.system_prompt = system_prompt
+        self.question = question
+        self.use_cache = use_cache
+        self.params = params
+        self.text = ""
+        self.ttft = None
+        self.latency = None
+        self.usage = None
+        self.cached = False
+        self.cancelled = False
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        cache = self.service.cache
+        key = None
+        if cache is not None:
+            key = cache.make_key(self.model, self.system_prompt, self.question, self.params)
+            if self.use_cache:
+                cached = cache.get(key)
+                if cached is not None:
+                    self.cached = True
+                    self.text = cached
+                    self.ttft = self.latency = time.perf_counter() - started
+                    yield cached
+                    return
+
+        messages = _messages(self.system_prompt, self.question)
+        reserved = estimate_tokens(messages, self.params.get("max_tokens"))
+        limiter = self.service.rate_limiter
+
+        def open_stream():
+            limiter.acquire(reserved)
+            try:
+                return self.service.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self.params
+                )
+            except Exception:
+                limiter.release(reserved)
+                raise
+
+        # Only opening the stream is retried; once deltas flow a retry would
+        # duplicate text the caller has already shown
+        call = CallMetrics(self.service, self.model, streamed=True)
+        try:
+            stream = call_with_retries(open_stream, self.service.max_retries, on_retry=call.on_retry)
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        parts = []
+        error = None
+        try:
+            for chunk in stream:
+                if self._cancel.is_set():
+                    self.cancelled = True
+                    break
+                if chunk.usage:
+                    self.usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    if self.ttft is None:
+                        self.ttft = time.perf_counter() - started
+                    parts.append(delta)
+                    yield delta
+            if key is not None and not self.cancelled:
+                cache.put(key, self.model, "".join(parts))
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also runs when the consumer abandons the generator
+            stream.close()
+            self.text = "".join(parts)
+            self.latency = time.perf_counter() - started
+            limiter.settle(reserved, self.usage.total_tokens if self.usage else None)
+            if self.cancelled and error is None:
+                error = "cancelled"
+            call.finish(usage=self.usage, ttft=self.ttft, error=error)
+
+class CallMetrics:
+    # Times one logical API call, retries included, and hands the result to
+    # the service's metrics recorder if it has one
+    def __init__(self, service, model, dataset_id=None, streamed=False):
+        self.recorder = service.metrics
+        self.model = model
+        self.dataset_id = service.dataset_id if dataset_id is None else dataset_id
+        self.streamed = streamed
+        self.retries = 0
+        self.started = time.perf_counter()
+
+    def on_retry(self, error, attempt):
+        self.retries += 1
+
+    def finish(self, usage=None, ttft=None, error=None):
+        if self.recorder is None:
+            return
+        self.recorder.record(
+            self.model,
+            dataset_id=self.dataset_id,
+            usage=usage,
+            latency=time.perf_counter() - self.started,
+            ttft=ttft,
+            retries=self.retries,
+            streamed=self.streamed,
+            error=error
+        )
+
+def iter_streams(streams):
+    # Consumes several CompletionStreams on the pair pool and yields
+    # (role, delta, error) in arrival order; delta None marks a finished
+    # stream. Closing the generator early cancels whatever is still running.
+    events = queue.Queue()
+
+    def pump(role, stream):
+        try:
+            for delta in stream:
+                events.put((role, delta, None))
+            events.put((role, None, None))
+        except Exception as e:
+            events.put((role, None, e))
+
+    for role, stream in streams.items():
+        _pair_executor.submit(pump, role, stream)
+
+    remaining = len(streams)
+    try:
+        while remaining:
+            role, delta, error = events.get()
+            if delta is None:
+                remaining -= 1
+            yield role, delta, error
+    finally:
+        for stream in streams.values():
+            stream.cancel()
+
+def _messages(system_prompt, question):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+
+def _total_tokens(response):
+    usage = getattr(response, "usage", None)
+    return usage.total_tokens if usage else None
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+
+# Completion length assumed when reserving tokens before a call; the
+# difference is settled from response.usage afterwards
+DEFAULT_COMPLETION_TOKENS = 512
+
+DEFAULT_MAX_RETRIES = 5
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    # Reservation-style bucket: callers take what they need immediately and
+    # sleep for however long it takes the bucket to refill to zero, so
+    # waiting callers are served in arrival order
+    def __init__(self, per_minute):
+        self._lock = threading.Lock()
+        self.configure(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def configure(self, per_minute):
+        with self._lock:
+            self.capacity = float(per_minute)
+            self.rate = per_minute / 60.0
+
+    def reserve(self, amount):
+        # Returns the number of seconds the caller must wait
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def configure(self, requests_per_minute, tokens_per_minute):
+        self.requests.configure(requests_per_minute)
+        self.tokens.configure(tokens_per_minute)
+
+    def _reserve(self, tokens):
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens):
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens):
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def release(self, reserved):
+        # Returns the tokens of a call that failed before producing any. The
+        # request slot stays spent: the attempt did reach the API.
+        self.tokens.refund(reserved)
+
+    def settle(self, reserved, used):
+        # Corrects a reservation once the real token usage is known
+        if used is None:
+            return
+        if used < reserved:
+            self.tokens.refund(reserved - used)
+        elif used > reserved:
+            self.tokens.reserve(used - reserved)
+
+_rate_limiter = RateLimiter()
+
+def get_rate_limiter():
+    # Shared by every OpenAIService in the process, i.e. all Streamlit sessions
+    return _rate_limiter
+
+def estimate_tokens(messages, max_tokens=None):
+    # Roughly four characters per token, plus the expected completion
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // 4 + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+def is_retryable(error):
+    # openai is imported lazily by services.clients; if it was never
+    # imported, no request was made and the error cannot be an API error
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+def retry_delay(error, attempt):
+    # Honour the server's Retry-After when it sends one, otherwise use
+    # exponential backoff with full jitter
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_RETRY_DELAY)
+            except ValueError:
+                pass
+    return random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt))
+
+def call_with_retries(call, max_retries=DEFAULT_MAX_RETRIES, on_retry=None):
+    # on_retry(error, attempt) is called before each retry
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            if on_retry:
+                on_retry(e, attempt)
+            time.sleep(retry_delay(e, attempt))
+            attempt += 1
+
+async def acall_with_retries(call, max_retries=DEFAULT_MAX_RETRIES, on_retry=None):
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            if on_retry:
+                on_retry(e, attempt)
+            await asyncio.sleep(retry_delay(e, attempt))
+            attempt += 1
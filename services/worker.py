@@ -0,0 +1,141 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+
+from database import jobs
+from database.db_manager import DatabaseManager
+from database.metrics import MetricsRecorder
+from database.response_cache import ResponseCache
+from services.openai_service import OpenAIService
+from services.rate_limit import get_rate_limiter
+from utils.settings import load_api_settings
+
+# Headless generation worker:
+#   python -m services.worker --dataset my-dataset --threads 4
+# Any number of workers may run against the same database, in one or many
+# processes. Each claims one job at a time from the jobs table, generates
+# the pair and saves it together with the job's completion, so a killed
+# worker only ever loses the pair it was generating; its job is claimed
+# again once the lease expires.
+
+DEFAULT_POLL_INTERVAL = 5.0
+
+logger = logging.getLogger("services.worker")
+
+class Worker:
+    def __init__(self, db, service, worker_id, dataset_name=None, lease=jobs.DEFAULT_LEASE, max_attempts=jobs.DEFAULT_MAX_ATTEMPTS):
+        self.db = db
+        self.service = service
+        self.worker_id = worker_id
+        self.dataset_name = dataset_name
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    def run_once(self):
+        # Processes at most one job; returns False when none was claimable
+        claimed = self.db.claim_jobs(
+            self.worker_id,
+            limit=1,
+            lease=self.lease,
+            dataset_name=self.dataset_name,
+            max_attempts=self.max_attempts
+        )
+        if not claimed:
+            return False
+
+        job_id, dataset_id, question = claimed[0]
+        try:
+            chosen, rejected = self.service.bind(dataset_id).generate_pair(question)
+        except Exception as e:
+            logger.warning("%s: job %d failed: %s", self.worker_id, job_id, e)
+            self.db.fail_job(job_id, self.worker_id, str(e), self.max_attempts)
+            return True
+
+        if self.db.complete_job(job_id, self.worker_id, dataset_id, question, chosen, rejected):
+            logger.info("%s: job %d done", self.worker_id, job_id)
+        else:
+            logger.warning("%s: job %d was reclaimed by another worker, result discarded", self.worker_id, job_id)
+        return True
+
+    def run(self, stop_event, exit_when_empty=False, poll_interval=DEFAULT_POLL_INTERVAL):
+        try:
+            while not stop_event.is_set():
+                if not self.run_once():
+                    if exit_when_empty:
+                        return
+                    stop_event.wait(poll_interval)
+        finally:
+            self.db.close()
+
+def make_worker_id(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+def make_service(db, api_key=None):
+    api_key = api_key or os.environ.get("OPENAI_API_KEY") or db.get_api_key()
+    if not api_key:
+        raise SystemExit("No OpenAI API key: set OPENAI_API_KEY or save one in the app")
+    base_url, rpm, tpm = load_api_settings(db)
+    # The limiter is per process, so the saved budget is shared by this
+    # process's threads only; lower it when running several processes
+    get_rate_limiter().configure(rpm, tpm)
+    return OpenAIService(
+        api_key,
+        base_url=base_url,
+        cache=ResponseCache(db),
+        metrics=MetricsRecorder(db)
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate DPO pairs for queued jobs")
+    parser.add_argument("--db", default="dpo_data.db", help="SQLite database file")
+    parser.add_argument("--dataset", help="Only process jobs of this dataset")
+    parser.add_argument("--threads", type=int, default=1, help="Jobs processed concurrently by this process")
+    parser.add_argument("--lease", type=float, default=jobs.DEFAULT_LEASE, help="Seconds before a claimed job may be reclaimed")
+    parser.add_argument("--max-attempts", type=int, default=jobs.DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds to wait when the queue is empty")
+    parser.add_argument("--exit-when-empty", action="store_true", help="Stop once no job can be claimed")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # The worker threads' writes share the writer thread's commits
+    db = DatabaseManager(args.db, single_writer=True)
+    service = make_service(db)
+
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        # Jobs in progress are finished; nothing new is claimed
+        logger.info("Stopping after the current jobs")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    threads = []
+    for index in range(max(1, args.threads)):
+        worker = Worker(db, service, make_worker_id(index), args.dataset, args.lease, args.max_attempts)
+        thread = threading.Thread(
+            target=worker.run,
+            args=(stop_event, args.exit_when_empty, args.poll_interval),
+            name=f"worker-{index}"
+        )
+        thread.start()
+        threads.append(thread)
+
+    # Joining with a timeout keeps the main thread responsive to signals
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(0.5)
+
+    counts = db.get_job_counts(args.dataset)
+    logger.info("Queue: %s", ", ".join(f"{status} {count}" for status, count in counts.items()))
+    # Commits the cache hits, call metrics and cache entries still queued
+    service.cache.flush_hits()
+    db.connections.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal OpenAI-compatible server for exercising OpenAIService locally:
+#   python -m tools.mock_openai_server --port 8001
+# then point the service at base_url="http://127.0.0.1:8001/v1".
+# --error-rate makes that fraction of requests fail, half with a 429 that
+# carries Retry-After and half with a 500, to exercise the retry path.
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    latency_jitter = 0.0
+    token_latency = 0.0
+    error_rate = 0.0
+    retry_after = 0.1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._chat_completion(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _chat_completion(self, body):
+        delay = self.latency + random.uniform(0, self.latency_jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            if random.random() < 0.5:
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                    {"Retry-After": str(self.retry_after)}
+                )
+            else:
+                self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+
+        question = next(
+            (m["content"] for m in reversed(body.get("messages", [])) if m.get("role") == "user"),
+            ""
+        )
+        content = f"[{body.get('model', 'mock')}] {question}"
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        completion_tokens = len(content.split())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self._stream_completion(body, content, usage if include_usage else None)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    def _stream_completion(self, body, content, usage):
+        # Server-sent events, one word per chunk, like the real API's deltas
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+        }
+        words = content.split(" ")
+        try:
+            for i, word in enumerate(words):
+                if self.token_latency:
+                    time.sleep(self.token_latency)
+                delta = {"content": word if i == 0 else " " + word}
+                if i == 0:
+                    delta["role"] = "assistant"
+                self._send_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self._send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if usage:
+                self._send_event({**base, "choices": [], "usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            pass
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(host="127.0.0.1", port=8001, latency=0.0, token_latency=0.0, latency_jitter=0.0, error_rate=0.0, retry_after=0.1):
+    # port=0 binds a free port; read it back from server.server_address
+    handler = type(
+        "ConfiguredMockOpenAIHandler",
+        (MockOpenAIHandler,),
+        {
+            "latency": latency,
+            "token_latency": token_latency,
+            "latency_jitter": latency_jitter,
+            "error_rate": error_rate,
+            "retry_after": retry_after,
+        }
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to sleep before each response")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429 or 500")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with injected 429s")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        args.latency,
+        args.token_latency,
+        args.latency_jitter,
+        args.error_rate,
+        args.retry_after
+    )
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
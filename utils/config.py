@@ -5,6 +5,8 @@ def init_session_state():
         st.session_state.current_dataset = None
     if 'openai_api_key' not in st.session_state:
         st.session_state.openai_api_key = None
+    if 'generated' not in st.session_state:
+        st.session_state.generated = {}
 
 def set_page_config():
     st.set_page_config(
@@ -0,0 +1,15 @@
+from services.rate_limit import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+
+# Keys in the settings table and how they are read. Kept free of streamlit
+# so the headless worker and batch CLI can share them with the UI.
+BASE_URL_SETTING = 'openai_base_url'
+RPM_SETTING = 'rate_limit_rpm'
+TPM_SETTING = 'rate_limit_tpm'
+
+def load_api_settings(db):
+    # (base_url or None, requests per minute, tokens per minute)
+    return (
+        db.get_setting(BASE_URL_SETTING) or None,
+        int(db.get_setting(RPM_SETTING, DEFAULT_REQUESTS_PER_MINUTE)),
+        int(db.get_setting(TPM_SETTING, DEFAULT_TOKENS_PER_MINUTE)),
+    )
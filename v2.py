@@ -1,16 +1,28 @@
+import io
+import os
 import streamlit as st
-import pandas as pd
-from database.db_manager import DatabaseManager
-from services.openai_service import OpenAIService
+from database.db_manager import LATENCY_COLUMNS, DatabaseManager
+from database.dedup import DEFAULT_THRESHOLD
+from database.exporter import ENTRY_EXPORT_COLUMNS, EXPORT_FORMATS, TRAINING_EXPORT_COLUMNS, validate_parquet_export
+from database.importer import DEFAULT_CHUNK_SIZE, IMPORT_DIR_ENV, import_dir, resolve_import_path
+from database.metrics import MetricsRecorder
+from database.shards import COMPRESSIONS, DEFAULT_ROWS_PER_SHARD
+from database.quick_responses import DEFAULT_PAGE_SIZE as QUICK_RESPONSE_PAGE_SIZE
+from database.rows import to_frame
+from database.response_cache import ResponseCache
+from services.batch import MAX_REQUESTS_PER_FILE, ingest_batch_output, write_batch_requests
+from services.openai_service import OpenAIService, DEFAULT_CONCURRENCY, iter_streams
+from services.rate_limit import get_rate_limiter
 from utils.config import init_session_state, set_page_config
+from utils.settings import BASE_URL_SETTING, RPM_SETTING, TPM_SETTING, load_api_settings
 
 def main():
     # Initialize configuration
     set_page_config()
     init_session_state()
 
-    # Initialize database
-    db = DatabaseManager()
+    # Shared across reruns and sessions; connections are pooled per thread
+    db = get_database()
 
     # Sidebar
     with st.sidebar:
@@ -33,41 +45,94 @@ def main():
                 st.session_state.openai_api_key = api_key
                 st.success("API Key saved!")
 
+        handle_api_settings(db)
+
         # Dataset Management
         handle_dataset_management(db)
 
     # Main Content
     if st.session_state.current_dataset:
-        tabs = st.tabs(["Data Generation", "Quick Responses", "Export"])
+        tabs = st.tabs(["Data Generation", "Batch Generation", "Quick Responses", "Search", "Statistics", "LLM Usage", "Import", "Export"])
         
         with tabs[0]:
             handle_data_generation(db)
         
         with tabs[1]:
-            handle_quick_responses(db)
+            handle_batch_generation(db)
         
         with tabs[2]:
+            handle_quick_responses(db)
+        
+        with tabs[3]:
+            handle_search(db)
+        
+        with tabs[4]:
+            handle_statistics(db)
+        
+        with tabs[5]:
+            handle_llm_usage(db)
+        
+        with tabs[6]:
+            handle_import(db)
+        
+        with tabs[7]:
             handle_export(db)
     else:
         st.info("Please select or create a dataset from the sidebar!")
 
-    # Cleanup
-    db.close()
+@st.cache_resource
+def get_database():
+    # Every session's saves go through one writer thread and are committed
+    # in groups, so concurrent annotators never contend for the write lock
+    return DatabaseManager(single_writer=True)
+
+@st.cache_resource
+def get_response_cache():
+    # Long-lived so the hit/miss counters cover the whole process
+    return ResponseCache(get_database())
+
+def handle_api_settings(db):
+    base_url, rpm, tpm = load_api_settings(db)
+    # The limiter is process-wide, so these budgets cover every session
+    get_rate_limiter().configure(rpm, tpm)
+    
+    with st.expander("API Settings"):
+        base_url = st.text_input(
+            "API Base URL",
+            base_url or "",
+            help="Leave empty for the official OpenAI endpoint"
+        )
+        new_rpm = st.number_input("Requests per minute", min_value=1, value=rpm)
+        new_tpm = st.number_input("Tokens per minute", min_value=1000, value=tpm, step=1000)
+        if st.button("Save API Settings"):
+            db.save_setting(BASE_URL_SETTING, base_url.strip())
+            db.save_setting(RPM_SETTING, str(int(new_rpm)))
+            db.save_setting(TPM_SETTING, str(int(new_tpm)))
+            st.success("API settings saved!")
+
+def get_openai_service(db, api_key):
+    return OpenAIService(
+        api_key,
+        base_url=db.get_setting(BASE_URL_SETTING) or None,
+        cache=get_response_cache(),
+        metrics=MetricsRecorder(db),
+        dataset_id=db.get_dataset_id(st.session_state.current_dataset)
+    )
 
 def handle_dataset_management(db):
     st.header("Dataset Management")
     
     dataset_action = st.radio(
         "Action",
-        ["Select Dataset", "Create New Dataset", "View Entries"]
+        ["Select Dataset", "Create New Dataset", "View Entries", "Near-Duplicates"]
     )
     
     if dataset_action == "Select Dataset":
-        datasets = db.get_datasets()
-        if not datasets.empty:
+        dataset_names = db.get_dataset_names()
+        if dataset_names:
             selected_dataset = st.selectbox(
                 "Choose Dataset",
-                datasets['name'].tolist()
+                dataset_names
             )
             if st.button("Load Dataset"):
                 st.session_state.current_dataset = selected_dataset
@@ -86,33 +151,102 @@ def handle_dataset_management(db):
             else:
                 st.error("Please enter a dataset name!")
     
-    else:  # View Entries
+    elif dataset_action == "View Entries":
         if st.session_state.current_dataset:
-            entries = db.get_entries(st.session_state.current_dataset)
-            if not entries.empty:
-                st.dataframe(entries)
-                
-                # Add export selected entries option
-                if st.button("Export Viewed Entries"):
-                    export_format = st.selectbox("Export Format", ["CSV", "JSON"])
-                    if export_format == "CSV":
-                        st.download_button(
-                            "Download CSV",
-                            entries.to_csv(index=False),
-                            f"{st.session_state.current_dataset}_selected.csv",
-                            "text/csv"
-                        )
-                    else:
-                        st.download_button(
-                            "Download JSON",
-                            entries.to_json(orient='records'),
-                            f"{st.session_state.current_dataset}_selected.json",
-                            "application/json"
-                        )
-            else:
-                st.info("No entries in this dataset yet!")
+            handle_entry_browser(db, st.session_state.current_dataset)
         else:
             st.warning("Please select a dataset first!")
+    
+    else:  # Near-Duplicates
+        if st.session_state.current_dataset:
+            handle_near_duplicate_report(db, st.session_state.current_dataset)
+        else:
+            st.warning("Please select a dataset first!")
+
+def handle_near_duplicate_report(db, dataset_name):
+    threshold = st.slider("Similarity threshold", 0.5, 1.0, DEFAULT_THRESHOLD, 0.05)
+    if st.button("Find Near-Duplicates"):
+        indexed = db.index_unindexed_entries()
+        if indexed:
+            st.info(f"Indexed {indexed} older entries")
+        clusters = db.get_near_duplicate_report(dataset_name, threshold)
+        if not clusters:
+            st.success("No near-duplicate prompts found!")
+            return
+        
+        duplicates = sum(len(cluster) - 1 for cluster in clusters)
+        st.warning(f"{len(clusters)} groups of similar prompts ({duplicates} redundant entries)")
+        shown = clusters[:50]
+        questions = db.get_questions([entry_id for cluster in shown for entry_id in cluster[:3]])
+        st.dataframe(to_frame(
+            [
+                (
+                    len(cluster),
+                    questions.get(cluster[0], "")[:200],
+                    questions.get(cluster[1], "")[:200],
+                    ", ".join(str(entry_id) for entry_id in cluster[:20])
+                )
+                for cluster in shown
+            ],
+            ["entries", "example", "variant", "entry_ids"]
+        ))
+
+def handle_entry_browser(db, dataset_name):
+    # Cursors of the pages visited so far, so "Previous" can step back
+    # without re-reading anything but the target page
+    if st.session_state.get("browser_dataset") != dataset_name:
+        st.session_state.browser_dataset = dataset_name
+        st.session_state.browser_cursors = [None]
+    cursors = st.session_state.browser_cursors
+    
+    total = db.get_entry_count(dataset_name)
+    if not total:
+        st.info("No entries in this dataset yet!")
+        return
+    
+    page_size = st.selectbox("Entries per page", [25, 50, 100], index=1)
+    truncate = st.number_input("Truncate text to characters", min_value=20, value=200, step=20)
+    
+    entries, next_cursor = db.get_entries_page(
+        dataset_name,
+        page_size=page_size,
+        after=cursors[-1],
+        truncate=int(truncate)
+    )
+    
+    page_number = len(cursors)
+    page_count = -(-total // page_size)
+    st.caption(f"Page {page_number} of {page_count} ({total} entries)")
+    st.dataframe(entries)
+    
+    prev_col, next_col = st.columns(2)
+    with prev_col:
+        if st.button("Previous", disabled=page_number == 1):
+            cursors.pop()
+            st.experimental_rerun()
+    with next_col:
+        if st.button("Next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.experimental_rerun()
+    
+    # Add export selected entries option
+    if st.button("Export Viewed Entries"):
+        full_entries, _ = db.get_entries_page(dataset_name, page_size=page_size, after=cursors[-1])
+        export_format = st.selectbox("Export Format", ["CSV", "JSON"])
+        if export_format == "CSV":
+            st.download_button(
+                "Download CSV",
+                full_entries.to_csv(index=False),
+                f"{dataset_name}_page{page_number}.csv",
+                "text/csv"
+            )
+        else:
+            st.download_button(
+                "Download JSON",
+                full_entries.to_json(orient='records'),
+                f"{dataset_name}_page{page_number}.json",
+                "application/json"
+            )
 
 def handle_data_generation(db):
     st.header("Data Generation")
@@ -121,6 +255,20 @@ def handle_data_generation(db):
     st.subheader("Question/Prompt")
     question = st.text_area("Enter the question or prompt", height=100)
     
+    if question:
+        for _, similar_question, score in db.find_near_duplicates(st.session_state.current_dataset, question, limit=3):
+            st.warning(f"Similar prompt already in this dataset ({score:.0%} match): {similar_question[:200]}")
+    
+    # Unchecking forces a fresh sample, which then replaces the cached one
+    response_cache = get_response_cache()
+    use_cache = st.checkbox("Reuse cached responses", value=True)
+    cache_stats = response_cache.stats()
+    st.caption(
+        f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} stored"
+    )
+    
+    placeholders = {}
     col1, col2 = st.columns(2)
     
     with col1:
@@ -135,27 +283,9 @@ def handle_data_generation(db):
         if generation_method_a == "Human Input":
             response_a = st.text_area("Enter Response A", height=200)
         elif generation_method_a == "Quick Response":
-            quick_responses = db.get_quick_responses()
-            if not quick_responses.empty:
-                response_a = st.selectbox(
-                    "Select Quick Response",
-                    quick_responses['text'].tolist(),
-                    key="quick_a"
-                )
-            else:
-                st.warning("No quick responses available")
+            response_a = select_quick_response(db, "quick_a")
         else:  # AI Generate
-            api_key = db.get_api_key()
-            if api_key:
-                if st.button("Generate Response A"):
-                    try:
-                        openai_service = OpenAIService(api_key)
-                        response_a = openai_service.generate_better_response(question)
-                        st.text_area("Generated Response A", response_a, height=200)
-                    except Exception as e:
-                        st.error(f"Error generating response: {str(e)}")
-            else:
-                st.warning("Please set your OpenAI API key in the sidebar")
+            response_a = render_generated_response(db, "chosen", "Generated Response A", question, placeholders)
     
     with col2:
         st.subheader("Response B (Worse Response)")
@@ -169,27 +299,52 @@ def handle_data_generation(db):
         if generation_method_b == "Human Input":
             response_b = st.text_area("Enter Response B", height=200)
         elif generation_method_b == "Quick Response":
-            quick_responses = db.get_quick_responses()
-            if not quick_responses.empty:
-                response_b = st.selectbox(
-                    "Select Quick Response",
-                    quick_responses['text'].tolist(),
-                    key="quick_b"
-                )
-            else:
-                st.warning("No quick responses available")
+            response_b = select_quick_response(db, "quick_b")
         else:  # AI Generate
-            api_key = db.get_api_key()
-            if api_key:
-                if st.button("Generate Response B"):
-                    try:
-                        openai_service = OpenAIService(api_key)
-                        response_b = openai_service.generate_worse_response(question)
-                        st.text_area("Generated Response B", response_b, height=200)
-                    except Exception as e:
-                        st.error(f"Error generating response: {str(e)}")
+            response_b = render_generated_response(db, "rejected", "Generated Response B", question, placeholders)
+    
+    # Both AI responses are requested at once, so a pair costs the slower
+    # of the two calls rather than their sum
+    ai_roles = [
+        role for role, method in (("chosen", generation_method_a), ("rejected", generation_method_b))
+        if method == "AI Generate"
+    ]
+    api_key = db.get_api_key()
+    if ai_roles and api_key:
+        if st.button("Generate Pair" if len(ai_roles) == 2 else "Generate Response"):
+            if question:
+                generated = {"question": question, "errors": {}, "stats": {}, "streaming": list(ai_roles)}
+                st.session_state.generated = generated
+                # Clicking Cancel reruns the script, which interrupts the loop
+                # below; closing the events generator then closes both streams
+                # so the rest of the tokens are never generated
+                st.button("Cancel Generation")
+                streams = get_openai_service(db, api_key).stream_pair(question, ai_roles, use_cache=use_cache)
+                events = iter_streams(streams)
+                try:
+                    for role, delta, error in events:
+                        if error is not None:
+                            generated["streaming"].remove(role)
+                            generated["errors"][role] = str(error)
+                            placeholders[role].error(f"Error generating response: {str(error)}")
+                        elif delta is None:
+                            stream = streams[role]
+                            generated["streaming"].remove(role)
+                            generated[role] = stream.text
+                            generated["stats"][role] = {
+                                "ttft": stream.ttft,
+                                "latency": stream.latency,
+                                "cached": stream.cached
+                            }
+                            placeholders[role].markdown(stream.text)
+                        else:
+                            generated[role] = generated.get(role, "") + delta
+                            placeholders[role].markdown(generated[role] + "▌")
+                finally:
+                    events.close()
+                st.experimental_rerun()
             else:
-                st.warning("Please set your OpenAI API key in the sidebar")
+                st.error("Please enter a question first!")
     
     # Preview and Save
     if question and response_a and response_b:
@@ -205,12 +360,148 @@ def handle_data_generation(db):
                 db.save_entry(st.session_state.current_dataset, question, response_a, response_b)
                 st.success("DPO entry saved successfully!")
                 # Clear the form
+                st.session_state.generated = {}
                 st.experimental_rerun()
             except Exception as e:
                 st.error(f"Error saving entry: {str(e)}")
     else:
         st.warning("Please fill in all fields (question and both responses) to save")
 
+def render_generated_response(db, role, label, question, placeholders):
+    # Generated text is kept in session state so it survives reruns until
+    # the question changes; the annotator can still edit it before saving
+    if not db.get_api_key():
+        st.warning("Please set your OpenAI API key in the sidebar")
+        return ""
+    
+    placeholders[role] = st.empty()
+    generated = st.session_state.generated
+    if generated.get("question") != question:
+        return ""
+    
+    error = generated.get("errors", {}).get(role)
+    if error:
+        placeholders[role].error(f"Error generating response: {error}")
+        return ""
+    if not generated.get(role):
+        return ""
+    
+    text = placeholders[role].text_area(label, generated[role], height=200)
+    stats = generated.get("stats", {}).get(role)
+    if role in generated.get("streaming", []):
+        # The run streaming this response was interrupted by Cancel
+        st.caption("Generation cancelled; partial response kept")
+    elif stats and stats["cached"]:
+        st.caption("Served from the response cache")
+    elif stats:
+        st.caption(f"First token after {stats['ttft'] or 0:.2f}s, finished in {stats['latency']:.2f}s")
+    return text
+
+def handle_batch_generation(db):
+    st.header("Batch Generation")
+    
+    prompt_source = st.radio("Prompt Source", ["Enter Prompts", "Pending Imported Prompts"])
+    
+    pending = []
+    if prompt_source == "Enter Prompts":
+        prompts_text = st.text_area("Prompts (one per line)", height=200)
+    else:
+        limit = st.number_input("Max prompts", min_value=1, value=100)
+        pending = db.get_pending_prompts(st.session_state.current_dataset, int(limit))
+        st.info(f"{len(pending)} pending prompts selected")
+    concurrency = st.slider("Concurrent prompts", 1, 32, DEFAULT_CONCURRENCY)
+    # Unchecking regenerates every pair, replacing the cached responses
+    use_cache = st.checkbox("Reuse cached responses", value=True, key="batch_use_cache")
+    
+    generate_col, queue_col = st.columns(2)
+    with generate_col:
+        generate_clicked = st.button("Generate Pairs")
+    with queue_col:
+        queue_clicked = st.button(
+            "Queue for Workers",
+            help="Runs outside this session: start workers with python -m services.worker"
+        )
+    
+    if queue_clicked:
+        if prompt_source == "Enter Prompts":
+            prompts = [line.strip() for line in prompts_text.splitlines() if line.strip()]
+            queued = db.enqueue_jobs(st.session_state.current_dataset, prompts)
+        else:
+            queued = db.enqueue_pending_prompts(st.session_state.current_dataset, int(limit))
+        st.success(f"Queued {queued} jobs")
+    
+    if generate_clicked:
+        if prompt_source == "Enter Prompts":
+            prompts = [line.strip() for line in prompts_text.splitlines() if line.strip()]
+        else:
+            prompts = [question for _, question in pending]
+        api_key = db.get_api_key()
+        if not api_key:
+            st.warning("Please set your OpenAI API key in the sidebar")
+        elif not prompts:
+            st.error("Please enter at least one prompt!")
+        else:
+            progress = st.progress(0.0, text=f"0 / {len(prompts)} pairs")
+            
+            def on_progress(done, total, question, error):
+                progress.progress(done / total, text=f"{done} / {total} pairs")
+            
+            openai_service = get_openai_service(db, api_key)
+            result = openai_service.generate_pairs(
+                prompts,
+                db,
+                st.session_state.current_dataset,
+                concurrency=concurrency,
+                progress_callback=on_progress,
+                use_cache=use_cache
+            )
+            if pending:
+                failed_questions = {question for question, _ in result["failed"]}
+                db.mark_prompts_done(
+                    [prompt_id for prompt_id, question in pending if question not in failed_questions]
+                )
+            st.success(f"Saved {result['saved']} DPO entries!")
+            if result["failed"]:
+                st.error(f"{len(result['failed'])} prompts failed")
+                st.dataframe(to_frame(result["failed"], ["question", "error"]))
+    
+    with st.expander("OpenAI Batch API (half price, results within 24h)"):
+        handle_batch_api_files(db)
+    
+    st.subheader("Job Queue")
+    job_counts = db.get_job_counts(st.session_state.current_dataset)
+    for column, (status, count) in zip(st.columns(len(job_counts)), job_counts.items()):
+        column.metric(status.capitalize(), count)
+    if job_counts["failed"] and st.button("Retry Failed Jobs"):
+        db.retry_failed_jobs(st.session_state.current_dataset)
+        st.experimental_rerun()
+
+def handle_batch_api_files(db):
+    dataset_name = st.session_state.current_dataset
+    batch_limit = st.number_input("Prompts per batch file", min_value=1, max_value=MAX_REQUESTS_PER_FILE // 2, value=1000)
+    if st.button("Prepare Batch Request File"):
+        requests_file = io.StringIO()
+        written = write_batch_requests(db, dataset_name, requests_file, int(batch_limit))
+        st.session_state.batch_requests = requests_file.getvalue().encode("utf-8")
+        st.success(f"{written} pending prompts written; they are excluded from pending prompts until ingested")
+    if st.session_state.get("batch_requests"):
+        st.download_button(
+            label="Download Batch Request File",
+            data=st.session_state.batch_requests,
+            file_name=f"{dataset_name}_batch_requests.jsonl",
+            mime="application/jsonl"
+        )
+    
+    output_file = st.file_uploader("Batch output file", type=["jsonl"], key="batch_output")
+    if output_file is not None and st.button("Ingest Batch Output"):
+        counts = ingest_batch_output(db, output_file)
+        st.success(
+            f"Saved {counts['saved']} pairs ({counts['failed']} failed requests, "
+            f"{counts['incomplete']} incomplete pairs)"
+        )
+    if st.button("Return Batched Prompts to Pending"):
+        st.info(f"{db.reset_batched_prompts(dataset_name)} prompts returned to pending")
+
 def handle_quick_responses(db):
     st.header("Quick Responses Management")
     
@@ -228,29 +519,212 @@ def handle_quick_responses(db):
         else:
             st.error("Please enter response text!")
     
-    # View and manage existing quick responses
+    # View and manage existing quick responses, one page of matches at a time
     st.subheader("Existing Quick Responses")
-    quick_responses = db.get_quick_responses()
-    if not quick_responses.empty:
-        # Display with delete buttons
-        for _, response in quick_responses.iterrows():
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.text_area("", response['text'], height=100, key=f"qr_{response['id']}")
-            with col2:
-                if st.button("Delete", key=f"del_{response['id']}"):
-                    if db.delete_quick_response(response['id']):
-                        st.success("Quick response deleted!")
-                        st.experimental_rerun()
-                    else:
-                        st.error("Error deleting quick response!")
+    qr_query = st.text_input("Filter quick responses", key="qr_filter")
+    if st.session_state.get("qr_last_filter") != qr_query:
+        st.session_state.qr_last_filter = qr_query
+        st.session_state.qr_page = 0
+    page = st.session_state.get("qr_page", 0)
+    
+    matches, total = db.search_quick_responses(
+        qr_query,
+        limit=QUICK_RESPONSE_PAGE_SIZE,
+        offset=page * QUICK_RESPONSE_PAGE_SIZE
+    )
+    if not total:
+        st.info("No quick responses found")
+        return
+    
+    page_count = (total + QUICK_RESPONSE_PAGE_SIZE - 1) // QUICK_RESPONSE_PAGE_SIZE
+    for response_id, text, _ in matches:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.text_area("", text, height=100, key=f"qr_{response_id}")
+        with col2:
+            if st.button("Delete", key=f"del_{response_id}"):
+                if db.delete_quick_response(response_id):
+                    st.success("Quick response deleted!")
+                    st.experimental_rerun()
+                else:
+                    st.error("Error deleting quick response!")
+    
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if st.button("Previous", key="qr_prev", disabled=page == 0):
+            st.session_state.qr_page = page - 1
+            st.experimental_rerun()
+    with nav_col2:
+        st.caption(f"Page {page + 1} of {page_count} ({total} responses)")
+    with nav_col3:
+        if st.button("Next", key="qr_next", disabled=page + 1 >= page_count):
+            st.session_state.qr_page = page + 1
+            st.experimental_rerun()
+
+def select_quick_response(db, key):
+    # Only the best matches for the filter are offered, so the selectbox
+    # stays small however many quick responses exist
+    query = st.text_input("Filter quick responses", key=f"{key}_filter")
+    matches, total = db.search_quick_responses(query, limit=QUICK_RESPONSE_PAGE_SIZE)
+    if not matches:
+        st.warning("No quick responses available" if not query else "No matching quick responses")
+        return ""
+    if total > len(matches):
+        st.caption(f"Showing {len(matches)} of {total} matches")
+    return st.selectbox(
+        "Select Quick Response",
+        [text for _, text, _ in matches],
+        key=key
+    )
+
+def handle_search(db):
+    st.header("Search Entries")
+    
+    query = st.text_input("Search questions and responses")
+    search_col1, search_col2, search_col3 = st.columns([2, 1, 1])
+    with search_col1:
+        all_datasets = st.checkbox("Search all datasets")
+    with search_col2:
+        advanced = st.checkbox("FTS5 syntax", help='Enables "phrases", OR, NOT and prefix* queries')
+    with search_col3:
+        page = st.number_input("Page", min_value=1, value=1)
+    
+    if not query:
+        return
+    
+    page_size = 20
+    try:
+        results = db.search_entries(
+            query,
+            dataset_name=None if all_datasets else st.session_state.current_dataset,
+            limit=page_size,
+            offset=(int(page) - 1) * page_size,
+            raw=advanced,
+            as_rows=True
+        )
+    except Exception as e:
+        st.error(f"Invalid search: {str(e)}")
+        return
+    
+    if not results:
+        st.info("No matching entries")
+        return
+    
+    for result in results:
+        with st.container(border=True):
+            st.caption(f"#{result.id} in {result.dataset}")
+            st.markdown(f"**Q:** {result.question}")
+            st.markdown(f"**A:** {result.response_a}")
+            st.markdown(f"**B:** {result.response_b}")
+
+def handle_statistics(db):
+    st.header("Dataset Statistics")
+    dataset_name = st.session_state.current_dataset
+    
+    total_entries, unique_questions, first_entry, last_entry = db.get_dataset_stats(dataset_name)
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+    metric_col1.metric("Entries", total_entries)
+    metric_col2.metric("Unique Questions", unique_questions)
+    metric_col3.metric("First Entry", str(first_entry or "-")[:16])
+    metric_col4.metric("Last Entry", str(last_entry or "-")[:16])
+    
+    if not total_entries:
+        return
+    
+    st.subheader("Length Distribution (characters)")
+    histograms = db.get_length_histograms(dataset_name)
+    for column, field in zip(st.columns(3), ("question", "chosen", "rejected")):
+        with column:
+            st.caption(field.capitalize())
+            buckets = histograms[field]
+            if buckets:
+                st.bar_chart(to_frame(buckets, ["length", "entries"]).set_index("length"))
+
+def handle_llm_usage(db):
+    st.header("LLM Usage")
+    days = st.selectbox("Period", [1, 7, 30, 365], index=1, format_func=lambda d: f"Last {d} days")
+    
+    st.subheader("Latency by Model (seconds)")
+    # Checked as rows first so a period without calls never loads pandas
+    latency = db.get_latency_percentiles(days, as_rows=True)
+    if not latency:
+        st.info("No LLM calls recorded in this period")
+        return
+    st.dataframe(to_frame(latency, LATENCY_COLUMNS).round(3), hide_index=True)
+    
+    by_day = db.get_llm_usage("day", days)
+    by_dataset = db.get_llm_usage("dataset", days)
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
+    metric_col1.metric("Calls", int(by_day["calls"].sum()))
+    metric_col2.metric("Tokens", int(by_day["prompt_tokens"].sum() + by_day["completion_tokens"].sum()))
+    metric_col3.metric("Estimated Cost", f"${by_day['cost'].sum():.2f}")
+    
+    st.subheader("Cost per Day (USD)")
+    st.bar_chart(by_day.pivot_table(index="day", columns="model", values="cost", aggfunc="sum"))
+    
+    st.subheader("Usage per Dataset")
+    st.dataframe(by_dataset.round({"cost": 4}), hide_index=True)
+    st.caption("Prometheus metrics: python -m services.metrics_exporter")
+
+def handle_import(db):
+    st.header("Import Data")
+    st.caption(
+        "JSONL, CSV or Parquet. Rows with question/prompt, chosen and rejected are saved as entries; "
+        "rows with only a question/prompt are queued as pending prompts."
+    )
+    
+    # Files too large to upload through the browser can be read in place,
+    # but only from the directory the server was configured with
+    base_dir = import_dir()
+    source_type = st.radio("Source", ["Upload File", "Server Path"] if base_dir else ["Upload File"])
+    if base_dir is None:
+        st.caption(f"Set {IMPORT_DIR_ENV} on the server to import files from a directory there.")
+    if source_type == "Upload File":
+        source = st.file_uploader("Data File", type=["jsonl", "ndjson", "json", "csv", "parquet"])
+    else:
+        source = st.text_input(f"File path under {base_dir}")
+    chunk_size = st.number_input("Rows per transaction", min_value=100, value=DEFAULT_CHUNK_SIZE, step=1000)
+    
+    if st.button("Import"):
+        if not source:
+            st.error("Please choose a file to import!")
+            return
+        status = st.empty()
+        
+        def on_progress(counts):
+            status.info(f"Imported {counts['entries']} entries and {counts['prompts']} prompts...")
+        
+        try:
+            if source_type == "Server Path":
+                source = resolve_import_path(source, base_dir)
+            counts = db.import_file(
+                st.session_state.current_dataset,
+                source,
+                chunk_size=int(chunk_size),
+                progress_callback=on_progress
+            )
+            status.success(
+                f"Imported {counts['entries']} entries and {counts['prompts']} prompts "
+                f"({counts['skipped']} rows skipped)"
+            )
+        except Exception as e:
+            st.error(f"Error importing file: {str(e)}")
+
+def columns_for(export_options):
+    if "Format for training" in export_options:
+        columns = list(TRAINING_EXPORT_COLUMNS)
+    else:
+        columns = list(ENTRY_EXPORT_COLUMNS)
+    if "Include timestamps" in export_options:
+        columns.append("created_at")
+    return columns
 
 def handle_export(db):
     st.header("Export Dataset")
     
     export_format = st.selectbox(
         "Export Format",
-        ["JSON", "CSV"]
+        list(EXPORT_FORMATS)
     )
     
     # Add export options
@@ -259,34 +733,92 @@ def handle_export(db):
         ["Include timestamps", "Include metadata", "Format for training"]
     )
     
+    # A named target keeps a watermark, so later exports to it can be deltas
+    target = st.text_input("Export target (optional)", help="e.g. the training pipeline this export feeds").strip()
+    delta = st.checkbox(
+        "Only entries added or changed since the last export to this target",
+        disabled=not target
+    )
+
     if st.button("Export"):
-        entries = db.get_entries(st.session_state.current_dataset)
-        
-        if not entries.empty:
-            # Process based on options
-            if "Format for training" in export_options:
-                entries = entries[['question', 'response_a', 'response_b']]
-                entries.columns = ['question', 'chosen', 'rejected']
-            
-            if "Include timestamps" not in export_options:
-                entries = entries.drop(columns=['created_at'], errors='ignore')
-                
-            if export_format == "JSON":
-                st.download_button(
-                    "Download JSON",
-                    entries.to_json(orient='records'),
-                    f"{st.session_state.current_dataset}.json",
-                    "application/json"
-                )
-            else:  # CSV
-                st.download_button(
-                    "Download CSV",
-                    entries.to_csv(index=False),
-                    f"{st.session_state.current_dataset}.csv",
-                    "text/csv"
-                )
+        columns = columns_for(export_options)
+        # Rows are streamed to a temp file rather than built up in a DataFrame
+        if target:
+            path, count, export_id = db.export_to_target(
+                st.session_state.current_dataset,
+                target,
+                export_format,
+                columns,
+                delta=delta
+            )
+            # The target's watermark moves only once the download is confirmed
+            st.session_state.pending_export = (st.session_state.current_dataset, export_id, target, count) if count else None
         else:
-            st.warning("No entries to export!")
+            path, count = db.export_entries(st.session_state.current_dataset, export_format, columns)
+        try:
+            if count:
+                if export_format == "Parquet":
+                    summary = validate_parquet_export(path, columns)
+                    st.caption(
+                        f"{summary['rows']} rows in {summary['row_groups']} row groups, "
+                        f"{summary['bytes'] / 1e6:.1f} MB (columns: {', '.join(summary['columns'])})"
+                    )
+                extension, mime = EXPORT_FORMATS[export_format]
+                with open(path, "rb") as f:
+                    st.download_button(
+                        f"Download {export_format}",
+                        f,
+                        f"{st.session_state.current_dataset}.{extension}",
+                        mime
+                    )
+            else:
+                st.warning("No new entries since the last export!" if delta and target else "No entries to export!")
+        finally:
+            os.remove(path)
+
+    pending = st.session_state.get("pending_export")
+    if pending and pending[0] == st.session_state.current_dataset:
+        _, export_id, pending_target, rows = pending
+        if st.button(
+            f"Mark {rows} rows as exported to {pending_target}",
+            help="Confirm once the file is downloaded: the next delta export to this target starts after it"
+        ):
+            db.confirm_export(st.session_state.current_dataset, export_id)
+            st.session_state.pending_export = None
+            st.success(f"Recorded the export to {pending_target}")
+
+    history = db.get_export_history(st.session_state.current_dataset)
+    if history:
+        with st.expander("Export History"):
+            st.dataframe(
+                to_frame(history, ["Target", "Format", "Mode", "Rows", "Last entry id", "Newest entry", "Exported at"]),
+                hide_index=True
+            )
+
+    handle_sharded_export(db, export_format, columns_for(export_options))
+
+def handle_sharded_export(db, export_format, columns):
+    # Large datasets are written server-side as compressed shards plus a
+    # manifest, for training jobs that read the directory directly
+    with st.expander("Sharded Export"):
+        output_dir = st.text_input("Output directory", f"exports/{st.session_state.current_dataset}")
+        rows_per_shard = st.number_input("Rows per shard", min_value=1, value=DEFAULT_ROWS_PER_SHARD, step=10000)
+        compression = st.selectbox("Compression", list(COMPRESSIONS), disabled=export_format == "Parquet")
+        if st.button("Write Shards"):
+            with st.spinner("Writing shards..."):
+                manifest = db.export_shards(
+                    st.session_state.current_dataset,
+                    output_dir,
+                    export_format,
+                    columns,
+                    rows_per_shard=int(rows_per_shard),
+                    compression=compression
+                )
+            st.success(
+                f"Wrote {manifest['rows']} rows in {len(manifest['shards'])} shards "
+                f"({manifest['bytes'] / 1e6:.1f} MB) to {output_dir}"
+            )
+            st.dataframe(manifest["shards"], hide_index=True)
 
 if __name__ == "__main__":
     main()